@@ -0,0 +1,218 @@
+"""
+接口准入控制（过载保护）
+
+行程生成、修改和流式聊天等接口每个请求都要占用一次大模型调用和大量高德地图API请求。
+流量突增时如果全部接收，所有请求的延迟会一起变得不可接受。这里按接口分组限制同时处理的请求数，
+超出时请求进入有上限的等待队列，队列已满、预计等待时间超过排队时限或等待超时时直接返回503，
+并通过 Retry-After 告诉客户端多久后重试。
+配置了截止时间的接口从请求到达时开始计时，排队时间同样计入，处理流程通过 resilience.deadline_budget 感知剩余时间。
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from resilience import deadline_budget
+
+
+class OverloadedError(Exception):
+    """接口已满载，请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_limit_spec(spec: str) -> tuple:
+    """
+    解析 "并发数:排队数:排队秒数:截止秒数" 格式的配置，例如 "8:16:10:90"
+    省略的部分使用默认值：排队数与并发数相同，排队时限10秒，不设截止时间
+    """
+    parts = [part.strip() for part in (spec or "").split(":")]
+    max_concurrent = int(parts[0]) if parts and parts[0] else 0
+    max_queue = int(parts[1]) if len(parts) > 1 and parts[1] else max_concurrent
+    queue_timeout = float(parts[2]) if len(parts) > 2 and parts[2] else 10.0
+    deadline = float(parts[3]) if len(parts) > 3 and parts[3] else None
+    return max_concurrent, max_queue, queue_timeout, deadline
+
+
+class AdmissionLimiter:
+    """一组接口的并发上限和有界等待队列（在事件循环中使用）"""
+
+    # 平均处理时间的平滑系数
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 0, queue_timeout: float = 10.0,
+                 deadline: Optional[float] = None):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.avg_service_seconds = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.dequeued = 0
+        self.total_wait_seconds = 0.0
+
+    def estimated_wait(self, position: int) -> float:
+        """按平均处理时间估算排在第 position 位（从1开始）的请求需要等待的秒数"""
+        if self.avg_service_seconds is None:
+            return 0.0
+        return self.avg_service_seconds * math.ceil(position / self.max_concurrent)
+
+    def retry_after(self) -> int:
+        """建议客户端重试的等待秒数"""
+        wait = self.estimated_wait(len(self._waiters) + 1) or self.queue_timeout
+        return int(min(max(math.ceil(wait), 1), 120))
+
+    def _reject(self, message: str) -> OverloadedError:
+        return OverloadedError(message, self.retry_after())
+
+    async def acquire(self) -> float:
+        """获取处理名额，返回排队等待的秒数；满载时抛出 OverloadedError"""
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return 0.0
+            position = len(self._waiters) + 1
+            if position > self.max_queue:
+                self.rejected_full += 1
+                raise self._reject("服务繁忙，请稍后再试")
+            if self.estimated_wait(position) > self.queue_timeout:
+                # 预计等待时间已超过排队时限，直接拒绝而不是让请求白白等到超时
+                self.rejected_full += 1
+                raise self._reject("服务繁忙，预计等待时间过长，请稍后再试")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                # 超时的同时刚好被唤醒时名额已经转交给当前请求，继续处理
+                if not waiter.done() or waiter.cancelled():
+                    waiter.cancel()
+                    self._remove_waiter(waiter)
+                    self.rejected_timeout += 1
+                    raise self._reject("服务繁忙，排队等待超时，请稍后再试")
+        except asyncio.CancelledError:
+            # 客户端断开连接：已获得的名额交给下一个请求，否则从队列中移除
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    self._release_locked()
+                else:
+                    waiter.cancel()
+                    self._remove_waiter(waiter)
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self.admitted += 1
+            self.dequeued += 1
+            self.total_wait_seconds += waited
+        return waited
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release_locked(self):
+        """把名额转交给队首仍在等待的请求，没有等待的请求时释放名额（调用方需持有锁）"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def release(self, service_seconds: Optional[float] = None):
+        """请求处理完成后释放名额，并更新平均处理时间"""
+        with self._lock:
+            if service_seconds is not None:
+                if self.avg_service_seconds is None:
+                    self.avg_service_seconds = service_seconds
+                else:
+                    self.avg_service_seconds += self.EWMA_ALPHA * (service_seconds - self.avg_service_seconds)
+            self._release_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "deadline": self.deadline,
+                "active": self.active,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_ms": round(self.total_wait_seconds / self.dequeued * 1000, 1) if self.dequeued else 0.0,
+                "avg_service_ms": round(self.avg_service_seconds * 1000, 1) if self.avg_service_seconds else None
+            }
+
+
+class AdmissionMiddleware:
+    """
+    按请求路径选择准入限制的ASGI中间件
+    名额在整个请求（包括流式响应）结束后才释放，满载时返回503和 Retry-After 响应头
+    """
+
+    def __init__(self, app, limiters: Dict[str, AdmissionLimiter]):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http" and scope.get("method") != "OPTIONS":
+            limiter = self.limiters.get(scope.get("path"))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        with deadline_budget(limiter.deadline):
+            try:
+                await limiter.acquire()
+            except OverloadedError as e:
+                print(f"[过载保护] {limiter.name} 拒绝请求 {scope.get('path')}: {e}")
+                await self.send_overloaded(send, str(e), e.retry_after)
+                return
+
+            start = time.monotonic()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                limiter.release(time.monotonic() - start)
+
+    @staticmethod
+    async def send_overloaded(send, message: str, retry_after: int):
+        body = json.dumps({"success": False, "error_message": message}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,224 @@
+"""
+进程内缓存工具
+
+提供带过期时间和容量上限的线程安全缓存，用于保存高德地图API等上游服务的查询结果。
+多个 uvicorn worker 部署在同一台机器上时，可以使用 SqliteTTLCache 让所有 worker 共享同一份缓存，
+命中率随全部流量而不是单个 worker 的流量增长。
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class TTLCache:
+    """带过期时间（秒）和最大条目数的LRU缓存"""
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = 3600, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，ttl 为空时使用默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def contains(self, key: str) -> bool:
+        """判断缓存中是否存在未过期的键（不计入命中统计）"""
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and (item[0] is None or item[0] >= time.time())
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """返回缓存的命中统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+_MISSING = object()
+
+
+class SqliteTTLCache:
+    """
+    基于SQLite（WAL模式）的共享缓存，接口与 TTLCache 相同
+    同一台机器上的多个进程打开同一个数据库文件即可共享缓存；值以JSON保存，元组读取后为列表。
+    每个进程前面有一个较小的内存缓存，减少对热点数据的重复读取和反序列化。
+    """
+
+    # 每写入多少次清理一次过期和超出容量的条目
+    PRUNE_INTERVAL = 200
+
+    def __init__(self, path: str, maxsize: int = 1000, ttl: Optional[float] = 3600, name: str = "cache",
+                 local_maxsize: int = 500, local_ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.table = "cache_" + "".join(c if c.isalnum() else "_" for c in name)
+        # 内存缓存的过期时间较短，避免其他进程删除或更新的条目长时间不一致
+        self._local = TTLCache(maxsize=local_maxsize, ttl=local_ttl, name=name) if local_maxsize > 0 else None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _local_ttl(self, expires_at: Optional[float]) -> Optional[float]:
+        if expires_at is None:
+            return None
+        return max(min(self._local.ttl, expires_at - time.time()), 0.001)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回 default"""
+        if self._local is not None:
+            value = self._local.get(key, _MISSING)
+            if value is not _MISSING:
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                self.misses += 1
+                return default
+            self.hits += 1
+        value = json.loads(row[0])
+        if self._local is not None:
+            self._local.set(key, value, ttl=self._local_ttl(row[1]))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，ttl 为空时使用默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                (key, data, expires_at, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._prune(now)
+        if self._local is not None:
+            # 内存中保存与其他进程读取结果一致的JSON反序列化值
+            self._local.set(key, json.loads(data), ttl=self._local_ttl(expires_at))
+
+    def _prune(self, now: float):
+        """删除过期条目，超出容量时删除最早写入的条目（调用方需持有锁）"""
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        )
+        self._conn.commit()
+
+    def contains(self, key: str) -> bool:
+        """判断缓存中是否存在未过期的键（不计入命中统计）"""
+        if self._local is not None and self._local.contains(key):
+            return True
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    def delete(self, key: str):
+        if self._local is not None:
+            self._local.delete(key)
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        if self._local is not None:
+            self._local.clear()
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """返回本进程的命中统计和共享缓存的条目数"""
+        with self._lock:
+            size = self._conn.execute(
+                f"SELECT COUNT(*) FROM {self.table} WHERE expires_at IS NULL OR expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "backend": "sqlite",
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+def create_cache(name: str, maxsize: int, ttl: Optional[float], backend: str = "memory",
+                 path: Optional[str] = None):
+    """根据配置创建缓存，backend 为 memory（进程内）或 sqlite（同一台机器上的进程共享）"""
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("使用 sqlite 缓存时需要指定数据库路径")
+        return SqliteTTLCache(path, maxsize=maxsize, ttl=ttl, name=name)
+    if backend != "memory":
+        raise ValueError(f"不支持的缓存类型: {backend}")
+    return TTLCache(maxsize=maxsize, ttl=ttl, name=name)
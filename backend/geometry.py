@@ -0,0 +1,203 @@
+"""
+路线几何数据处理
+
+高德地图返回的驾车、步行、公交路线由每一步的 polyline 字符串（"经度,纬度;经度,纬度;..."）组成，
+一条路线往往有数千个坐标点。这里在服务端一次性解析坐标点，按地图缩放级别对应的容差使用
+Douglas-Peucker 算法简化，再编码为 Google Encoded Polyline 格式，大幅减小响应体积和前端绘制的点数。
+"""
+import math
+from typing import List, Optional, Tuple
+
+Point = Tuple[float, float]  # (经度, 纬度)
+
+# Web墨卡托投影下缩放级别为0时赤道处每像素对应的米数
+METERS_PER_PIXEL_ZOOM0 = 156543.03392
+EARTH_RADIUS_M = 6371008.8
+
+MIN_ZOOM = 3
+MAX_ZOOM = 20
+
+
+def parse_polyline(text) -> List[Point]:
+    """解析高德地图的 polyline 字符串，忽略格式错误的坐标点"""
+    points = []
+    if not isinstance(text, str):
+        return points
+    for item in text.split(";"):
+        lng, _, lat = item.partition(",")
+        try:
+            point = (float(lng), float(lat))
+        except ValueError:
+            continue
+        if -180 <= point[0] <= 180 and -90 <= point[1] <= 90:
+            points.append(point)
+    return points
+
+
+def _extend_steps(points: List[Point], steps):
+    for step in steps or []:
+        if isinstance(step, dict):
+            points.extend(parse_polyline(step.get("polyline")))
+
+
+def extract_route_points(route_info: Optional[dict]) -> List[Point]:
+    """
+    按顺序提取路线中所有步骤的坐标点
+    支持驾车/步行/骑行的 paths[0].steps，以及公交方案 transits[0].segments 中的步行、公交和地铁路段
+    """
+    points = []
+    if not isinstance(route_info, dict):
+        return points
+    transits = route_info.get("transits")
+    if transits:
+        for segment in transits[0].get("segments") or []:
+            if not isinstance(segment, dict):
+                continue
+            _extend_steps(points, (segment.get("walking") or {}).get("steps"))
+            # buslines 中是可相互替代的线路，只取第一条
+            _extend_steps(points, ((segment.get("bus") or {}).get("buslines") or [])[:1])
+            _extend_steps(points, (segment.get("railway") or {}).get("steps"))
+    elif route_info.get("paths"):
+        _extend_steps(points, route_info["paths"][0].get("steps"))
+
+    # 去掉相邻的重复点
+    unique = []
+    for point in points:
+        if not unique or point != unique[-1]:
+            unique.append(point)
+    return unique
+
+
+def zoom_tolerance_meters(zoom: float, latitude: float, pixel_tolerance: float = 1.0) -> float:
+    """指定缩放级别下 pixel_tolerance 个像素对应的地面距离（米）"""
+    zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+    return pixel_tolerance * METERS_PER_PIXEL_ZOOM0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def simplify_points(points: List[Point], tolerance_m: float) -> List[Point]:
+    """
+    Douglas-Peucker 简化，保留与简化后折线偏差超过 tolerance_m 米的点
+    坐标先按平均纬度投影到局部平面（米），使用栈代替递归以支持很长的路线
+    """
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    mean_lat = math.radians(sum(p[1] for p in points) / len(points))
+    scale_x = math.radians(1) * EARTH_RADIUS_M * math.cos(mean_lat)
+    scale_y = math.radians(1) * EARTH_RADIUS_M
+    xs = [p[0] * scale_x for p in points]
+    ys = [p[1] * scale_y for p in points]
+    tolerance_sq = tolerance_m * tolerance_m
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        dx = xs[last] - xs[first]
+        dy = ys[last] - ys[first]
+        length_sq = dx * dx + dy * dy
+        max_dist_sq = -1.0
+        index = first
+        for i in range(first + 1, last):
+            px = xs[i] - xs[first]
+            py = ys[i] - ys[first]
+            if length_sq == 0:
+                dist_sq = px * px + py * py
+            else:
+                # 到线段（而不是直线）的距离，避免折返路线被错误删除
+                t = min(max((px * dx + py * dy) / length_sq, 0.0), 1.0)
+                ex = px - t * dx
+                ey = py - t * dy
+                dist_sq = ex * ex + ey * ey
+            if dist_sq > max_dist_sq:
+                max_dist_sq = dist_sq
+                index = i
+        if max_dist_sq > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _encode_value(value: int, chunks: list):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(points: List[Point], precision: int = 5) -> str:
+    """
+    编码为 Google Encoded Polyline 格式（每个点先纬度后经度，与前一个点的差值编码）
+    """
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for lng, lat in points:
+        lat_value = int(round(lat * factor))
+        lng_value = int(round(lng * factor))
+        _encode_value(lat_value - previous_lat, chunks)
+        _encode_value(lng_value - previous_lng, chunks)
+        previous_lat, previous_lng = lat_value, lng_value
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Point]:
+    """解码 Google Encoded Polyline，返回 [(经度, 纬度)]"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        values = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += values[0]
+        lng += values[1]
+        points.append((lng / factor, lat / factor))
+    return points
+
+
+def build_route_geometry(route_info: Optional[dict], start: Optional[Point] = None, end: Optional[Point] = None,
+                         zoom: float = 16, pixel_tolerance: float = 1.0, precision: int = 5) -> Optional[dict]:
+    """
+    提取、简化并编码路线几何数据，路线中没有坐标点时返回None
+    start、end 为路线起终点坐标，会连接到折线的两端
+    """
+    points = extract_route_points(route_info)
+    if not points:
+        return None
+    if start is not None and tuple(start) != points[0]:
+        points.insert(0, tuple(start))
+    if end is not None and tuple(end) != points[-1]:
+        points.append(tuple(end))
+
+    latitude = sum(p[1] for p in points) / len(points)
+    simplified = simplify_points(points, zoom_tolerance_meters(zoom, latitude, pixel_tolerance))
+    return {
+        "encoding": "polyline",
+        "precision": precision,
+        "zoom": zoom,
+        "points": encode_polyline(simplified, precision),
+        "point_count": len(simplified),
+        "original_point_count": len(points)
+    }
+
+
+def strip_polylines(value):
+    """返回去掉所有 polyline 字段的路线数据副本，保留距离、时间、导航说明等信息"""
+    if isinstance(value, dict):
+        return {key: strip_polylines(item) for key, item in value.items() if key != "polyline"}
+    if isinstance(value, list):
+        return [strip_polylines(item) for item in value]
+    return value
@@ -0,0 +1,194 @@
+"""
+意图识别回放基准测试
+
+使用 intent_corpus.json 中带期望意图的查询回放 /api/trip/parse-query 的意图识别流程，报告规则引擎命中率、
+本地意图分类器命中率、回退到大模型的比例、各环节的准确率和单条查询延迟。有两种模式：
+
+    python intent_benchmark.py                                   # 进程内只运行规则引擎和本地分类器，不调用大模型
+    python intent_benchmark.py --server http://localhost:8000    # 向运行中的服务回放，包含缓存和大模型
+
+进程内模式中规则引擎和分类器都没有把握的查询计为回退到大模型，不计入准确率。
+指定 --output 时每次结果追加为一行JSON，便于比较意图识别逻辑修改前后的吞吐和正确率。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, "intent_corpus.json")
+
+SOURCE_RULE = "rule"
+SOURCE_CLASSIFIER = "classifier"
+SOURCE_LLM = "llm"
+SOURCE_FALLBACK = "fallback"  # 调用了大模型但失败，返回保守的默认意图
+
+
+def load_corpus(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    if not corpus.get("queries"):
+        raise ValueError(f"语料 {path} 中没有查询")
+    return corpus
+
+
+def timed(func, repeat: int):
+    """执行 repeat 次，返回最后一次的结果和耗时中位数（毫秒）"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(durations)
+
+
+def replay_local(corpus: dict, repeat: int) -> list:
+    """在当前进程中依次运行规则引擎和本地意图分类器"""
+    os.environ.setdefault("PRELOAD_HEAVY_IMPORTS", "false")
+    os.environ.setdefault("PREWARM_DESTINATIONS", "")
+    sys.path.insert(0, BACKEND_DIR)
+    from main import classify_intent_locally, quick_intent_detection
+
+    records = []
+    for item in corpus["queries"]:
+        plan = corpus.get("plan") if item.get("has_plan") else None
+        quick, latency_ms = timed(lambda: quick_intent_detection(item["query"], plan), repeat)
+        if quick["confident"]:
+            records.append({"item": item, "source": SOURCE_RULE, "data": quick["result"], "latency_ms": latency_ms})
+            continue
+        local, classifier_ms = timed(lambda: classify_intent_locally(item["query"], plan), repeat)
+        latency_ms += classifier_ms
+        if local is not None:
+            records.append({"item": item, "source": SOURCE_CLASSIFIER, "data": local, "latency_ms": latency_ms})
+        else:
+            records.append({"item": item, "source": SOURCE_LLM, "data": None, "latency_ms": latency_ms})
+    return records
+
+
+def replay_server(corpus: dict, server: str, timeout: float) -> list:
+    """向运行中的服务依次发送查询，根据响应中的 intent_source 区分给出结果的环节"""
+    import requests
+
+    records = []
+    for item in corpus["queries"]:
+        payload = {"query": item["query"], "current_plan": corpus.get("plan") if item.get("has_plan") else None}
+        start = time.perf_counter()
+        response = requests.post(f"{server}/api/trip/parse-query", json=payload, timeout=timeout)
+        latency_ms = (time.perf_counter() - start) * 1000
+        body = response.json() if response.status_code == 200 else {}
+        records.append({
+            "item": item,
+            "source": body.get("intent_source") or f"http_{response.status_code}",
+            "data": body.get("data"),
+            "latency_ms": latency_ms
+        })
+    return records
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values: list) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "max": round(max(values), 3),
+        "mean": round(statistics.mean(values), 3)
+    }
+
+
+def is_correct(record: dict) -> bool:
+    data = record["data"] or {}
+    return data.get("intent_type") == record["item"]["intent"]
+
+
+def summarize(records: list) -> dict:
+    total = len(records)
+    by_source = defaultdict(list)
+    for record in records:
+        by_source[record["source"]].append(record)
+
+    sources = {}
+    for source, items in sorted(by_source.items()):
+        answered = [r for r in items if r["data"] is not None]
+        sources[source] = {
+            "count": len(items),
+            "rate": round(len(items) / total, 3),
+            "accuracy": round(sum(is_correct(r) for r in answered) / len(answered), 3) if answered else None,
+            "latency_ms": latency_summary([r["latency_ms"] for r in items])
+        }
+
+    answered = [r for r in records if r["data"] is not None]
+    # 新行程规划的目的地和天数，只统计意图判断正确的查询
+    plans = [r for r in answered if r["item"]["intent"] == "new_plan" and is_correct(r)]
+    destination_hits = sum(
+        1 for r in plans
+        if r["item"].get("destination") and r["item"]["destination"] in (r["data"].get("destination") or "")
+    )
+    duration_hits = sum(1 for r in plans if r["data"].get("duration") == r["item"].get("duration"))
+    confusion = Counter(
+        f"{r['item']['intent']}->{(r['data'] or {}).get('intent_type')}" for r in answered if not is_correct(r)
+    )
+
+    return {
+        "queries": total,
+        "rule_hit_rate": sources.get(SOURCE_RULE, {}).get("rate", 0.0),
+        "classifier_hit_rate": sources.get(SOURCE_CLASSIFIER, {}).get("rate", 0.0),
+        "llm_fallback_rate": round((len(by_source[SOURCE_LLM]) + len(by_source[SOURCE_FALLBACK])) / total, 3),
+        "accuracy": round(sum(is_correct(r) for r in answered) / len(answered), 3) if answered else None,
+        "plan_destination_accuracy": round(destination_hits / len(plans), 3) if plans else None,
+        "plan_duration_accuracy": round(duration_hits / len(plans), 3) if plans else None,
+        "latency_ms": latency_summary([r["latency_ms"] for r in records]),
+        "sources": sources,
+        "errors": dict(confusion)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放意图识别语料，统计规则引擎命中率、准确率、延迟和大模型回退比例")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="查询语料文件")
+    parser.add_argument("--server", help="回放到运行中的后端服务，例如 http://localhost:8000；不指定时在进程内测试")
+    parser.add_argument("--repeat", type=int, default=5, help="进程内模式下每条查询重复执行的次数，延迟取中位数")
+    parser.add_argument("--timeout", type=float, default=60, help="服务模式下单个请求的超时时间（秒）")
+    parser.add_argument("--verbose", action="store_true", help="列出每条判断错误或回退到大模型的查询")
+    parser.add_argument("--output", help="将结果追加写入的JSON Lines文件")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.server:
+        records = replay_server(corpus, args.server.rstrip("/"), args.timeout)
+    else:
+        records = replay_local(corpus, max(1, args.repeat))
+
+    if args.verbose:
+        for record in records:
+            data = record["data"]
+            if data is None or not is_correct(record):
+                actual = data.get("intent_type") if data else "-"
+                print(f"[{record['source']}] 期望 {record['item']['intent']}，实际 {actual}: {record['item']['query']}")
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "corpus_version": corpus.get("version"),
+        "mode": "server" if args.server else "local",
+        **summarize(records)
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
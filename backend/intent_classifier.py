@@ -0,0 +1,298 @@
+"""
+本地轻量意图分类器
+
+规则引擎（quick_intent_detection）没有把握的查询原本全部交给大模型判断意图，简单的聊天消息也要多等几秒。
+这里用字符 n-gram 多项式朴素贝叶斯模型，从记录下来的查询和大模型给出的意图离线训练，
+在规则引擎和大模型之间先做一次本地判断，置信度达到阈值时直接返回结果，不再调用大模型。
+
+模型保存为JSON文件，训练命令见 train_intent_classifier.py。
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MODEL_VERSION = 1
+
+INTENT_NEW_PLAN = "new_plan"
+INTENT_MODIFY = "modify"
+INTENT_CHAT = "chat"
+INTENTS = (INTENT_NEW_PLAN, INTENT_MODIFY, INTENT_CHAT)
+
+# 上下文特征：用户当前是否已有行程（没有行程时不可能是修改意图）
+PLAN_TOKEN = "<plan>"
+NO_PLAN_TOKEN = "<no_plan>"
+
+_DIGITS = re.compile(r"[0-9０-９一二三四五六七八九十两]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """统一大小写和空白，数字（包括中文数字）统一为 "0"，使 "3天" 和 "五天" 得到相同的特征"""
+    text = _SPACES.sub(" ", (query or "").strip().lower())
+    return _DIGITS.sub("0", text)
+
+
+def extract_features(query: str, has_plan: bool = False, ngram_range: Tuple[int, int] = (1, 3)) -> List[str]:
+    """提取字符 n-gram 特征，首尾加边界符以区分 "你好" 出现在开头还是中间"""
+    text = f"^{normalize_query(query)}$"
+    low, high = ngram_range
+    features = [PLAN_TOKEN if has_plan else NO_PLAN_TOKEN]
+    for n in range(low, high + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram not in ("^", "$", " "):
+                features.append(gram)
+    return features
+
+
+class IntentClassifier:
+    """字符 n-gram 多项式朴素贝叶斯分类器"""
+
+    def __init__(self, priors: Dict[str, float], feature_log_probs: Dict[str, Dict[str, float]],
+                 unknown_log_probs: Dict[str, float], ngram_range: Tuple[int, int] = (1, 3),
+                 metadata: Optional[dict] = None):
+        self.priors = priors
+        self.feature_log_probs = feature_log_probs
+        self.unknown_log_probs = unknown_log_probs
+        self.ngram_range = tuple(ngram_range)
+        self.metadata = metadata or {}
+
+    @property
+    def intents(self) -> List[str]:
+        return list(self.priors)
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, bool, str]], ngram_range: Tuple[int, int] = (1, 3),
+              alpha: float = 0.5, min_count: int = 1) -> "IntentClassifier":
+        """
+        使用 [(查询, 是否已有行程, 意图)] 训练模型
+        alpha 为加法平滑系数，出现次数少于 min_count 的特征不进入词表
+        """
+        class_counts = Counter()
+        feature_counts = defaultdict(Counter)
+        totals = Counter()
+        for query, has_plan, intent in samples:
+            class_counts[intent] += 1
+            feature_counts[intent].update(extract_features(query, has_plan, ngram_range))
+        if len(class_counts) < 2:
+            raise ValueError("训练数据至少需要包含两种意图")
+
+        for counts in feature_counts.values():
+            totals.update(counts)
+        vocabulary = [feature for feature, count in totals.items() if count >= min_count]
+        vocab_size = len(vocabulary) + 1  # 为未登录特征保留一个位置
+
+        sample_count = sum(class_counts.values())
+        priors, feature_log_probs, unknown_log_probs = {}, {}, {}
+        for intent, count in sorted(class_counts.items()):
+            counts = feature_counts[intent]
+            denominator = math.log(sum(counts[f] for f in vocabulary) + alpha * vocab_size)
+            priors[intent] = math.log(count / sample_count)
+            unknown_log_probs[intent] = math.log(alpha) - denominator
+            feature_log_probs[intent] = {
+                feature: round(math.log(counts[feature] + alpha) - denominator, 6)
+                for feature in vocabulary if counts[feature]
+            }
+
+        metadata = {
+            "trained_at": datetime.now().isoformat(timespec="seconds"),
+            "samples": sample_count,
+            "class_counts": dict(class_counts),
+            "vocabulary_size": len(vocabulary),
+            "alpha": alpha
+        }
+        return cls(priors, feature_log_probs, unknown_log_probs, ngram_range, metadata)
+
+    def predict_proba(self, query: str, has_plan: bool = False) -> Dict[str, float]:
+        """返回各意图的后验概率"""
+        features = extract_features(query, has_plan, self.ngram_range)
+        scores = {}
+        for intent, prior in self.priors.items():
+            log_probs = self.feature_log_probs[intent]
+            unknown = self.unknown_log_probs[intent]
+            scores[intent] = prior + sum(log_probs.get(feature, unknown) for feature in features)
+        best = max(scores.values())
+        exp_scores = {intent: math.exp(score - best) for intent, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {intent: value / total for intent, value in exp_scores.items()}
+
+    def predict(self, query: str, has_plan: bool = False) -> Tuple[str, float]:
+        """返回 (意图, 置信度)"""
+        proba = self.predict_proba(query, has_plan)
+        intent = max(proba, key=proba.get)
+        return intent, proba[intent]
+
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "ngram_range": list(self.ngram_range),
+            "priors": self.priors,
+            "unknown_log_probs": self.unknown_log_probs,
+            "feature_log_probs": self.feature_log_probs,
+            "metadata": self.metadata
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IntentClassifier":
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError(f"不支持的意图模型版本: {data.get('version')}")
+        return cls(data["priors"], data["feature_log_probs"], data["unknown_log_probs"],
+                   tuple(data.get("ngram_range", (1, 3))), data.get("metadata"))
+
+    def save(self, path: str):
+        """先写入临时文件再替换，避免运行中的服务读到写了一半的模型"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class IntentModelRunner:
+    """
+    服务中使用的分类器包装：按文件修改时间自动重新加载模型，统计命中、回退和预测耗时
+    模型文件不存在或加载失败时 classify 返回None，调用方继续使用大模型
+    """
+
+    # 检查模型文件是否更新的最小间隔（秒）
+    RELOAD_CHECK_INTERVAL = 30
+
+    def __init__(self, path: str, threshold: float = 0.9, intents: Iterable[str] = (INTENT_CHAT, INTENT_MODIFY)):
+        self.path = path
+        self.threshold = threshold
+        self.intents = set(intents)
+        self.model = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.low_confidence = 0
+        self.unsupported_intent = 0
+        self.predictions = 0
+        self.total_predict_seconds = 0.0
+        self.load_error = None
+        self._check_reload(force=True)
+
+    def _check_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                self.model, self._mtime = None, None
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                self.model = IntentClassifier.load(self.path)
+                self.load_error = None
+                print(f"[意图分类器] 已加载模型 {self.path}，训练样本 {self.model.metadata.get('samples')} 条")
+            except Exception as e:
+                self.model = None
+                self.load_error = str(e)
+                print(f"[意图分类器] 加载模型失败: {e}")
+            self._mtime = mtime
+
+    def classify(self, query: str, has_plan: bool = False) -> Optional[Tuple[str, float]]:
+        """置信度达到阈值且属于允许直接返回的意图时返回 (意图, 置信度)，否则返回None"""
+        self._check_reload()
+        model = self.model
+        if model is None:
+            return None
+        start = time.perf_counter()
+        intent, confidence = model.predict(query, has_plan)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.predictions += 1
+            self.total_predict_seconds += elapsed
+            if confidence < self.threshold:
+                self.low_confidence += 1
+                return None
+            if intent not in self.intents or (intent == INTENT_MODIFY and not has_plan):
+                self.unsupported_intent += 1
+                return None
+            self.hits[intent] += 1
+        return intent, confidence
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.model is not None,
+                "path": self.path,
+                "threshold": self.threshold,
+                "intents": sorted(self.intents),
+                "samples": self.model.metadata.get("samples") if self.model else None,
+                "trained_at": self.model.metadata.get("trained_at") if self.model else None,
+                "load_error": self.load_error,
+                "predictions": self.predictions,
+                "hits": dict(self.hits),
+                "low_confidence": self.low_confidence,
+                "unsupported_intent": self.unsupported_intent,
+                "avg_predict_ms": round(self.total_predict_seconds / self.predictions * 1000, 3)
+                if self.predictions else 0.0
+            }
+
+
+class IntentSampleLog:
+    """以JSON Lines格式追加记录大模型给出的意图，作为分类器的训练数据"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, query: str, has_plan: bool, intent: str, confidence: Optional[float] = None):
+        if not self.path:
+            return
+        line = json.dumps({
+            "query": query,
+            "has_plan": has_plan,
+            "intent": intent,
+            "confidence": confidence,
+            "timestamp": datetime.now().isoformat(timespec="seconds")
+        }, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[意图分类器] 记录训练样本失败: {e}")
+
+
+def load_samples(paths: Iterable[str], min_confidence: float = 0.0) -> List[Tuple[str, bool, str]]:
+    """
+    读取训练样本，同一查询（及是否有行程）出现多次时以最后一次的意图为准
+    置信度低于 min_confidence 的样本和无法识别的意图会被忽略
+    """
+    samples = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                query = (item.get("query") or "").strip()
+                intent = item.get("intent")
+                confidence = item.get("confidence")
+                if not query or intent not in INTENTS:
+                    continue
+                if isinstance(confidence, (int, float)) and confidence < min_confidence:
+                    continue
+                has_plan = bool(item.get("has_plan"))
+                samples[(query, has_plan)] = intent
+    return [(query, has_plan, intent) for (query, has_plan), intent in samples.items()]
@@ -0,0 +1,263 @@
+"""
+异步任务队列
+
+将耗时的行程生成/更新任务放到有界的线程池中执行，任务状态、进度和结果保存在本地SQLite数据库中，
+无需依赖外部服务。客户端提交任务后获得任务ID，再通过轮询或订阅获取进度和结果。
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+def default_owner() -> str:
+    """当前进程的任务所有者标识，格式为 "主机名:进程ID:随机后缀"，随机后缀避免进程ID复用时误认为同一进程"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def is_owner_dead(owner: str) -> bool:
+    """任务所有者是本机上已经退出的进程时返回True，其他主机或无法判断时返回False，由心跳超时判断"""
+    host, _, rest = owner.partition(":")
+    pid = rest.partition(":")[0]
+    if host != socket.gethostname() or not pid.isdigit() or os.name != "posix":
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+class QueueFullError(Exception):
+    """等待中的任务数量已达上限"""
+
+
+class JobStore:
+    """
+    基于SQLite的任务存储，支持多线程访问
+    多个worker进程可以共用同一个数据库：每个任务记录创建它的进程（owner），进程在后台线程中定期刷新
+    自己未完成任务的心跳时间（heartbeat_at），重启时只把所有者已退出或心跳超时的任务标记为失败
+    """
+
+    def __init__(self, path: str, owner: Optional[str] = None, heartbeat_interval: float = 10):
+        self.path = path
+        self.owner = owner or default_owner()
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_thread = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            # 旧版本创建的数据库没有所有者和心跳字段
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            self._conn.commit()
+
+    def create(self, kind: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, progress, message, created_at, updated_at, owner, heartbeat_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, "排队中", now, now, self.owner, now)
+            )
+            self._conn.commit()
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+        return job_id
+
+    def heartbeat(self) -> int:
+        """刷新当前进程所有未完成任务的心跳时间"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time(), self.owner, JOB_QUEUED, JOB_RUNNING)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                print(f"任务队列：刷新任务心跳失败: {e}")
+
+    def update(self, job_id: str, **fields):
+        """更新任务字段，result 会被序列化为JSON"""
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job["expires_at"] is not None and job["expires_at"] < time.time():
+            return None
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def count(self, statuses: tuple, kinds: Optional[tuple] = None) -> int:
+        """统计指定状态的任务数量，kinds 不为空时只统计这些类型的任务"""
+        sql = f"SELECT COUNT(*) FROM jobs WHERE status IN ({', '.join('?' for _ in statuses)})"
+        params = tuple(statuses)
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params += tuple(kinds)
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return row[0]
+
+    def purge_expired(self) -> int:
+        """删除已过期的任务结果"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def fail_orphaned(self, message: str, stale_after: float) -> int:
+        """
+        将其他进程遗留的未完成任务标记为失败：所有者是本机上已退出的进程，或心跳超过 stale_after 秒没有刷新
+        当前进程和其他仍在运行的worker的任务不受影响
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, owner, heartbeat_at, updated_at FROM jobs WHERE status IN (?, ?) "
+                "AND (owner IS NULL OR owner != ?)",
+                (JOB_QUEUED, JOB_RUNNING, self.owner)
+            ).fetchall()
+            orphaned = [
+                row["id"] for row in rows
+                if (row["owner"] and is_owner_dead(row["owner"]))
+                or (row["heartbeat_at"] or row["updated_at"]) < now - stale_after
+            ]
+            for job_id in orphaned:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                    (JOB_FAILED, message, now, job_id, JOB_QUEUED, JOB_RUNNING)
+                )
+            self._conn.commit()
+        return len(orphaned)
+
+
+class JobQueue:
+    """
+    有界线程池任务队列
+    多个队列可以共用同一个 JobStore，kinds 指定本队列处理的任务类型，排队数量按类型分别统计
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = 2, max_pending: int = 50, result_ttl: float = 3600,
+                 kinds: Optional[tuple] = None):
+        self.store = store
+        self.kinds = kinds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._submit_lock = threading.Lock()
+
+    def recover_orphaned(self, stale_after: float) -> int:
+        """服务启动时调用：把已退出或失去心跳的worker遗留的未完成任务标记为失败"""
+        interrupted = self.store.fail_orphaned("服务重启，任务已中断，请重新提交", stale_after)
+        if interrupted:
+            print(f"任务队列：{interrupted} 个已中断的任务已标记为失败")
+        return interrupted
+
+    def submit(self, kind: str, func: Callable, *args, on_success: Optional[Callable] = None) -> str:
+        """
+        提交任务，func 会以 func(*args, progress=回调) 的形式在工作线程中执行
+        on_success 在任务成功并保存结果后以 on_success(结果) 调用，可用于后续的后台处理
+        """
+        with self._submit_lock:
+            self.store.purge_expired()
+            if self.store.count((JOB_QUEUED, JOB_RUNNING), self.kinds) >= self.max_pending + self.max_workers:
+                raise QueueFullError("当前排队任务过多，请稍后再试")
+            job_id = self.store.create(kind)
+        self._executor.submit(self._run, job_id, func, args, on_success)
+        return job_id
+
+    def _run(self, job_id: str, func: Callable, args: tuple, on_success: Optional[Callable]):
+        self.store.update(job_id, status=JOB_RUNNING, progress=0, message="开始处理")
+
+        def progress(percent: int, message: str):
+            self.store.update(job_id, progress=int(percent), message=message)
+
+        start_time = time.perf_counter()
+        try:
+            result = func(*args, progress=progress)
+        except Exception as e:
+            self.store.update(
+                job_id, status=JOB_FAILED, error=str(e), message="处理失败",
+                expires_at=time.time() + self.result_ttl
+            )
+            print(f"任务 {job_id} 失败: {e}")
+            return
+
+        self.store.update(
+            job_id, status=JOB_SUCCEEDED, progress=100, message="处理完成", result=result,
+            expires_at=time.time() + self.result_ttl
+        )
+        print(f"任务 {job_id} 完成，耗时 {time.perf_counter() - start_time:.2f} 秒")
+        if on_success:
+            try:
+                on_success(result)
+            except Exception as e:
+                print(f"任务 {job_id} 后续处理失败: {e}")
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queued": self.store.count((JOB_QUEUED,), self.kinds),
+            "running": self.store.count((JOB_RUNNING,), self.kinds)
+        }
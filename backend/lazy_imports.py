@@ -0,0 +1,97 @@
+"""
+延迟导入较慢的依赖
+
+langchain、geopy、requests 等依赖导入耗时较长（合计超过1秒），如果在模块加载时导入，
+每个 uvicorn worker 启动或重载时都要等它们加载完才能响应 /health。
+这里的 LazyModule / LazyAttribute 在首次使用时才真正导入，调用方式与直接导入相同；
+服务启动后也可以通过 preload_all() 在后台线程中提前加载，避免第一个用户请求承担导入耗时。
+"""
+import importlib
+import threading
+import time
+from typing import Optional
+
+_registry = []
+_lock = threading.Lock()
+_timings = {}
+
+
+def _import(module_name: str):
+    """导入模块并记录首次导入耗时"""
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    with _lock:
+        _timings.setdefault(module_name, round((time.perf_counter() - start) * 1000, 1))
+    return module
+
+
+class LazyModule:
+    """首次访问属性时才导入的模块"""
+
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+        _registry.append(self)
+
+    def load(self):
+        if self._module is None:
+            self._module = _import(self._module_name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+
+class LazyAttribute:
+    """模块中的类或函数，首次调用或访问属性时才导入所在模块"""
+
+    def __init__(self, module_name: str, name: str):
+        self._module_name = module_name
+        self._name = name
+        self._target = None
+        _registry.append(self)
+
+    def load(self):
+        if self._target is None:
+            self._target = getattr(_import(self._module_name), self._name)
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+
+def preload_all():
+    """依次加载所有登记的延迟依赖，单个依赖导入失败时不影响其他依赖"""
+    for item in list(_registry):
+        try:
+            item.load()
+        except Exception as e:
+            print(f"预加载依赖 {item._module_name} 失败: {e}")
+
+
+def start_background_preload() -> Optional[threading.Thread]:
+    """在后台线程中预加载所有延迟依赖，所有依赖都已加载时返回None"""
+    if all(item.loaded for item in _registry):
+        return None
+    thread = threading.Thread(target=preload_all, name="lazy-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_stats() -> dict:
+    """各依赖的首次导入耗时（毫秒）以及尚未加载的依赖"""
+    with _lock:
+        timings = dict(_timings)
+    pending = sorted({item._module_name for item in _registry if not item.loaded})
+    return {"loaded_ms": timings, "pending": pending}
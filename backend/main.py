@@ -1,26 +1,90 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, SecretStr
-from geopy.distance import geodesic
 from typing import Optional, List
 from datetime import datetime
 import uvicorn
+import asyncio
 import os
+import threading
 import time
 import re
 import json
 import hashlib
-from functools import lru_cache
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-from langchain_community.chat_models.tongyi import ChatTongyi
-from langchain_core.messages import HumanMessage, SystemMessage
-import requests
+from admission import AdmissionLimiter, AdmissionMiddleware, parse_limit_spec
+from cache import create_cache
+from geometry import build_route_geometry, strip_polylines
+from intent_classifier import INTENT_MODIFY, IntentModelRunner, IntentSampleLog
+from job_queue import JobQueue, JobStore, QueueFullError, TERMINAL_STATES
+from lazy_imports import LazyAttribute, LazyModule, import_stats, start_background_preload
+from plan_cache import PlanCache
+from plan_store import PLAN_VERSION_FIELD, PlanNotFoundError, PlanVersionConflictError, create_plan_store
+from plan_patch import PlanPatchError, apply_plan_operations
+from place_extractor import StreamPlaceExtractor
+from place_index import PlaceAliasIndex
+from plan_model import DayPlan, Place, PlanModelError, Segment, parse_route_places
+from prompt_context import (PromptMetrics, build_chat_context, build_chat_context_with_plan, estimate_tokens,
+                            restore_place_descriptions, serialize_plan_for_prompt)
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, RateGovernor
+from responses import FastJSONResponse, accept_encoding_var, response_stats
+from resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, budget_exhausted, check_deadline, deadline_budget,
+    remaining_budget
+)
+from route_optimizer import (
+    build_distance_matrix, estimate_travel_seconds, format_duration_text,
+    capacity_constrained_kmeans, haversine_km, path_cost, solve_open_tsp
+)
+
+# 导入较慢的依赖在首次使用时才加载，服务启动后在后台预加载
+ChatTongyi = LazyAttribute("langchain_community.chat_models.tongyi", "ChatTongyi")
+HumanMessage = LazyAttribute("langchain_core.messages", "HumanMessage")
+SystemMessage = LazyAttribute("langchain_core.messages", "SystemMessage")
+geodesic = LazyAttribute("geopy.distance", "geodesic")
+requests = LazyModule("requests")
 
 # 加载环境变量
 load_dotenv()
 
-app = FastAPI(title="Trip Copilot API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务启动时执行 run_startup_tasks 中的初始化，替代已弃用的 @app.on_event("startup")"""
+    run_startup_tasks()
+    yield
+
+app = FastAPI(title="Trip Copilot API", version="1.0.0", lifespan=lifespan)
+
+# 过载保护：各组接口同时处理的请求数、排队上限、最长排队秒数和从请求到达起的截止秒数，
+# 格式为 "并发数:排队数:排队秒数:截止秒数"，并发数为0时该组不做限制；
+# 满载时直接返回503和 Retry-After，避免所有请求的延迟一起变得不可接受
+ADMISSION_GROUPS = {
+    "plan": (os.getenv("ADMISSION_PLAN", "8:16:15:90"), ("/api/trip/plan", "/api/trip/streamplan")),
+    "update": (os.getenv("ADMISSION_UPDATE", "8:16:15:90"), ("/api/trip/update",)),
+    "chat": (os.getenv("ADMISSION_CHAT", "16:32:10"), ("/api/chat/stream",)),
+    "parse": (os.getenv("ADMISSION_PARSE", "32:64:5"), ("/api/trip/parse-query",)),
+    "routes": (
+        os.getenv("ADMISSION_ROUTES", "16:64:10:30"),
+        ("/api/trip/itinerary-routes", "/api/trip/path", "/api/trip/travel-times", "/api/trip/transportation")
+    )
+}
+admission_limiters = {}
+admission_paths = {}
+for group_name, (limit_spec, group_paths) in ADMISSION_GROUPS.items():
+    max_concurrent, max_queue, queue_timeout, deadline = parse_limit_spec(limit_spec)
+    if max_concurrent <= 0:
+        continue
+    admission_limiters[group_name] = AdmissionLimiter(group_name, max_concurrent, max_queue, queue_timeout, deadline)
+    for group_path in group_paths:
+        admission_paths[group_path] = admission_limiters[group_name]
+
+# 先于CORS中间件添加，使503响应同样带有跨域响应头
+app.add_middleware(AdmissionMiddleware, limiters=admission_paths)
 
 # 配置CORS
 app.add_middleware(
@@ -39,6 +103,52 @@ def get_tongyi_client():
     
     return ChatTongyi(api_key=SecretStr(api_key), model="qwen-plus")
 
+# 熔断配置（大模型和高德地图各服务共用）：连续失败多少次后熔断，熔断后多少秒再试探
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+
+# 大模型服务熔断器：连续失败后短时间内直接返回错误，避免每个请求都等待超时
+llm_breaker = CircuitBreaker("llm", BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+
+def invoke_llm(llm, messages):
+    """调用大模型（非流式），并记录熔断器状态"""
+    if not llm_breaker.allow():
+        raise CircuitOpenError("大模型服务暂时不可用，请稍后再试")
+    try:
+        response = llm.invoke(messages)
+    except Exception:
+        llm_breaker.record_failure()
+        raise
+    except BaseException:
+        llm_breaker.release()
+        raise
+    llm_breaker.record_success()
+    return response
+
+def stream_llm(llm, messages):
+    """流式调用大模型，以是否返回第一段内容判断上游是否可用并记录熔断器状态，之后的内容原样输出"""
+    if not llm_breaker.allow():
+        raise CircuitOpenError("大模型服务暂时不可用，请稍后再试")
+    try:
+        stream = iter(llm.stream(messages))
+        first_chunk = next(stream, None)
+    except Exception:
+        llm_breaker.record_failure()
+        raise
+    except BaseException:
+        llm_breaker.release()
+        raise
+    llm_breaker.record_success()
+    if first_chunk is not None:
+        yield first_chunk
+    yield from stream
+
+# 提示词上下文的token预算：行程更新时传给大模型的行程、聊天时的背景信息
+UPDATE_PLAN_TOKEN_BUDGET = int(os.getenv("UPDATE_PLAN_TOKEN_BUDGET", "4000"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "800"))
+
+prompt_metrics = PromptMetrics()
+
 # 数据模型
 # 注释：删除了未使用的 TripRequest 和 TripResponse 模型（用于 /api/trip/suggest）
 
@@ -46,42 +156,72 @@ def get_tongyi_client():
 class ItineraryPlanRequest(BaseModel):
     destination: str
     duration: int  # 天数，必填
+    use_cache: bool = True  # 为 False 时跳过热门行程缓存，重新生成
 
 class FinePlanRequest(BaseModel):
     plan: str
     destination: str
     duration: int
+    use_cache: bool = True
 
 class ItineraryPlanResponse(BaseModel):
     success: bool
     plan_data: Optional[dict] = None
     error_message: Optional[str] = None
+    error_code: Optional[str] = None  # 引用的行程不存在或版本已变化时为 plan_not_found 或 plan_version_conflict
 
 # 新增行程更新数据模型
 class ItineraryUpdateRequest(BaseModel):
-    current_plan: dict  # 前端传递的当前完整行程规划JSON
+    current_plan: Optional[dict] = None  # 前端传递的当前完整行程规划JSON，提供 plan_id 时可省略
+    plan_id: Optional[str] = None  # 服务端保存的行程ID
+    plan_version: Optional[int] = None  # 客户端持有的行程版本，与服务端不一致时拒绝修改
     modification_request: str  # 用户的修改指令，例如 "帮我把第一天的故宫去掉，换成颐和园"
     chat_context: Optional[str] = None  # 可选的聊天上下文
+    edit_mode: str = "patch"  # patch：大模型只返回编辑操作，无法增量修改时自动改为 full；full：大模型返回完整行程
 
 class ItineraryUpdateResponse(BaseModel):
     success: bool
     updated_plan: Optional[dict] = None
     error_message: Optional[str] = None
+    error_code: Optional[str] = None  # 引用的行程不存在或版本已变化时为 plan_not_found 或 plan_version_conflict
 
 # 智能解析用户旅行请求的数据模型
 class QueryParseRequest(BaseModel):
     query: str
     current_plan: Optional[dict] = None  # 当前行程计划，用于判断是否是修改行程的意图
+    plan_id: Optional[str] = None  # 服务端保存的行程ID，可代替 current_plan
+    plan_version: Optional[int] = None
 
 class QueryParseResponse(BaseModel):
     success: bool
     data: Optional[dict] = None
     error_message: Optional[str] = None
+    error_code: Optional[str] = None  # 引用的行程不存在或版本已变化时为 plan_not_found 或 plan_version_conflict
     estimated_cost: Optional[float] = None
+    intent_source: Optional[str] = None  # 给出结果的环节：rule、cache、classifier、llm，大模型失败时为 fallback
+
+# 异步任务的数据模型
+class JobSubmitResponse(BaseModel):
+    success: bool
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+    error_message: Optional[str] = None
+
+class JobStatusResponse(BaseModel):
+    success: bool
+    job: Optional[dict] = None  # 包含 status、progress、message、result、error 等字段
+    error_message: Optional[str] = None
+
+# 热门目的地预热的数据模型
+class PrewarmRequest(BaseModel):
+    destinations: List[str]  # 例如 ["北京", "成都"]
+    days: List[int] = [3]  # 预热行程缓存时使用的天数
+    include_plans: bool = False  # 是否调用大模型生成并缓存完整行程
 
 class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
+    plan_id: Optional[str] = None  # 服务端保存的行程ID，提供时 context 中无需包含 currentPlan
 
 # 注释：删除了未使用的 ChatResponse 模型（用于非流式聊天）
 
@@ -89,6 +229,8 @@ class PathRequest(BaseModel):
     start: str
     end: str
     mode: Optional[str] = "driving"  # driving, walking, transit
+    geometry: Optional[str] = "raw"  # raw：原样返回高德地图的 polyline；encoded：返回简化并编码后的折线
+    zoom: Optional[float] = None  # 简化折线时使用的地图缩放级别，为空时使用 ROUTE_GEOMETRY_ZOOM
 
 class PathResponse(BaseModel):
     success: bool
@@ -99,13 +241,81 @@ class PathResponse(BaseModel):
 
 # 新增：为行程中的地点生成路径规划的请求模型
 class ItineraryRouteRequest(BaseModel):
-    places: List[dict]  # 地点列表，每个地点包含name, longitude, latitude
+    # 地点数据在接口内转换为 plan_model 中的类型，这里不逐项校验以免复制整份数据
+    places: Optional[list] = None  # 地点列表，每个地点包含name, longitude, latitude
+    days: Optional[list] = None  # 多天模式：每项包含day和places，一次请求生成所有天的路径规划
     mode: Optional[str] = "driving"  # 出行方式
+    geometry: Optional[str] = "raw"  # raw：原样返回高德地图的 polyline；encoded：返回简化并编码后的折线
+    zoom: Optional[float] = None  # 简化折线时使用的地图缩放级别，为空时使用 ROUTE_GEOMETRY_ZOOM
 
 class ItineraryRouteResponse(BaseModel):
     success: bool
     routes_data: Optional[List[dict]] = None
+    days_data: Optional[List[dict]] = None  # 多天模式的结果，每项包含day和routes
+    error_message: Optional[str] = None
+
+# 新增：批量获取交通时间的数据模型
+class TravelTimeRequest(BaseModel):
+    places: list  # 地点列表，每个地点包含name, longitude, latitude
+    mode: Optional[str] = "driving"  # 出行方式：driving、walking 或 straight（直线距离）
+    full_matrix: Optional[bool] = False  # 是否返回所有地点两两之间的时间矩阵
+
+class TravelTimeResponse(BaseModel):
+    success: bool
+    segments: Optional[List[dict]] = None  # 相邻地点之间每段路程的距离和时间
+    matrix: Optional[List[List[Optional[int]]]] = None  # 两两之间的交通时间矩阵（秒）
+    error_message: Optional[str] = None
+
+# 新增：本地重新排序行程地点的数据模型
+class ItineraryReorderRequest(BaseModel):
+    current_plan: Optional[dict] = None  # 前端传递的当前完整行程规划JSON，提供 plan_id 时可省略
+    plan_id: Optional[str] = None
+    plan_version: Optional[int] = None
+    day: Optional[int] = None  # 需要排序的天数，为空时对每一天都进行排序
+    metric: Optional[str] = "distance"  # 排序依据：distance（距离）或 duration（交通时间）
+    keep_start: Optional[bool] = True  # 是否固定每天的第一个地点
+    use_amap_matrix: Optional[bool] = False  # 按交通时间排序时，是否通过高德距离测量API批量获取真实时间矩阵
+
+# 新增：按地理位置重新分配每天地点的数据模型
+class ItineraryRebalanceRequest(BaseModel):
+    current_plan: Optional[dict] = None  # 前端传递的当前完整行程规划JSON，提供 plan_id 时可省略
+    plan_id: Optional[str] = None
+    plan_version: Optional[int] = None
+    days: Optional[int] = None  # 重新分配后的天数，为空时保持原天数
+    max_hours_per_day: Optional[float] = None  # 每天建议停留总时长上限（小时），为空时自动均分
+
+class ItineraryReorderResponse(BaseModel):
+    success: bool
+    updated_plan: Optional[dict] = None
+    optimization: Optional[List[dict]] = None  # 每天排序前后的代价对比
     error_message: Optional[str] = None
+    error_code: Optional[str] = None  # 引用的行程不存在或版本已变化时为 plan_not_found 或 plan_version_conflict
+
+# 服务端行程存储：PLAN_STORE_BACKEND 为 memory（默认，进程内）或 sqlite（保存到 PLAN_STORE_PATH）
+PLAN_STORE_BACKEND = os.getenv("PLAN_STORE_BACKEND", "memory")
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "plans.db"))
+PLAN_STORE_TTL = int(os.getenv("PLAN_STORE_TTL", "604800"))
+
+plan_store = create_plan_store(PLAN_STORE_BACKEND, PLAN_STORE_PATH, PLAN_STORE_TTL)
+
+# 缓存存储：memory 为每个进程独立缓存，sqlite 为同一台机器上的所有 worker 共享缓存
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.db"))
+
+def create_shared_cache(name: str, maxsize: int, ttl: int):
+    """按 CACHE_BACKEND 创建高德地图查询结果等可在 worker 之间共享的缓存"""
+    return create_cache(name, maxsize, ttl, backend=CACHE_BACKEND, path=CACHE_PATH)
+
+def resolve_request_plan(current_plan: Optional[dict], plan_id: Optional[str], plan_version: Optional[int] = None) -> Optional[dict]:
+    """
+    获取请求引用的行程：请求中带有完整行程时直接使用，否则按行程ID从服务端读取
+    行程不存在或版本不一致时抛出 ValueError 的子类
+    """
+    if current_plan is not None:
+        return current_plan
+    if not plan_id:
+        return None
+    return plan_store.get(plan_id, plan_version)
 
 # 根路径
 @app.get("/")
@@ -117,6 +327,30 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+# 运行状态统计
+@app.get("/api/stats")
+async def get_stats():
+    """返回高德地图API限流、缓存、任务队列和提示词大小的运行统计"""
+    return {
+        "amap": amap_governor.stats(),
+        "caches": [
+            cache.stats()
+            for cache in (geocode_cache, route_cache, distance_cache, city_cache, transit_station_cache, weather_cache,
+                          transport_cache, intent_cache, place_alias_cache)
+        ] + [plan_cache.stats()],
+        "breakers": [llm_breaker.stats()] + [breaker.stats() for breaker in amap_breakers.values()],
+        "jobs": job_queue.stats(),
+        "maintenance_jobs": maintenance_queue.stats(),
+        "prompts": prompt_metrics.stats(),
+        "plan_store": plan_store.stats(),
+        "responses": response_stats.stats(),
+        "imports": import_stats(),
+        "admission": [limiter.stats() for limiter in admission_limiters.values()],
+        "speculative_geocode": speculative_stats.stats(),
+        "intent_classifier": intent_classifier.stats(),
+        "place_index": place_alias_index.stats()
+    }
+
 # 获取旅行建议
 # 注释：此API端点未被前端使用，已删除
 # @app.post("/api/trip/suggest", response_model=TripResponse)
@@ -257,19 +491,51 @@ def quick_intent_detection(query: str, current_plan: dict = None) -> dict:
     return {"confident": False, "result": None}
 
 # 缓存大模型结果
-@lru_cache(maxsize=100)
-def cached_llm_intent_detection(query_hash: str, current_plan_hash: str) -> dict:
-    """
-    缓存的大模型意图检测，使用哈希值作为键
-    """
-    # 这个函数的实际实现在下面的 parse_query_with_llm 中
-    pass
+# 大模型意图识别结果缓存，键为查询和行程摘要的哈希值
+INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", "86400"))
+intent_cache = create_shared_cache("intent", 2000, INTENT_CACHE_TTL)
+
+# 本地意图分类器：规则引擎没有把握时先用本地模型判断，置信度达到阈值时不再调用大模型
+# 模型由 train_intent_classifier.py 使用 INTENT_LOG_PATH 中记录的大模型意图离线训练，文件更新后自动重新加载
+# 新行程规划需要大模型提取目的地和天数，默认只对聊天和修改意图直接返回
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.json"))
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.9"))
+INTENT_CLASSIFIER_INTENTS = [item.strip() for item in os.getenv("INTENT_CLASSIFIER_INTENTS", "chat,modify").split(",") if item.strip()]
+# 记录大模型意图识别结果作为训练样本，设为空字符串时不记录
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_log.jsonl"))
+
+intent_classifier = IntentModelRunner(INTENT_MODEL_PATH, INTENT_CLASSIFIER_THRESHOLD, INTENT_CLASSIFIER_INTENTS)
+intent_sample_log = IntentSampleLog(INTENT_LOG_PATH)
+
+def classify_intent_locally(query: str, current_plan: Optional[dict]) -> Optional[dict]:
+    """使用本地意图分类器判断意图，没有把握时返回None，返回格式与大模型识别结果相同"""
+    has_plan = bool(current_plan and current_plan.get("itinerary"))
+    prediction = intent_classifier.classify(query, has_plan)
+    if prediction is None:
+        return None
+    intent_type, confidence = prediction
+    return {
+        "is_plan": False,
+        "is_modification": intent_type == INTENT_MODIFY,
+        "destination": None,
+        "duration": current_plan.get("total_days", 3) if intent_type == INTENT_MODIFY else 3,
+        "start_point": None,
+        "intent_confidence": round(confidence, 3),
+        "intent_type": intent_type,
+        "needs_confirmation": False
+    }
 
 @app.post("/api/trip/parse-query", response_model=QueryParseResponse)
-async def parse_query_with_llm(request: QueryParseRequest):
+def parse_query_with_llm(request: QueryParseRequest):
     """
     使用混合策略解析用户查询：优先使用快速规则引擎，复杂情况才使用大模型
     """
+    # 客户端只传行程ID时从服务端读取行程，行程不存在时由客户端重新发送完整行程
+    try:
+        request.current_plan = resolve_request_plan(request.current_plan, request.plan_id)
+    except PlanNotFoundError as e:
+        return QueryParseResponse(success=False, error_message=str(e), error_code=e.error_code)
+
     try:
         # 1. 首先尝试快速规则引擎
         quick_result = quick_intent_detection(request.query, request.current_plan)
@@ -277,11 +543,9 @@ async def parse_query_with_llm(request: QueryParseRequest):
         if quick_result["confident"]:
             # 规则引擎有信心，直接返回结果
             print(f"[快速识别] 查询: {request.query[:50]}... -> {quick_result['result']['intent_type']}")
-            return QueryParseResponse(success=True, data=quick_result["result"])
-        
-        # 2. 规则引擎不确定，使用大模型（但简化输入）
-        print(f"[大模型识别] 查询: {request.query[:50]}...")
+            return QueryParseResponse(success=True, data=quick_result["result"], intent_source="rule")
         
+        # 2. 规则引擎不确定，先查找大模型识别结果缓存，再使用本地意图分类器，最后才使用大模型（但简化输入）
         # 生成缓存键
         query_hash = hashlib.md5(request.query.encode()).hexdigest()
         plan_hash = "none"
@@ -301,8 +565,17 @@ async def parse_query_with_llm(request: QueryParseRequest):
             plan_hash = hashlib.md5(json.dumps(plan_summary, sort_keys=True).encode()).hexdigest()
         
         cache_key = f"{query_hash}_{plan_hash}"
-        
+        cached_intent = intent_cache.get(cache_key)
+        if cached_intent is not None:
+            return QueryParseResponse(success=True, data=cached_intent, intent_source="cache")
+
+        local_result = classify_intent_locally(request.query, request.current_plan)
+        if local_result is not None:
+            print(f"[本地分类] 查询: {request.query[:50]}... -> {local_result['intent_type']} ({local_result['intent_confidence']})")
+            return QueryParseResponse(success=True, data=local_result, intent_source="classifier")
+
         # 3. 简化的大模型调用
+        print(f"[大模型识别] 查询: {request.query[:50]}...")
         llm = get_tongyi_client()
 
         # 构建简化的上下文（只包含景点名称，不包含完整行程数据）
@@ -344,7 +617,7 @@ async def parse_query_with_llm(request: QueryParseRequest):
         ]
 
         # 使用较短的超时时间
-        response = llm.invoke(messages)
+        response = invoke_llm(llm, messages)
 
         ai_content = response.content
         if isinstance(ai_content, list):
@@ -371,7 +644,8 @@ async def parse_query_with_llm(request: QueryParseRequest):
                     "intent_confidence": 0.3,
                     "intent_type": "chat",
                     "needs_confirmation": True
-                }
+                },
+                intent_source="fallback"
             )
 
         json_str = json_match.group()
@@ -407,7 +681,12 @@ async def parse_query_with_llm(request: QueryParseRequest):
             parsed_data["intent_confidence"] = 0.3
             parsed_data["needs_confirmation"] = True
 
-        return QueryParseResponse(success=True, data=parsed_data)
+        intent_cache.set(cache_key, parsed_data)
+        intent_sample_log.record(
+            request.query, bool(request.current_plan and request.current_plan.get("itinerary")),
+            parsed_data["intent_type"], parsed_data.get("intent_confidence")
+        )
+        return QueryParseResponse(success=True, data=parsed_data, intent_source="llm")
 
     except Exception as e:
         print(f"[错误] 意图识别失败: {str(e)}")
@@ -423,7 +702,8 @@ async def parse_query_with_llm(request: QueryParseRequest):
                 "intent_confidence": 0.2,
                 "intent_type": "chat",
                 "needs_confirmation": True
-            }
+            },
+            intent_source="fallback"
         )
 
 # 获取热门目的地（AI生成）
@@ -431,21 +711,160 @@ async def parse_query_with_llm(request: QueryParseRequest):
 # @app.get("/api/destinations/popular")
 
 # 获取高德地图API密钥
-def get_amap_api_key():
-    api_key = os.getenv("AMAP_API_KEY")
-    if not api_key:
-        raise ValueError("AMAP_API_KEY not found in environment variables")
-    return api_key
+def get_amap_api_keys() -> List[str]:
+    """获取所有可用的高德地图API密钥，AMAP_API_KEYS 可用逗号分隔配置多个Key分摊QPS配额"""
+    keys = [key.strip() for key in os.getenv("AMAP_API_KEYS", "").split(",") if key.strip()]
+    if not keys and os.getenv("AMAP_API_KEY"):
+        keys = [os.getenv("AMAP_API_KEY")]
+    return keys
+
+# 高德地图API限流：每个Key的QPS配额、等待令牌的最长时间（秒）和超限后的重试次数
+AMAP_QPS_PER_KEY = float(os.getenv("AMAP_QPS_PER_KEY", "10"))
+AMAP_ACQUIRE_TIMEOUT = float(os.getenv("AMAP_ACQUIRE_TIMEOUT", "30"))
+AMAP_QPS_RETRIES = 2
+
+# acquire 在配额用完时阻塞等待，会调用高德地图API或大模型的接口都定义为普通函数（def），
+# 由FastAPI放到线程池中执行，避免等待令牌时阻塞事件循环
+amap_governor = RateGovernor(get_amap_api_keys(), AMAP_QPS_PER_KEY)
+
+# 当前请求的优先级，交互请求优先于行程生成，行程生成优先于后台预取
+amap_priority_var: ContextVar[int] = ContextVar("amap_priority", default=PRIORITY_NORMAL)
+
+@contextmanager
+def amap_priority(priority: int):
+    """在代码块内为所有高德地图API请求设置优先级"""
+    token = amap_priority_var.set(priority)
+    try:
+        yield
+    finally:
+        amap_priority_var.reset(token)
+
+# 用户正在等待结果的接口，其高德地图API请求使用最高优先级
+INTERACTIVE_PATH_PREFIXES = (
+    "/api/trip/path",
+    "/api/trip/itinerary-routes",
+    "/api/trip/transportation",
+    "/api/trip/travel-times",
+    "/api/weather/"
+)
 
+# 行程、路线等大体积响应超过该大小（字节）时按客户端支持的编码压缩
+FastJSONResponse.min_size = int(os.getenv("RESPONSE_COMPRESS_MIN_SIZE", "1024"))
+
+@app.middleware("http")
+async def remember_accept_encoding(request, call_next):
+    """记录客户端支持的压缩编码，供大体积JSON响应协商压缩方式"""
+    accept_encoding_var.set(request.headers.get("accept-encoding", ""))
+    return await call_next(request)
+
+@app.middleware("http")
+async def set_amap_priority(request, call_next):
+    """根据请求路径设置高德地图API请求的优先级"""
+    if request.url.path.startswith(INTERACTIVE_PATH_PREFIXES):
+        amap_priority_var.set(PRIORITY_INTERACTIVE)
+    return await call_next(request)
+
+def is_amap_qps_exceeded(data: dict) -> bool:
+    """判断高德地图API是否返回了超出QPS限制的错误（v3接口为info，v4接口为errmsg）"""
+    message = str(data.get("info") or data.get("errmsg") or "")
+    return "QPS_HAS_EXCEEDED" in message or "CUQPS" in message
+
+# 单次高德地图API请求的超时时间（秒）
+AMAP_REQUEST_TIMEOUT = float(os.getenv("AMAP_REQUEST_TIMEOUT", "5"))
+# 剩余时间预算不足该秒数时不再发送请求，直接按预算用完处理
+AMAP_MIN_REQUEST_TIMEOUT = float(os.getenv("AMAP_MIN_REQUEST_TIMEOUT", "0.5"))
+
+# 按高德地图服务类型（place、geocode、direction、distance、weather）划分的熔断器
+amap_breakers = {}
+amap_breakers_lock = threading.Lock()
+
+def get_amap_breaker(url: str) -> CircuitBreaker:
+    """根据请求地址获取对应服务的熔断器，例如 /v3/place/text 对应 amap:place"""
+    path = url.split("restapi.amap.com", 1)[-1].strip("/").split("/")
+    service = path[1] if len(path) > 1 else path[0]
+    name = f"amap:{service}"
+    with amap_breakers_lock:
+        if name not in amap_breakers:
+            amap_breakers[name] = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+        return amap_breakers[name]
+
+def amap_get(url: str, params: dict, priority: Optional[int] = None) -> dict:
+    """
+    所有高德地图API请求的统一入口：先从限流器获取令牌和Key，再发送请求
+    上游返回QPS超限时暂停该Key并重试，避免被误判为“无结果”
+    请求受熔断器和当前流程的时间预算约束，服务不可用或预算用完时直接抛出异常
+    """
+    if priority is None:
+        priority = amap_priority_var.get()
+    breaker = get_amap_breaker(url)
+    for attempt in range(AMAP_QPS_RETRIES + 1):
+        check_deadline()
+        # 先获取令牌再经过熔断器：等待令牌超时或预算用完时不会占用半开状态下唯一的试探名额
+        remaining = remaining_budget()
+        acquire_timeout = AMAP_ACQUIRE_TIMEOUT if remaining is None else min(AMAP_ACQUIRE_TIMEOUT, remaining)
+        key = amap_governor.acquire(priority, timeout=acquire_timeout)
+
+        remaining = remaining_budget()
+        if remaining is not None and remaining < AMAP_MIN_REQUEST_TIMEOUT:
+            raise DeadlineExceeded("处理时间预算已用完")
+        # 超时时间因时间预算被缩短时，超时只说明预算不够，不能说明上游不可用
+        budget_limited = remaining is not None and remaining < AMAP_REQUEST_TIMEOUT
+        timeout = min(AMAP_REQUEST_TIMEOUT, remaining) if budget_limited else AMAP_REQUEST_TIMEOUT
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} 服务暂时不可用")
+
+        try:
+            response = requests.get(url, params={**params, "key": key}, timeout=timeout)
+            data = response.json()
+        except requests.Timeout as e:
+            if budget_limited:
+                breaker.release()
+                raise DeadlineExceeded("处理时间预算已用完") from e
+            breaker.record_failure()
+            raise
+        except (requests.RequestException, ValueError):
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # 其他异常无法说明上游是否可用，只归还试探名额
+            breaker.release()
+            raise
+        breaker.record_success()
+
+        if not is_amap_qps_exceeded(data) or attempt == AMAP_QPS_RETRIES:
+            return data
+        print(f"高德地图API超出QPS限制，暂停当前Key后重试 ({attempt + 1}/{AMAP_QPS_RETRIES})")
+        amap_governor.penalize(key, 1.0)
+    return data
+
+
+# 高德地图查询结果缓存（过期时间单位：秒），只缓存成功的结果
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", "604800"))
+ROUTE_CACHE_TTL = int(os.getenv("ROUTE_CACHE_TTL", "21600"))
+CITY_CACHE_TTL = int(os.getenv("CITY_CACHE_TTL", "2592000"))
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "1800"))
+
+geocode_cache = create_shared_cache("geocode", 20000, GEOCODE_CACHE_TTL)
+route_cache = create_shared_cache("route", 5000, ROUTE_CACHE_TTL)
+city_cache = create_shared_cache("city", 20000, CITY_CACHE_TTL)
+transit_station_cache = create_shared_cache("transit_station", 20000, GEOCODE_CACHE_TTL)
+weather_cache = create_shared_cache("weather", 500, WEATHER_CACHE_TTL)
+
+# 地点名称别名索引：同一景点的不同写法（带或不带省市前缀、高德返回的名称）解析为同一个规范ID，共享坐标缓存
+place_alias_cache = create_shared_cache("place_alias", 50000, GEOCODE_CACHE_TTL)
+place_alias_index = PlaceAliasIndex(place_alias_cache)
+
+def geocode_cache_key(location: str, city: Optional[str] = None) -> str:
+    return place_alias_index.canonical_id(location, city)
+
+def coords_cache_key(lng, lat) -> str:
+    """坐标类缓存键，保留6位小数（约0.1米）"""
+    return f"{float(lng):.6f},{float(lat):.6f}"
 
 # POI搜索获取地点坐标
 def get_location_coordinates_poi(location: str, city: Optional[str] = None):
     """通过POI搜索获取旅游景点的精确坐标"""
     try:
-        
-          
-        
-        api_key = get_amap_api_key()
         url = f"https://restapi.amap.com/v3/place/text"
         
         # 旅游景点相关的POI类型代码
@@ -461,7 +880,6 @@ def get_location_coordinates_poi(location: str, city: Optional[str] = None):
         
         # 构建POI搜索参数
         params = {
-            "key": api_key,
             "keywords": location,
             "types": poi_types,
             "extensions": "all",
@@ -473,20 +891,26 @@ def get_location_coordinates_poi(location: str, city: Optional[str] = None):
         if city:
             params["city"] = city
             
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
         if data["status"] == "1" and data["pois"]:
             # 尝试找到最匹配的POI
             best_poi = None
+            # 去掉省市前缀后的名称，使 "四川省成都市武侯祠" 也能匹配 "成都武侯祠博物馆"
+            location_core = place_alias_index.split(location, city)[1]
             
             for poi in data["pois"]:
                 poi_name = poi.get("name", "")
                 poi_type = poi.get("type", "")
+                poi_core = place_alias_index.split(poi_name, poi.get("cityname") or city)[1]
                 
                 # 优先选择名称匹配度高的景点
-                if location in poi_name or poi_name in location:
+                if location in poi_name or poi_name in location or (
+                        location_core and poi_core and (location_core in poi_core or poi_core in location_core)):
                     best_poi = poi
+                    # 名称完全对应时才记录高德返回的名称和POI ID，避免 "武侯祠" 被登记为 "武侯祠大街地铁站" 的别名
+                    if place_alias_index.same_place(location, city, poi):
+                        place_alias_index.learn_poi(location, city, poi)
                     break
             
             # 如果没有找到匹配的，使用第一个结果
@@ -518,15 +942,10 @@ def get_location_coordinates_poi(location: str, city: Optional[str] = None):
 def get_location_coordinates_geocode(location: str, city: Optional[str] = None):
     """通过地理编码获取地点坐标（备用方法）"""
     try:
-        
-          
-        
-        api_key = get_amap_api_key()
         url = f"https://restapi.amap.com/v3/geocode/geo"
         
         # 构建搜索参数
         params = {
-            "key": api_key,
             "address": location
         }
         
@@ -534,8 +953,7 @@ def get_location_coordinates_geocode(location: str, city: Optional[str] = None):
         if city:
             params["city"] = city
             
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
         if data["status"] == "1" and data["geocodes"]:
             location_str = data["geocodes"][0]["location"]
@@ -551,9 +969,110 @@ def get_location_coordinates_geocode(location: str, city: Optional[str] = None):
         print(f"地理编码失败: {e}")
         return None, None
 
-# 获取地点坐标（优化版本：POI优先 + 地理编码备用）
+# 地理编码API批量模式下单次请求最多支持的地址数量
+GEOCODE_BATCH_SIZE = 10
+
+def get_location_coordinates_geocode_batch(locations: List[str], city: Optional[str] = None) -> List[tuple]:
+    """
+    通过地理编码API的批量模式获取多个地点的坐标，每次请求最多10个地址
+    返回与 locations 顺序一致的 (经度, 纬度) 列表；某一批请求失败时，该批地点逐个使用单地址地理编码
+    """
+    results = [(None, None)] * len(locations)
+    url = "https://restapi.amap.com/v3/geocode/geo"
+    for offset in range(0, len(locations), GEOCODE_BATCH_SIZE):
+        chunk = locations[offset:offset + GEOCODE_BATCH_SIZE]
+        params = {
+            "address": "|".join(chunk),
+            "batch": "true"
+        }
+        if city:
+            params["city"] = city
+        try:
+            data = amap_get(url, params)
+            if data.get("status") != "1" or not isinstance(data.get("geocodes"), list):
+                raise ValueError(data.get("info", "未知错误"))
+            # 批量模式下结果按地址顺序返回，无结果的地址对应空的location
+            for index, geocode in enumerate(data["geocodes"][:len(chunk)]):
+                location_str = geocode.get("location") if isinstance(geocode, dict) else None
+                if isinstance(location_str, str) and "," in location_str:
+                    longitude_str, latitude_str = location_str.split(",")
+                    results[offset + index] = (float(longitude_str), float(latitude_str))
+                    print(f"批量地理编码成功: {chunk[index]} -> {results[offset + index]}")
+                else:
+                    print(f"批量地理编码无结果: {chunk[index]}")
+        except Exception as e:
+            if budget_exhausted():
+                print(f"批量地理编码失败，时间预算已用完: {e}")
+                break
+            print(f"批量地理编码失败，逐个重试: {e}")
+            for index, location in enumerate(chunk):
+                results[offset + index] = get_location_coordinates_geocode(location, city)
+    return results
+
+# 地理编码对冲延迟（秒）：POI搜索超过该时间仍未返回时，同时发起地理编码请求
+# 设为0时两种方式同时开始，设为负数时恢复为POI失败后再地理编码的串行方式
+GEOCODE_HEDGE_DELAY = float(os.getenv("GEOCODE_HEDGE_DELAY", "0.3"))
+# 坐标查询专用线程池，只执行单个高德地图API请求，不会再向自身提交任务
+lookup_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LOOKUP_WORKERS", "8")), thread_name_prefix="amap-lookup")
+
+def submit_lookup(func, *args) -> Future:
+    """在坐标查询线程池中执行，并沿用当前的高德地图API优先级"""
+    context = contextvars.copy_context()
+    return lookup_executor.submit(context.run, func, *args)
+
+# 获取地点坐标（优化版本：缓存 + POI优先 + 地理编码备用）
 def get_location_coordinates(location: str, city: Optional[str] = None):
-    """通过地点名称获取经纬度坐标（POI搜索优先，地理编码备用）"""
+    """通过地点名称获取经纬度坐标，优先读取缓存"""
+    key = geocode_cache_key(location, city)
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+    lng, lat = get_location_coordinates_hedged(location, city)
+    if lng is not None and lat is not None:
+        # POI搜索可能刚登记了别名，按规范ID写入缓存
+        geocode_cache.set(geocode_cache_key(location, city), (lng, lat))
+    return lng, lat
+
+def get_location_coordinates_hedged(location: str, city: Optional[str] = None):
+    """
+    通过地点名称获取经纬度坐标（POI搜索优先，地理编码备用）
+    POI搜索在对冲延迟内未返回时提前发起地理编码，POI有结果时仍然优先使用POI结果，
+    未命中时只需等待两者中较慢的一个，而不是两次串行请求
+    """
+    if GEOCODE_HEDGE_DELAY < 0:
+        return get_location_coordinates_sequential(location, city)
+
+    # 第一步：尝试POI搜索（适合旅游景点）
+    poi_future = submit_lookup(get_location_coordinates_poi, location, city)
+    geocode_future = None
+    try:
+        lng, lat = poi_future.result(timeout=GEOCODE_HEDGE_DELAY)
+    except FutureTimeoutError:
+        # POI搜索较慢，提前发起地理编码
+        geocode_future = submit_lookup(get_location_coordinates_geocode, location, city)
+        lng, lat = poi_future.result()
+
+    if lng is not None and lat is not None:
+        if geocode_future is not None:
+            geocode_future.cancel()
+        return lng, lat
+
+    # 第二步：如果POI搜索失败，使用地理编码备用
+    print(f"POI搜索失败，使用地理编码结果: {location}")
+    if geocode_future is not None:
+        lng, lat = geocode_future.result()
+    else:
+        lng, lat = get_location_coordinates_geocode(location, city)
+
+    if lng is not None and lat is not None:
+        return lng, lat
+
+    # 都失败了
+    print(f"所有搜索方法都失败: {location}")
+    return None, None
+
+def get_location_coordinates_sequential(location: str, city: Optional[str] = None):
+    """串行查询：POI搜索失败后再使用地理编码"""
     # 第一步：尝试POI搜索（适合旅游景点）
     lng, lat = get_location_coordinates_poi(location, city)
     
@@ -573,12 +1092,20 @@ def get_location_coordinates(location: str, city: Optional[str] = None):
 
 # 获取路径规划
 def get_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driving", start_location: str = "", end_location: str = ""):
-    """获取两点间的路径规划"""
+    """获取两点间的路径规划，成功的结果会被缓存"""
+    key = f"{mode}:{coords_cache_key(*start_coords)}->{coords_cache_key(*end_coords)}"
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+    data = request_route_planning(start_coords, end_coords, mode)
+    # 驾车/步行/公交接口以 status 表示成功，骑行接口以 errcode 表示成功
+    if data and (data.get("status") == "1" or data.get("errcode") == 0):
+        route_cache.set(key, data)
+    return data
+
+def request_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driving"):
+    """调用高德地图API获取两点间的路径规划"""
     try:
-        
-          
-        
-        api_key = get_amap_api_key()
         origin = f"{start_coords[0]},{start_coords[1]}"
         destination = f"{end_coords[0]},{end_coords[1]}"
         
@@ -602,7 +1129,6 @@ def get_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driv
                 city = "全国"
             
             params = {
-                "key": api_key,
                 "origin": origin,
                 "destination": destination,
                 "city": city,  # 使用智能提取的城市
@@ -612,7 +1138,6 @@ def get_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driv
             # 骑行路径规划使用新的API
             url = "https://restapi.amap.com/v4/direction/bicycling"
             params = {
-                "key": api_key,
                 "origin": origin,
                 "destination": destination
             }
@@ -621,13 +1146,11 @@ def get_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driv
             # 驾车和步行使用原来的API
             url = f"https://restapi.amap.com/v3/direction/{mode}"
             params = {
-                "key": api_key,
                 "origin": origin,
                 "destination": destination
             }
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
         # 打印调试信息
         print(f"路径规划请求: {mode}, URL: {url}")
@@ -640,9 +1163,114 @@ def get_route_planning(start_coords: tuple, end_coords: tuple, mode: str = "driv
         print(f"获取路径规划失败: {e}")
         return None
 
+# 距离测量API支持的出行方式：0 直线距离，1 驾车，3 步行（步行仅支持5公里以内）
+DISTANCE_API_TYPES = {"straight": "0", "driving": "1", "walking": "3"}
+# 距离测量API单次请求最多支持的起点数量
+MAX_DISTANCE_ORIGINS = 100
+# 生成行程时是否为每段路线预取完整的路径几何数据（默认只通过距离测量API获取距离和时间）
+PREFETCH_ROUTE_GEOMETRY = os.getenv("PREFETCH_ROUTE_GEOMETRY", "false").lower() == "true"
+# 编码路线折线时默认使用的地图缩放级别，以及简化时允许偏离原路线的像素数
+ROUTE_GEOMETRY_ZOOM = float(os.getenv("ROUTE_GEOMETRY_ZOOM", "16"))
+ROUTE_SIMPLIFY_PIXELS = float(os.getenv("ROUTE_SIMPLIFY_PIXELS", "1.0"))
+
+def encode_route_geometry(route_info: Optional[dict], start: tuple, end: tuple, zoom: Optional[float] = None) -> tuple:
+    """将路线中的 polyline 简化编码为一条折线，返回 (折线数据, 去掉 polyline 的路线数据)"""
+    geometry = build_route_geometry(
+        route_info, start, end,
+        zoom=zoom if zoom is not None else ROUTE_GEOMETRY_ZOOM,
+        pixel_tolerance=ROUTE_SIMPLIFY_PIXELS
+    )
+    return geometry, strip_polylines(route_info)
+
+# 距离测量结果缓存，与路线缓存使用相同的过期时间
+distance_cache = create_shared_cache("distance", 20000, ROUTE_CACHE_TTL)
+
+def distance_cache_key(origin: tuple, destination: tuple, mode: str) -> str:
+    return f"{mode}:{coords_cache_key(*origin)}->{coords_cache_key(*destination)}"
+
+def get_distance_batch(origins: List[tuple], destination: tuple, mode: str = "driving") -> List[Optional[dict]]:
+    """
+    通过高德距离测量API批量获取多个起点到同一终点的距离和时间
+    返回与 origins 顺序一致的列表，每项为 {"distance": 米, "duration": 秒}，失败时为None
+    """
+    results: List[Optional[dict]] = [None] * len(origins)
+    # 先读取缓存，只请求未缓存的起点
+    pending = []
+    for i, origin in enumerate(origins):
+        cached = distance_cache.get(distance_cache_key(origin, destination, mode))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+    if not pending:
+        return results
+    try:
+        url = "https://restapi.amap.com/v3/distance"
+        distance_type = DISTANCE_API_TYPES.get(mode, DISTANCE_API_TYPES["driving"])
+
+        for offset in range(0, len(pending), MAX_DISTANCE_ORIGINS):
+            chunk = pending[offset:offset + MAX_DISTANCE_ORIGINS]
+            params = {
+                "origins": "|".join(f"{origins[i][0]},{origins[i][1]}" for i in chunk),
+                "destination": f"{destination[0]},{destination[1]}",
+                "type": distance_type
+            }
+            data = amap_get(url, params)
+
+            if data.get("status") != "1":
+                print(f"距离测量失败: {data.get('info')}")
+                continue
+            for item in data.get("results", []):
+                try:
+                    # origin_id 从1开始，对应本次请求中起点的顺序
+                    index = chunk[int(item["origin_id"]) - 1]
+                    results[index] = {
+                        "distance": int(item["distance"]),
+                        "duration": int(item["duration"])
+                    }
+                    distance_cache.set(distance_cache_key(origins[index], destination, mode), results[index])
+                except (KeyError, ValueError, TypeError, IndexError):
+                    continue
+        return results
+    except Exception as e:
+        print(f"批量获取距离失败: {e}")
+        return results
+
+def get_segment_travel_info(points: List[tuple], mode: str = "driving") -> List[Optional[dict]]:
+    """
+    获取按顺序游览时每段路程的距离和时间，只请求距离和时间，不包含路线几何数据
+    距离测量API每次请求只支持一个终点，相邻路段的终点各不相同，因此通常每段一次请求，
+    只有终点相同的路段（例如往返同一地点）会合并；已缓存的路段不再请求
+    """
+    segments: List[Optional[dict]] = [None] * max(len(points) - 1, 0)
+    by_destination = {}
+    for i in range(len(points) - 1):
+        by_destination.setdefault(tuple(points[i + 1]), []).append(i)
+
+    for destination, indexes in by_destination.items():
+        batch = get_distance_batch([tuple(points[i]) for i in indexes], destination, mode)
+        for i, info in zip(indexes, batch):
+            segments[i] = info
+    return segments
+
+def get_travel_time_matrix(points: List[tuple], mode: str = "driving") -> List[List[Optional[int]]]:
+    """
+    批量获取所有地点两两之间的交通时间矩阵（秒）
+    每个终点一次请求，n个地点只需n次请求，而不是n*(n-1)次路径规划请求
+    """
+    size = len(points)
+    matrix: List[List[Optional[int]]] = [[0 if i == j else None for j in range(size)] for i in range(size)]
+    for j in range(size):
+        origin_indexes = [i for i in range(size) if i != j]
+        batch = get_distance_batch([tuple(points[i]) for i in origin_indexes], tuple(points[j]), mode)
+        for i, info in zip(origin_indexes, batch):
+            if info:
+                matrix[i][j] = info["duration"]
+    return matrix
+
 # 路径规划API
-@app.post("/api/trip/path", response_model=PathResponse)
-async def get_trip_path(request: PathRequest):
+@app.post("/api/trip/path", response_model=PathResponse, response_class=FastJSONResponse)
+def get_trip_path(request: PathRequest):
     """获取起点到终点的路径规划"""
     try:
         # 获取起点坐标
@@ -722,8 +1350,7 @@ async def get_trip_path(request: PathRequest):
                 "longitude": end_lng,    # 已经是 float 类型
                 "latitude": end_lat      # 已经是 float 类型
             },
-            "mode": mode,
-            "raw_data": route_data  # 完整的原始数据，供前端使用
+            "mode": mode
         }
         
         # 根据不同交通方式提取路径信息
@@ -732,6 +1359,13 @@ async def get_trip_path(request: PathRequest):
                 processed_data["route_info"] = route_data.get("data", {})
             else:
                 processed_data["route_info"] = route_data.get("route", {})
+
+        if request.geometry == "encoded":
+            processed_data["geometry"], processed_data["route_info"] = encode_route_geometry(
+                processed_data.get("route_info"), (start_lng, start_lat), (end_lng, end_lat), request.zoom
+            )
+        else:
+            processed_data["raw_data"] = route_data  # 完整的原始数据，供前端使用
         
         return PathResponse(
             success=True,
@@ -749,84 +1383,150 @@ async def get_trip_path(request: PathRequest):
             error_message=f"服务器内部错误: {str(e)}"
         )
 
+# 批量交通时间API
+@app.post("/api/trip/travel-times", response_model=TravelTimeResponse)
+def get_travel_times(request: TravelTimeRequest):
+    """通过距离测量API获取行程地点间的距离和时间，不返回路线几何数据；完整矩阵每个终点一次请求，相邻路段通常每段一次请求"""
+    try:
+        if not request.places or len(request.places) < 2:
+            return TravelTimeResponse(
+                success=False,
+                error_message="至少需要2个地点才能计算交通时间"
+            )
+
+        mode = request.mode if request.mode in DISTANCE_API_TYPES else "driving"
+        try:
+            places = parse_route_places(request.places)
+        except PlanModelError as e:
+            return TravelTimeResponse(success=False, error_message=str(e))
+        points = [place.coords for place in places]
+
+        segment_info = get_segment_travel_info(points, mode)
+        segments = []
+        for i, info in enumerate(segment_info):
+            segments.append({
+                "segment_index": i,
+                "start_name": places[i].name,
+                "end_name": places[i + 1].name,
+                "mode": mode,
+                "distance": info["distance"] if info else None,
+                "duration": info["duration"] if info else None,
+                "time": format_duration_text(info["duration"]) if info else "交通时间未知",
+                "success": info is not None
+            })
+
+        matrix = get_travel_time_matrix(points, mode) if request.full_matrix else None
+
+        return TravelTimeResponse(
+            success=True,
+            segments=segments,
+            matrix=matrix
+        )
+
+    except Exception as e:
+        return TravelTimeResponse(
+            success=False,
+            error_message=f"批量获取交通时间失败: {str(e)}"
+        )
+
+# 多天路径规划时同时进行的路段请求数量上限
+ROUTE_CONCURRENCY_LIMIT = int(os.getenv("ROUTE_CONCURRENCY_LIMIT", "4"))
+
+def build_segment_route(index: int, start_place: Place, end_place: Place, mode: str, route_data,
+                        geometry: str = "raw", zoom: Optional[float] = None) -> dict:
+    """根据路径规划结果构建单段路线数据，失败时标记为简单直线连接"""
+    segment = Segment(start_place, end_place, mode, segment_index=index)
+    if route_data and route_data.get("status") == "1":
+        # 处理路径数据
+        segment.route_info = route_data.get("route", {})
+        if geometry == "encoded":
+            segment.geometry, segment.route_info = encode_route_geometry(
+                segment.route_info, start_place.coords, end_place.coords, zoom
+            )
+        segment.success = True
+    else:
+        # 如果路径规划失败，创建简单路径
+        segment.success = False
+        segment.fallback = "simple_line"  # 标记为简单直线连接
+    return segment.to_dict()
+
+async def plan_segments_concurrently(segments: List[tuple], mode: str, geometry: str = "raw",
+                                     zoom: Optional[float] = None) -> List[dict]:
+    """
+    在线程池中并发执行多段路径规划，并通过信号量限制同时进行的请求数量
+    segments 中每项为 (段序号, 起点, 终点)，起点和终点为已校验坐标的 Place，返回顺序与输入一致
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(ROUTE_CONCURRENCY_LIMIT, 1))
+
+    def plan_segment(index, start_place, end_place):
+        route_data = get_route_planning(start_place.coords, end_place.coords, mode)
+        # 折线简化的计算量较大，与请求一起在线程池中完成，不阻塞事件循环
+        return build_segment_route(index, start_place, end_place, mode, route_data, geometry, zoom)
+
+    async def plan_one(index, start_place, end_place):
+        async with semaphore:
+            # 复制上下文，使线程池中的请求沿用当前的高德地图API优先级
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(None, context.run, plan_segment, index, start_place, end_place)
+
+    return await asyncio.gather(*(plan_one(*segment) for segment in segments))
+
 # 行程地点间路径规划API
-@app.post("/api/trip/itinerary-routes", response_model=ItineraryRouteResponse)
+@app.post("/api/trip/itinerary-routes", response_model=ItineraryRouteResponse, response_class=FastJSONResponse)
 async def get_itinerary_routes(request: ItineraryRouteRequest):
-    """为行程中的地点生成相邻地点间的路径规划"""
+    """
+    为行程中的地点生成相邻地点间的路径规划
+    传入 days 时一次性为所有天的所有路段并发生成路径规划，结果按天返回在 days_data 中
+    """
     try:
+        mode = request.mode or "driving"
+
+        if request.days:
+            # 多天模式：先验证所有地点，再并发请求所有路段
+            try:
+                day_plans = [
+                    DayPlan.from_dict(day_data, day_index, require_coords=True)
+                    for day_index, day_data in enumerate(request.days)
+                ]
+            except PlanModelError as e:
+                return ItineraryRouteResponse(success=False, error_message=str(e))
+
+            segments = []
+            for day_index, day_plan in enumerate(day_plans):
+                places = day_plan.places
+                for i in range(len(places) - 1):
+                    segments.append((day_index, (i, places[i], places[i + 1])))
+
+            routes = await plan_segments_concurrently(
+                [segment for _, segment in segments], mode, request.geometry, request.zoom
+            )
+
+            days_data = [{"day": day_plan.day, "routes": []} for day_plan in day_plans]
+            for (day_index, _), route_info in zip(segments, routes):
+                days_data[day_index]["routes"].append(route_info)
+
+            print(f"多天路径规划完成: {len(days_data)} 天，共 {len(routes)} 段路线")
+            return ItineraryRouteResponse(
+                success=True,
+                days_data=days_data
+            )
+
         if not request.places or len(request.places) < 2:
             return ItineraryRouteResponse(
                 success=False,
                 error_message="至少需要2个地点才能进行路径规划"
             )
-        
-        routes = []
-        mode = request.mode or "driving"
-        
+
+        try:
+            places = parse_route_places(request.places)
+        except PlanModelError as e:
+            return ItineraryRouteResponse(success=False, error_message=str(e))
+
         # 为相邻的地点生成路径规划
-        for i in range(len(request.places) - 1):
-            start_place = request.places[i]
-            end_place = request.places[i + 1]
-            
-            # 验证地点数据
-            if not all(key in start_place for key in ['name', 'longitude', 'latitude']):
-                return ItineraryRouteResponse(
-                    success=False,
-                    error_message=f"地点 {i+1} 缺少必要的坐标信息"
-                )
-                
-            if not all(key in end_place for key in ['name', 'longitude', 'latitude']):
-                return ItineraryRouteResponse(
-                    success=False,
-                    error_message=f"地点 {i+2} 缺少必要的坐标信息"
-                )
-            
-            # 获取路径规划
-            start_coords = (float(start_place['longitude']), float(start_place['latitude']))
-            end_coords = (float(end_place['longitude']), float(end_place['latitude']))
-            
-            route_data = get_route_planning(start_coords, end_coords, mode)
-            
-            if route_data and route_data.get("status") == "1":
-                # 处理路径数据
-                route_info = {
-                    "segment_index": i,
-                    "start_point": {
-                        "name": start_place['name'],
-                        "longitude": float(start_place['longitude']),
-                        "latitude": float(start_place['latitude'])
-                    },
-                    "end_point": {
-                        "name": end_place['name'],
-                        "longitude": float(end_place['longitude']),
-                        "latitude": float(end_place['latitude'])
-                    },
-                    "mode": mode,
-                    "route_info": route_data.get("route", {}),
-                    "success": True
-                }
-            else:
-                # 如果路径规划失败，创建简单路径
-                route_info = {
-                    "segment_index": i,
-                    "start_point": {
-                        "name": start_place['name'],
-                        "longitude": float(start_place['longitude']),
-                        "latitude": float(start_place['latitude'])
-                    },
-                    "end_point": {
-                        "name": end_place['name'],
-                        "longitude": float(end_place['longitude']),
-                        "latitude": float(end_place['latitude'])
-                    },
-                    "mode": mode,
-                    "route_info": None,
-                    "success": False,
-                    "fallback": "simple_line"  # 标记为简单直线连接
-                }
-            
-            routes.append(route_info)
-        
+        segments = [(i, places[i], places[i + 1]) for i in range(len(places) - 1)]
+        routes = await plan_segments_concurrently(segments, mode, request.geometry, request.zoom)
+
         return ItineraryRouteResponse(
             success=True,
             routes_data=routes
@@ -844,8 +1544,18 @@ async def get_itinerary_routes(request: ItineraryRouteRequest):
 
 # 新增：流式聊天API
 @app.post("/api/chat/stream")
-async def chat_with_ai_stream(request: ChatRequest):
+def chat_with_ai_stream(request: ChatRequest):
     """流式聊天API，返回Server-Sent Events流"""
+    # 提供行程ID时使用服务端保存的行程；行程已过期时返回409，由客户端重新发送完整行程
+    stored_plan = None
+    if request.plan_id:
+        try:
+            stored_plan = plan_store.get(request.plan_id)
+        except PlanNotFoundError as e:
+            print(f"聊天引用的行程不存在: {request.plan_id}")
+            return FastJSONResponse(
+                status_code=409, content={"success": False, "error_message": str(e), "error_code": e.error_code}
+            )
     
     def generate_response():
         try:
@@ -873,52 +1583,22 @@ async def chat_with_ai_stream(request: ChatRequest):
                 HumanMessage(content=request.message)
             ]
             
-            # 处理上下文信息
-            if request.context:
-                try:
-                    import json
-                    context_data = json.loads(request.context)
-                    
-                    # 构建结构化的上下文描述
-                    context_parts = []
-                    
-                    # 处理行程规划数据
-                    if "currentPlan" in context_data and context_data["currentPlan"]:
-                        plan = context_data["currentPlan"]
-                        context_parts.append(f"当前行程规划：{plan.get('destination', '未知目的地')}{plan.get('total_days', 'N')}日游")
-                        
-                        if "itinerary" in plan:
-                            context_parts.append("详细安排：")
-                            for day_plan in plan["itinerary"]:
-                                day_places = [place["name"] for place in day_plan.get("places", [])]
-                                context_parts.append(f"第{day_plan['day']}天（{day_plan.get('theme', '主题未定')}）：{' -> '.join(day_places)}")
-                    
-                    # 处理路径规划数据
-                    if "currentRoute" in context_data and context_data["currentRoute"]:
-                        route = context_data["currentRoute"]
-                        start_name = route.get("start_point", {}).get("name", "起点")
-                        end_name = route.get("end_point", {}).get("name", "终点")
-                        mode = route.get("mode", "driving")
-                        mode_text = {"driving": "驾车", "walking": "步行", "transit": "公交"}.get(mode, mode)
-                        context_parts.append(f"当前路径规划：{start_name} → {end_name}（{mode_text}）")
-                    
-                    # 处理地图中心和选中天数
-                    if "selectedDay" in context_data:
-                        context_parts.append(f"当前查看：第{context_data['selectedDay']}天的行程")
-                    
-                    if context_parts:
-                        enhanced_context = "当前状态：\n" + "\n".join(context_parts)
-                        messages.append(HumanMessage(content=f"背景信息：{enhanced_context}"))
-                    else:
-                        # 如果没有结构化数据，使用原始上下文
-                        messages.append(HumanMessage(content=f"背景信息：{request.context}"))
-                        
-                except (json.JSONDecodeError, KeyError):
-                    # 如果不是JSON格式或解析失败，当作普通文本处理
-                    messages.append(HumanMessage(content=f"背景信息：{request.context}"))
-            
+            # 处理上下文信息，压缩为简短的文字描述
+            if stored_plan is not None:
+                enhanced_context = build_chat_context_with_plan(request.context, stored_plan, CHAT_CONTEXT_TOKEN_BUDGET)
+                messages.append(HumanMessage(content=f"背景信息：{enhanced_context}"))
+            elif request.context:
+                enhanced_context = build_chat_context(request.context, CHAT_CONTEXT_TOKEN_BUDGET)
+                messages.append(HumanMessage(content=f"背景信息：{enhanced_context}"))
+
+            prompt_metrics.record(
+                "chat",
+                sum(estimate_tokens(message.content) for message in messages),
+                estimate_tokens(system_prompt) + estimate_tokens(request.message) + estimate_tokens(request.context or "")
+            )
+
             # 使用流式调用
-            response = llm.stream(messages)
+            response = stream_llm(llm, messages)
             
             # 流式返回响应内容
             for chunk in response:
@@ -960,53 +1640,6 @@ async def chat_with_ai_stream(request: ChatRequest):
 # 注释：此API端点未被前端使用，已删除
 # @app.post("/api/location/info", response_model=LocationResponse)
 
-# 辅助函数：精简行程数据，减少LLM的输入大小
-def simplify_plan_for_llm(plan):
-    """
-    从行程计划中移除不必要的详细信息，以减少传递给LLM的数据量，避免超出最大输入长度限制
-    """
-    if not plan or not isinstance(plan, dict):
-        return plan
-    
-    simplified_plan = {
-        "destination": plan.get("destination", ""),
-        "total_days": plan.get("total_days", 0),
-        "itinerary": []
-    }
-    
-    # 复制行程数据，但排除路线详情和原始响应数据
-    if "itinerary" in plan and isinstance(plan["itinerary"], list):
-        for day in plan["itinerary"]:
-            simplified_day = {
-                "day": day.get("day", 0),
-                "theme": day.get("theme", ""),
-                "places": []
-            }
-            
-            # 只保留地点的基本信息
-            if "places" in day and isinstance(day["places"], list):
-                for place in day["places"]:
-                    simplified_place = {
-                        "name": place.get("name", ""),
-                        "description": place.get("description", ""),
-                        "duration": place.get("duration", 0)
-                    }
-                    # 可选保留坐标信息
-                    if "longitude" in place and "latitude" in place:
-                        simplified_place["longitude"] = place["longitude"]
-                        simplified_place["latitude"] = place["latitude"]
-                    
-                    # 不包含交通详情、路线步骤等信息
-                    simplified_day["places"].append(simplified_place)
-            
-            # 完全移除路线数据
-            if "routes" in day:
-                del day["routes"]
-            
-            simplified_plan["itinerary"].append(simplified_day)
-    
-    return simplified_plan
-
 # 行程规划API - 简单版本
 # 注释：此API端点未被前端使用，前端使用复杂版本 /api/trip/plan，已删除
 # @app.post("/api/trip/itinerary", response_model=ItineraryPlanResponse)
@@ -1024,8 +1657,6 @@ def get_transportation_text(mode):
 def get_transit_time(start_lng, start_lat, end_lng, end_lat, mode="driving"):
     """使用高德地图API计算两点间的实际交通时间，并提取换乘路线"""
     try:
-        
-        api_key = get_amap_api_key()
         origin = f"{start_lng},{start_lat}"
         destination = f"{end_lng},{end_lat}"
         
@@ -1041,7 +1672,6 @@ def get_transit_time(start_lng, start_lat, end_lng, end_lat, mode="driving"):
             city = start_city if start_city != "全国" else (end_city if end_city != "全国" else "全国")
             
             params = {
-                "key": api_key,
                 "origin": origin,
                 "destination": destination,
                 "city": city,
@@ -1057,13 +1687,11 @@ def get_transit_time(start_lng, start_lat, end_lng, end_lat, mode="driving"):
                 url = "https://restapi.amap.com/v3/direction/driving"
                 
             params = {
-                "key": api_key,
                 "origin": origin,
                 "destination": destination
             }
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
         # 处理响应获取交通时间和换乘路线
         time_str = "交通时间未知"
@@ -1140,22 +1768,83 @@ def get_transit_time(start_lng, start_lat, end_lng, end_lat, mode="driving"):
             "steps": get_transportation_text(mode)
         }
 
+# 各路段不同交通方式的交通时间缓存，用于切换交通方式时直接返回
+TRANSPORT_CACHE_TTL = int(os.getenv("TRANSPORT_CACHE_TTL", "21600"))
+transport_cache = create_shared_cache("transportation", 5000, TRANSPORT_CACHE_TTL)
+
+def transport_cache_key(start_lng, start_lat, end_lng, end_lat, mode) -> str:
+    """生成交通时间缓存键，坐标保留6位小数"""
+    return f"{mode}:{float(start_lng):.6f},{float(start_lat):.6f}->{float(end_lng):.6f},{float(end_lat):.6f}"
+
+def get_transit_time_cached(start_lng, start_lat, end_lng, end_lat, mode="driving"):
+    """优先从缓存读取交通时间，未命中时调用高德地图API并写入缓存"""
+    key = transport_cache_key(start_lng, start_lat, end_lng, end_lat, mode)
+    cached = transport_cache.get(key)
+    if cached is not None:
+        return cached
+    transit_info = get_transit_time(start_lng, start_lat, end_lng, end_lat, mode=mode)
+    # 获取失败的结果不缓存，下次切换时重新请求
+    if transit_info["time"] != "交通时间未知":
+        transport_cache.set(key, transit_info)
+    return transit_info
+
+def precompute_plan_transportations(plan_data: dict):
+    """
+    后台任务：在行程返回给前端后，为每段路程的所有可选交通方式预先计算交通时间和路线并缓存
+    用户在前端切换交通方式时即可直接从缓存返回
+    """
+    start_time = time.perf_counter()
+    with amap_priority(PRIORITY_BACKGROUND):
+        computed = precompute_segments(plan_data)
+    elapsed = time.perf_counter() - start_time
+    print(f"交通方式预计算完成: 新增 {computed} 条，耗时 {elapsed:.2f} 秒")
+
+def precompute_segments(plan_data: dict) -> int:
+    """为行程中每段路程的所有可选交通方式计算交通时间，返回新计算的条数"""
+    computed = 0
+    for day_plan in plan_data.get("itinerary") or []:
+        coord_places = [p for p in day_plan.get("places") or [] if has_valid_coords(p)]
+        for i in range(len(coord_places) - 1):
+            start = coord_places[i]
+            end = coord_places[i + 1]
+            for mode in start.get("available_transportations") or []:
+                key = transport_cache_key(start["longitude"], start["latitude"], end["longitude"], end["latitude"], mode)
+                if transport_cache.contains(key):
+                    continue
+                try:
+                    get_transit_time_cached(
+                        start["longitude"], start["latitude"],
+                        end["longitude"], end["latitude"],
+                        mode=mode
+                    )
+                    computed += 1
+                except Exception as e:
+                    print(f"预计算交通方式失败: {start.get('name')} -> {end.get('name')} ({mode}), 错误: {e}")
+    return computed
+
 # 新增辅助函数：从坐标提取城市
 def extract_city_from_coords(lng, lat):
-    """从坐标反查所在城市"""
+    """从坐标反查所在城市，成功的结果会被缓存"""
+    key = coords_cache_key(lng, lat)
+    cached = city_cache.get(key)
+    if cached is not None:
+        return cached
+    city = request_city_from_coords(lng, lat)
+    if city != "全国":
+        city_cache.set(key, city)
+    return city
+
+def request_city_from_coords(lng, lat):
+    """调用逆地理编码API反查坐标所在城市，失败时返回“全国”"""
     try:
-        
-        api_key = get_amap_api_key()
         url = "https://restapi.amap.com/v3/geocode/regeo"
         
         params = {
-            "key": api_key,
             "location": f"{lng},{lat}",
             "extensions": "base"
         }
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
         if data["status"] == "1" and data.get("regeocode"):
             address_component = data["regeocode"]["addressComponent"]
@@ -1212,37 +1901,419 @@ def recommend_transportation(start_lng, start_lat, end_lng, end_lat, distance_km
 
 # 新增函数：检查地点附近是否有公交/地铁站
 def has_nearby_transit_station(lng, lat, radius=500):
-    """检查指定坐标附近是否有公交或地铁站"""
+    """检查指定坐标附近是否有公交或地铁站，结果会被缓存"""
+    key = f"{coords_cache_key(lng, lat)}:{radius}"
+    cached = transit_station_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-          # 避免QPS限制
-        api_key = get_amap_api_key()
         url = "https://restapi.amap.com/v3/place/around"
         
         params = {
-            "key": api_key,
             "location": f"{lng},{lat}",
             "radius": radius,
             "types": "150500|150700",  # 公交站|地铁站
             "offset": 1  # 只需要一个结果即可
         }
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = amap_get(url, params)
         
-        if data["status"] == "1" and data.get("pois") and len(data["pois"]) > 0:
-            return True
-        return False
+        if data["status"] != "1":
+            return False
+        has_station = bool(data.get("pois"))
+        transit_station_cache.set(key, has_station)
+        return has_station
     except Exception as e:
         print(f"检查附近交通站点失败: {e}")
         return False
 
-@app.post("/api/trip/streamplan", response_model=ItineraryPlanResponse)
-async def get_trip_plan_stream(request: ItineraryPlanRequest):
-    def generate_response():
-        """生成行程规划的Server-Sent Events流"""
+# 辅助函数：从目的地中提取用于地点搜索的城市信息
+def extract_city_hint(destination: Optional[str]):
+    """
+    优先按已知省市名称识别目的地中最具体的城市（例如 "四川成都" -> "成都市"）
+    无法识别时简单提取：如果目的地包含"市"，则提取城市部分；如果是省份，使用完整目的地
+    """
+    if not destination:
+        return None
+    hint = place_alias_index.city_hint(destination)
+    if hint:
+        return hint
+    if "市" in destination:
+        city_parts = destination.split("市")
+        if len(city_parts) > 0:
+            return city_parts[0] + "市"
+    elif "省" in destination and len(destination) > 2:
+        return destination
+    return None
+
+def has_valid_coords(place: dict) -> bool:
+    """判断地点是否已有有效坐标"""
+    return isinstance(place, dict) and place.get("longitude") is not None and place.get("latitude") is not None
+
+def apply_place_coordinates(place: dict, lng, lat):
+    """将查询到的坐标写入地点，无效或缺失时坐标置空"""
+    if lng is not None and lat is not None:
+        # 确保坐标是有效的浮点数
         try:
-            llm = get_tongyi_client()
-            prompt = f"""请为用户制定一个详细的{request.destination}{request.duration}天旅行行程规划。
+            place["longitude"] = float(lng)
+            place["latitude"] = float(lat)
+            # 验证坐标范围
+            if not (-180 <= place["longitude"] <= 180 and -90 <= place["latitude"] <= 90):
+                print(f"警告：地点 '{place['name']}' 坐标超出有效范围: ({lng}, {lat})")
+                place["longitude"] = None
+                place["latitude"] = None
+        except (ValueError, TypeError):
+            print(f"警告：地点 '{place['name']}' 坐标转换失败: ({lng}, {lat})")
+            place["longitude"] = None
+            place["latitude"] = None
+    else:
+        place["longitude"] = None
+        place["latitude"] = None
+        print(f"警告：无法获取地点 '{place['name']}' 的坐标")
+
+def resolve_places_coordinates(names: List[str], city_info: Optional[str]) -> dict:
+    """
+    批量获取一组地点名称的坐标，返回 {名称: (经度, 纬度)}
+    先并发进行POI搜索，未命中的地点再通过批量地理编码用尽可能少的请求解决
+    """
+    unique_names = list(dict.fromkeys(names))
+    results = {}
+    for name in unique_names:
+        cached = geocode_cache.get(geocode_cache_key(name, city_info))
+        if cached is not None:
+            results[name] = tuple(cached)
+    for name in unique_names:
+        if name in results:
+            continue
+        # 流式生成行程时已提前发起的查询直接等待其结果，不再重复请求
+        future = inflight_speculative_geocode(geocode_cache_key(name, city_info))
+        if future is None:
+            continue
+        try:
+            lng, lat = future.result(timeout=remaining_budget())
+        except Exception:
+            continue
+        if lng is not None and lat is not None:
+            results[name] = (lng, lat)
+    poi_futures = {
+        name: submit_lookup(get_location_coordinates_poi, name, city_info)
+        for name in unique_names if name not in results
+    }
+    for name, future in poi_futures.items():
+        try:
+            results[name] = future.result(timeout=remaining_budget())
+        except FutureTimeoutError:
+            # 时间预算用完，未返回的查询视为未获取到坐标
+            results[name] = (None, None)
+
+    if not budget_exhausted():
+        missed = [name for name, (lng, lat) in results.items() if lng is None or lat is None]
+        if missed:
+            print(f"POI搜索未命中 {len(missed)} 个地点，使用批量地理编码")
+            for name, coords in zip(missed, get_location_coordinates_geocode_batch(missed, city_info)):
+                results[name] = coords
+
+    for name in poi_futures:
+        lng, lat = results.get(name, (None, None))
+        if lng is not None and lat is not None:
+            geocode_cache.set(geocode_cache_key(name, city_info), (lng, lat))
+    return results
+
+def geocode_plan_places(plan_data: dict, city_info: Optional[str], days: Optional[set] = None):
+    """
+    第一步：为行程中所有地点获取坐标，无法定位的地点保留但坐标为空
+    指定 days 时只处理这些天中还没有坐标的地点
+    """
+    places = [
+        place
+        for day_plan in plan_data.get("itinerary", [])
+        if days is None or day_plan.get("day") in days
+        for place in day_plan.get("places", [])
+        if isinstance(place, dict) and "name" in place and (days is None or not has_valid_coords(place))
+    ]
+    coordinates = resolve_places_coordinates([place["name"] for place in places], city_info)
+    for place in places:
+        lng, lat = coordinates.get(place["name"], (None, None))
+        apply_place_coordinates(place, lng, lat)
+        if has_valid_coords(place):
+            place.pop("fallback", None)
+        else:
+            place["fallback"] = "unresolved"  # 标记为未能定位的地点
+
+def build_day_routes(day_plan: dict, coord_places: list):
+    """
+    第二步：为相邻地点生成路径规划数据
+    默认只通过距离测量API获取每段的驾车距离和时间（每段一次请求，比路径规划请求轻量），完整路线几何数据由前端查看时再请求；
+    设置 PREFETCH_ROUTE_GEOMETRY=true 时为每段路线获取完整的路径规划数据
+    """
+    day_plan["routes"] = []
+    if len(coord_places) < 2:
+        return
+
+    segment_count = len(coord_places) - 1
+    print(f"第{day_plan.get('day')}天开始生成 {segment_count} 条路径...")
+    places = [Place.from_dict(p) for p in coord_places]
+    segment_info = get_segment_travel_info([p.coords for p in places], "driving")
+
+    for i in range(segment_count):
+        start_place = places[i]
+        end_place = places[i + 1]
+        segment = Segment(start_place, end_place, "driving", sequence=i + 1)  # sequence 标记这是第几段路径
+        if segment_info[i]:
+            segment.distance = segment_info[i]["distance"]
+            segment.duration = segment_info[i]["duration"]
+
+        if not PREFETCH_ROUTE_GEOMETRY:
+            if not segment_info[i]:
+                print(f"✗ 无法获取路径距离 {i+1}/{segment_count}：{start_place.name} -> {end_place.name}")
+                segment.fallback = "simple_line"  # 标记为简单直线连接
+            else:
+                segment.geometry_pending = True  # 完整路线在前端查看时通过 /api/trip/itinerary-routes 获取
+            day_plan["routes"].append(segment.to_dict())
+            continue
+
+        try:
+            route_data = None
+            if not budget_exhausted():
+                route_data = get_route_planning(start_place.coords, end_place.coords, "driving")  # 默认使用驾车模式
+            if route_data and route_data.get("status") == "1":
+                # 行程中只保存简化编码后的折线，完整 polyline 数据量过大
+                segment.geometry, segment.route_info = encode_route_geometry(
+                    route_data.get("route", {}), start_place.coords, end_place.coords
+                )
+                print(f"✓ 成功生成路径 {i+1}/{segment_count}：{start_place.name} -> {end_place.name}")
+            else:
+                print(f"✗ 无法生成路径 {i+1}/{segment_count}：{start_place.name} -> {end_place.name}")
+                segment.fallback = "simple_line"  # 标记为简单直线连接
+        except Exception as e:
+            print(f"✗ 生成路径时出错 {i+1}/{segment_count}：{start_place.name} -> {end_place.name}, 错误: {e}")
+            segment.fallback = "simple_line"
+        day_plan["routes"].append(segment.to_dict())
+
+def annotate_day_transportation(day_plan: dict, coord_places: list):
+    """第三步：计算相邻地点的直线距离，推荐交通方式并计算交通时间"""
+    # 第二步已获取的驾车时间可以直接复用，避免重复请求
+    driving_seconds = {}
+    for route in day_plan.get("routes", []):
+        if route.get("duration") is not None:
+            driving_seconds[route["sequence"] - 1] = route["duration"]
+
+    for i in range(len(coord_places) - 1):
+        start = coord_places[i]
+        end = coord_places[i + 1]
+
+        if budget_exhausted():
+            # 时间预算已用完，剩余路段在本地估算交通信息
+            estimate_segment_transportation(start, end)
+            continue
+
+        # 计算直线距离（公里）
+        distance_km = geodesic(
+            (start["latitude"], start["longitude"]),
+            (end["latitude"], end["longitude"])
+        ).kilometers
+
+        # 获取交通方式信息
+        transportation_info = recommend_transportation(
+            start["longitude"], start["latitude"],
+            end["longitude"], end["latitude"],
+            distance_km
+        )
+
+        # 更新到起点地点
+        start["transportation"] = transportation_info["default_mode"]
+        start["available_transportations"] = transportation_info["available_modes"]
+
+        if i in driving_seconds:
+            # 第二步获取的驾车时间同样写入缓存，切换到驾车时直接返回
+            transport_cache.set(
+                transport_cache_key(start["longitude"], start["latitude"], end["longitude"], end["latitude"], "driving"),
+                {"time": format_duration_text(driving_seconds[i]), "steps": get_transportation_text("driving")}
+            )
+
+        # 计算交通时间和路线
+        transit_info = get_transit_time_cached(
+            start["longitude"], start["latitude"],
+            end["longitude"], end["latitude"],
+            mode=start["transportation"]
+        )
+
+        start["transition_time"] = transit_info["time"]
+        start["route_steps"] = transit_info["steps"]
+        start.pop("transition_estimated", None)
+        if transit_info["time"] == "交通时间未知" and budget_exhausted():
+            # 请求因时间预算用完而中断，改为本地估算
+            estimate_segment_transportation(start, end)
+
+# 行程补充坐标和路线的整体时间预算（秒），用完后返回已完成的部分并标记未完成的地点和路段
+PLAN_ENRICH_BUDGET = float(os.getenv("PLAN_ENRICH_BUDGET", "25"))
+
+def enrich_plan_data(plan_data: dict, destination: Optional[str], progress=None, days: Optional[set] = None):
+    """
+    为行程中的每个地点获取坐标，生成路径规划数据并计算交通时间
+    指定 days 时只为这些天补充缺少的坐标并重新生成路线，其余天的数据保持不变
+    """
+    if "itinerary" not in plan_data:
+        return
+    start_time = time.perf_counter()
+    with deadline_budget(PLAN_ENRICH_BUDGET):
+        city_info = extract_city_hint(destination)
+        geocode_plan_places(plan_data, city_info, days)
+
+        total_days = len(plan_data["itinerary"])
+        for day_index, day_plan in enumerate(plan_data["itinerary"]):
+            if days is not None and day_plan.get("day") not in days:
+                continue
+            report_progress(progress, 50 + 45 * day_index // max(total_days, 1), f"正在处理第{day_plan.get('day', day_index + 1)}天的路线")
+            if "places" not in day_plan:
+                continue
+            coord_places = [p for p in day_plan["places"] if has_valid_coords(p)]
+            if coord_places:
+                # 地点顺序可能已变化，最后一个地点不再保留之前的交通信息
+                for field in TRANSPORT_FIELDS + ("transition_estimated",):
+                    coord_places[-1].pop(field, None)
+            build_day_routes(day_plan, coord_places)
+            print(f"第{day_plan.get('day')}天：地点 {len(day_plan['places'])} 个，有坐标地点 {len(coord_places)} 个，成功生成路径 {len(day_plan['routes'])} 条")
+            annotate_day_transportation(day_plan, coord_places)
+
+        if budget_exhausted():
+            # 标记为部分结果，前端可按需重新获取未完成的路线
+            plan_data["partial"] = True
+            print(f"警告：行程补充超出时间预算 {PLAN_ENRICH_BUDGET} 秒，返回部分结果")
+        else:
+            plan_data.pop("partial", None)
+    print(f"行程补充坐标和路线耗时 {time.perf_counter() - start_time:.2f} 秒")
+
+# 热门行程缓存：按目的地和天数缓存完整行程，每个目的地最多保存 PLAN_CACHE_VARIANTS 个版本轮换返回
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", "86400"))
+PLAN_CACHE_VARIANTS = int(os.getenv("PLAN_CACHE_VARIANTS", "1"))
+PLAN_CACHE_CHUNK_SIZE = 200
+
+plan_cache = PlanCache(ttl=PLAN_CACHE_TTL, max_variants=PLAN_CACHE_VARIANTS)
+
+# 流式生成行程时，从已输出的文本中识别地点名称，提前查询坐标和同一天相邻地点的交通时间，
+# 随后 /api/trip/plan 补充行程时可以直接命中缓存
+SPECULATIVE_GEOCODE_ENABLED = os.getenv("SPECULATIVE_GEOCODE_ENABLED", "true").lower() == "true"
+# 每次流式生成最多提前查询的地点数量，避免异常输出产生大量无效请求
+SPECULATIVE_GEOCODE_MAX = int(os.getenv("SPECULATIVE_GEOCODE_MAX", "40"))
+speculative_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATIVE_WORKERS", "4")), thread_name_prefix="speculative-geocode"
+)
+# 交通时间预取需要等待坐标查询完成，使用单独的线程池避免与坐标查询互相等待
+speculative_route_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculative-route")
+_speculative_inflight = {}
+_speculative_lock = threading.Lock()
+
+class SpeculativeStats:
+    """统计提前查询的地点数量和命中情况"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"extracted": 0, "submitted": 0, "already_cached": 0, "awaited": 0, "days_prefetched": 0}
+
+    def add(self, name: str, count: int = 1):
+        with self._lock:
+            self.counts[name] += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+speculative_stats = SpeculativeStats()
+
+def inflight_speculative_geocode(key: str) -> Optional[Future]:
+    """返回正在进行中的提前坐标查询"""
+    with _speculative_lock:
+        future = _speculative_inflight.get(key)
+    if future is not None:
+        speculative_stats.add("awaited")
+    return future
+
+def speculative_geocode(name: str, city_info: Optional[str]) -> Optional[Future]:
+    """提前查询地点坐标并写入缓存，已缓存时返回None"""
+    key = geocode_cache_key(name, city_info)
+    if geocode_cache.contains(key):
+        speculative_stats.add("already_cached")
+        return None
+
+    def lookup():
+        try:
+            return get_location_coordinates(name, city_info)
+        finally:
+            with _speculative_lock:
+                _speculative_inflight.pop(key, None)
+
+    with _speculative_lock:
+        future = _speculative_inflight.get(key)
+        if future is None:
+            future = speculative_executor.submit(lookup)
+            _speculative_inflight[key] = future
+            speculative_stats.add("submitted")
+    return future
+
+def speculative_day_routes(names: List[str], city_info: Optional[str]):
+    """等待同一天地点的坐标查询完成后，获取相邻地点的驾车距离和时间并写入缓存"""
+    points = []
+    for name in names:
+        future = inflight_speculative_geocode(geocode_cache_key(name, city_info))
+        coords = None
+        if future is not None:
+            try:
+                coords = future.result(timeout=30)
+            except Exception:
+                coords = None
+        else:
+            coords = geocode_cache.get(geocode_cache_key(name, city_info))
+        if coords and coords[0] is not None and coords[1] is not None:
+            points.append((coords[0], coords[1]))
+    if len(points) >= 2:
+        get_segment_travel_info(points, "driving")
+        speculative_stats.add("days_prefetched")
+
+class SpeculativePlanPrefetcher:
+    """接收流式行程文本，识别出地点后立即提前查询，每天的地点识别完后预取相邻地点的交通时间"""
+
+    def __init__(self, destination: str):
+        self.city_info = extract_city_hint(destination)
+        self.extractor = StreamPlaceExtractor(destination)
+        self.count = 0
+        self.day = None
+        self.day_names = []
+
+    def _finish_day(self):
+        if len(self.day_names) >= 2:
+            speculative_route_executor.submit(speculative_day_routes, list(self.day_names), self.city_info)
+        self.day_names = []
+
+    def _handle(self, found):
+        for day, name in found:
+            if self.count >= SPECULATIVE_GEOCODE_MAX:
+                return
+            if day != self.day:
+                self._finish_day()
+                self.day = day
+            self.count += 1
+            speculative_stats.add("extracted")
+            speculative_geocode(name, self.city_info)
+            self.day_names.append(name)
+
+    def feed(self, text: str):
+        try:
+            self._handle(self.extractor.feed(text))
+        except Exception as e:
+            print(f"提前查询地点坐标失败: {e}")
+
+    def close(self):
+        try:
+            self._handle(self.extractor.flush())
+            self._finish_day()
+        except Exception as e:
+            print(f"提前查询地点坐标失败: {e}")
+
+def build_outline_plan_messages(destination: str, duration: int) -> list:
+    """构建生成行程文本（流式行程规划）的提示词"""
+    prompt = f"""请为用户制定一个详细的{destination}{duration}天旅行行程规划。
 
             要求：
             1. 为每一天按顺序推荐3-4个逻辑上顺路的地点
@@ -1255,12 +2326,31 @@ async def get_trip_plan_stream(request: ItineraryPlanRequest):
             8. 同一天的地点应该地理位置相对集中，便于游览
             9. 每天3-4个地点即可，不要过多"""
 
-            messages = [
-                SystemMessage(content="你是一位专业友好的旅行助手，名叫Trip Copilot。你可以："),
-                HumanMessage(content=prompt)
-            ]
+    return [
+        SystemMessage(content="你是一位专业友好的旅行助手，名叫Trip Copilot。你可以："),
+        HumanMessage(content=prompt)
+    ]
+
+@app.post("/api/trip/streamplan", response_model=ItineraryPlanResponse)
+async def get_trip_plan_stream(request: ItineraryPlanRequest):
+    def generate_response():
+        """生成行程规划的Server-Sent Events流"""
+        try:
+            cached_text = None
+            if PLAN_CACHE_ENABLED and request.use_cache:
+                cached_text = plan_cache.next_text(request.destination, request.duration)
+            if cached_text:
+                # 命中热门行程缓存，分段返回已生成的行程文本
+                for i in range(0, len(cached_text), PLAN_CACHE_CHUNK_SIZE):
+                    yield f"data: {json.dumps({'content': cached_text[i:i + PLAN_CACHE_CHUNK_SIZE], 'type': 'chunk'})}\n\n"
+                yield f"data: {json.dumps({'type': 'end'})}\n\n"
+                return
+
+            llm = get_tongyi_client()
+            messages = build_outline_plan_messages(request.destination, request.duration)
+            prefetcher = SpeculativePlanPrefetcher(request.destination) if SPECULATIVE_GEOCODE_ENABLED else None
 
-            response = llm.stream(messages)
+            response = stream_llm(llm, messages)
             for chunk in response:
                 content = chunk.content
                 if isinstance(content, list):
@@ -1274,6 +2364,10 @@ async def get_trip_plan_stream(request: ItineraryPlanRequest):
                 if content:
                     # 发送 SSE 数据
                     yield f"data: {json.dumps({'content': str(content), 'type': 'chunk'})}\n\n"
+                    if prefetcher:
+                        prefetcher.feed(str(content))
+            if prefetcher:
+                prefetcher.close()
             # 发送结束标记
             yield f"data: {json.dumps({'type': 'end'})}\n\n"
 
@@ -1294,16 +2388,27 @@ async def get_trip_plan_stream(request: ItineraryPlanRequest):
     )
 
 
-# 新增行程规划API
-@app.post("/api/trip/plan", response_model=ItineraryPlanResponse)
-async def get_trip_plan(request: FinePlanRequest):
-    """获取完整的行程规划，包含每日详细安排、地点坐标和路径规划数据"""
-    try:
-        # 获取通义千问客户端
-        llm = get_tongyi_client()
-        
-        # 构建高级LLM Prompt
-        prompt = f"""给你一个已经计划好的行程规划，你必须严格按照要求的JSON格式返回结果，每个地点按照省市+具体地点名称的形式输出。
+def report_progress(progress, percent: int, message: str):
+    """向任务队列报告进度，progress 为空时忽略"""
+    if progress:
+        progress(percent, message)
+
+def generate_trip_plan(request: FinePlanRequest, progress=None) -> dict:
+    """
+    调用大模型生成结构化行程，并补充坐标、路线和交通信息
+    progress 为可选的进度回调 progress(百分比, 描述)，失败时抛出异常
+    """
+    if PLAN_CACHE_ENABLED and request.use_cache:
+        cached_plan = plan_cache.get_plan(request.destination, request.duration, request.plan)
+        if cached_plan is not None:
+            print(f"命中热门行程缓存：{request.destination}{request.duration}天")
+            return plan_store.save(cached_plan)
+
+    # 获取通义千问客户端
+    llm = get_tongyi_client()
+    
+    # 构建高级LLM Prompt
+    prompt = f"""给你一个已经计划好的行程规划，你必须严格按照要求的JSON格式返回结果，每个地点按照省市+具体地点名称的形式输出。
         
         返回格式示例：
         {{
@@ -1349,161 +2454,54 @@ async def get_trip_plan(request: FinePlanRequest):
           ]
         }}
         """
-        
-        # 使用通义千问生成行程规划
-        messages = [
-            SystemMessage(content=prompt),
-            HumanMessage(content=request.plan)
-        ]
-        
-        response = llm.invoke(messages)
-        
-        # 处理AI响应内容
-        ai_content = response.content
-        if isinstance(ai_content, list):
-            text_content = ""
-            for item in ai_content:
-                if isinstance(item, dict) and "text" in item:
-                    text_content += item["text"]
-                elif isinstance(item, str):
-                    text_content += item
-            ai_content = text_content
-        # 解析JSON
-        
-        # 提取JSON部分
-        json_match = re.search(r'\{.*\}', str(ai_content), re.DOTALL)
-        if not json_match:
-            raise ValueError("AI返回的内容不包含有效的JSON格式")
-        
-        json_str = json_match.group()
-        plan_data = json.loads(json_str)
-        
-        # 为每个地点获取坐标并生成路径规划
-        if "itinerary" in plan_data:
-            for day_plan in plan_data["itinerary"]:
-                if "places" in day_plan:
-                    # 第一步：为每个地点获取坐标
-                    valid_places = []
-                    for place in day_plan["places"]:
-                        if "name" in place:
-                            # 尝试从地点名称中提取城市信息
-                            place_name = place["name"]
-                            city_info = None
-                            
-                            # 从目的地中提取城市信息
-                            if request.destination:
-                                # 简单提取：如果目的地包含"市"，则提取城市部分
-                                if "市" in request.destination:
-                                    city_parts = request.destination.split("市")
-                                    if len(city_parts) > 0:
-                                        city_info = city_parts[0] + "市"
-                                elif "省" in request.destination and len(request.destination) > 2:
-                                    # 如果是省份，提取省份信息
-                                    city_info = request.destination
-                            
-                            lng, lat = get_location_coordinates(place_name, city_info)
-                            if lng is not None and lat is not None:
-                                # 确保坐标是有效的浮点数
-                                try:
-                                    place["longitude"] = float(lng)
-                                    place["latitude"] = float(lat)
-                                    # 验证坐标范围
-                                    if (-180 <= place["longitude"] <= 180 and -90 <= place["latitude"] <= 90):
-                                        valid_places.append(place)
-                                    else:
-                                        print(f"警告：地点 '{place['name']}' 坐标超出有效范围: ({lng}, {lat})")
-                                        place["longitude"] = None
-                                        place["latitude"] = None
-                                except (ValueError, TypeError):
-                                    print(f"警告：地点 '{place['name']}' 坐标转换失败: ({lng}, {lat})")
-                                    place["longitude"] = None
-                                    place["latitude"] = None
-                            else:
-                                place["longitude"] = None
-                                place["latitude"] = None
-                                print(f"警告：无法获取地点 '{place['name']}' 的坐标")
-                    
-                    # 第二步：为相邻地点生成路径规划数据
-                    day_plan["routes"] = []
-                    if len(valid_places) >= 2:
-                        print(f"第{day_plan['day']}天开始生成 {len(valid_places)-1} 条路径...")
-                        for i in range(len(valid_places) - 1):
-                            start_place = valid_places[i]
-                            end_place = valid_places[i + 1]
-                            
-                            # 获取两地点间的路径规划
-                            try:
-                                route_data = get_route_planning(
-                                    (start_place["longitude"], start_place["latitude"]),
-                                    (end_place["longitude"], end_place["latitude"]),
-                                    "driving"  # 默认使用驾车模式
-                                )
-                                
-                                if route_data and route_data.get("status") == "1":
-                                    # 构建路径数据，参考手动路径规划的数据结构
-                                    route_info = {
-                                        "start_point": {
-                                            "name": start_place["name"],
-                                            "longitude": start_place["longitude"],
-                                            "latitude": start_place["latitude"]
-                                        },
-                                        "end_point": {
-                                            "name": end_place["name"],
-                                            "longitude": end_place["longitude"],
-                                            "latitude": end_place["latitude"]
-                                        },
-                                        "mode": "driving",
-                                        "route_info": route_data.get("route", {}),
-                                        "raw_data": route_data,
-                                        "sequence": i + 1  # 标记这是第几段路径
-                                    }
-                                    day_plan["routes"].append(route_info)
-                                    print(f"✓ 成功生成路径 {i+1}/{len(valid_places)-1}：{start_place['name']} -> {end_place['name']}")
-                                else:
-                                    print(f"✗ 无法生成路径 {i+1}/{len(valid_places)-1}：{start_place['name']} -> {end_place['name']}")
-                            except Exception as e:
-                                print(f"✗ 生成路径时出错 {i+1}/{len(valid_places)-1}：{start_place['name']} -> {end_place['name']}, 错误: {e}")
-                    
-                    print(f"第{day_plan['day']}天：有效地点 {len(valid_places)} 个，成功生成路径 {len(day_plan['routes'])} 条")
-        
-        # 在生成行程后添加交通时间计算
-        if "itinerary" in plan_data:
-            for day_plan in plan_data["itinerary"]:
-                if "places" in day_plan:
-                    # 计算直线距离并推荐交通方式
-                    valid_places = [p for p in day_plan["places"] if "longitude" in p and "latitude" in p]
-                    
-                    if len(valid_places) >= 2:
-                        for i in range(len(valid_places) - 1):
-                            start = valid_places[i]
-                            end = valid_places[i + 1]
-                            
-                            # 计算直线距离（公里）
-                            distance_km = geodesic(
-                                (start["latitude"], start["longitude"]),
-                                (end["latitude"], end["longitude"])
-                            ).kilometers
-                            
-                            # 获取交通方式信息
-                            transportation_info = recommend_transportation(
-                                start["longitude"], start["latitude"],
-                                end["longitude"], end["latitude"],
-                                distance_km
-                            )
-                            
-                            # 更新到起点地点
-                            start["transportation"] = transportation_info["default_mode"]
-                            start["available_transportations"] = transportation_info["available_modes"]
-
-                            # 计算交通时间和路线
-                            transit_info = get_transit_time(
-                                start["longitude"], start["latitude"],
-                                end["longitude"], end["latitude"],
-                                mode=start["transportation"]
-                            )
-
-                            start["transition_time"] = transit_info["time"]
-                            start["route_steps"] = transit_info["steps"]
+    
+    # 使用通义千问生成行程规划
+    messages = [
+        SystemMessage(content=prompt),
+        HumanMessage(content=request.plan)
+    ]
+    
+    report_progress(progress, 10, "正在生成详细行程")
+    response = invoke_llm(llm, messages)
+    
+    # 处理AI响应内容
+    ai_content = response.content
+    if isinstance(ai_content, list):
+        text_content = ""
+        for item in ai_content:
+            if isinstance(item, dict) and "text" in item:
+                text_content += item["text"]
+            elif isinstance(item, str):
+                text_content += item
+        ai_content = text_content
+    # 解析JSON
+    
+    # 提取JSON部分
+    json_match = re.search(r'\{.*\}', str(ai_content), re.DOTALL)
+    if not json_match:
+        raise ValueError("AI返回的内容不包含有效的JSON格式")
+    
+    json_str = json_match.group()
+    plan_data = json.loads(json_str)
+    
+    # 为每个地点获取坐标、生成路径规划并计算交通时间
+    report_progress(progress, 40, "正在获取地点坐标和路线")
+    enrich_plan_data(plan_data, request.destination, progress)
+
+    # 只缓存完整的结果，超出时间预算的部分结果下次重新生成
+    if PLAN_CACHE_ENABLED and not plan_data.get("partial"):
+        plan_cache.put(request.destination, request.duration, request.plan, plan_data)
+    return plan_store.save(plan_data)
+
+# 新增行程规划API
+@app.post("/api/trip/plan", response_model=ItineraryPlanResponse, response_class=FastJSONResponse)
+def get_trip_plan(request: FinePlanRequest, background_tasks: BackgroundTasks):
+    """获取完整的行程规划，包含每日详细安排、地点坐标和路径规划数据"""
+    try:
+        plan_data = generate_trip_plan(request)
+
+        # 返回后在后台预计算其他交通方式
+        background_tasks.add_task(precompute_plan_transportations, plan_data)
 
         return ItineraryPlanResponse(
             success=True,
@@ -1526,20 +2524,108 @@ async def get_trip_plan(request: FinePlanRequest):
             error_message=f"服务器内部错误: {str(e)}"
         )
 
-# 新增：行程更新API
-@app.post("/api/trip/update", response_model=ItineraryUpdateResponse)
-async def update_trip_plan(request: ItineraryUpdateRequest):
-    """根据用户的修改要求更新已有的行程规划"""
+def generate_plan_patch(llm, request: ItineraryUpdateRequest, current_plan_str: str, compact_level: int, progress=None) -> tuple:
+    """
+    让大模型只返回编辑操作并在本地应用，返回 (更新后的行程, 受影响的天数集合)
+    大模型认为无法用编辑操作表达、返回内容无效或操作无法应用时抛出 PlanPatchError
+    """
+    prompt = f"""
+你是一个智能行程规划编辑助手。请根据用户的修改要求，给出对已有旅行计划的最少编辑操作，不要重新输出整份行程。
+
+**当前行程规划 (JSON格式):**
+{current_plan_str}
+
+**用户的修改要求:**
+"{request.modification_request}"
+
+**可用的编辑操作:**
+- 新增地点：{{"op": "add", "day": 天数, "position": 插入位置(从1开始，可省略表示放在当天最后), "place": {{"name": "地点名称", "description": "地点详细描述", "duration": 建议停留小时数}}}}
+- 删除地点：{{"op": "remove", "day": 天数, "name": "原地点名称"}}
+- 替换地点：{{"op": "replace", "day": 天数, "name": "原地点名称", "place": {{"name": "新地点名称", "description": "地点详细描述", "duration": 建议停留小时数}}}}
+- 移动地点：{{"op": "move", "day": 原天数, "name": "原地点名称", "to_day": 目标天数, "position": 目标位置(从1开始，可省略)}}
+
+**要求:**
+1. 原地点名称必须与当前行程中的名称完全一致。
+2. 新地点按照"省市+具体地点名称"的格式，例如"四川省成都市武侯祠"，并包含详细描述和建议停留时间。
+3. 保持每天的地点数量适中（3-4个），确保地理位置相对集中。
+4. 如果修改要求无法用上述操作完成（例如增减天数、修改主题或整体重新规划），返回 {{"unsupported": true}}。
+
+请只返回如下格式的JSON，不要包含任何额外的解释性文字：
+{{"operations": [编辑操作列表]}}
+"""
+
+    messages = [
+        SystemMessage(content="你是一个JSON编辑专家，专门把修改旅行计划的指令转换为编辑操作。"),
+        HumanMessage(content=prompt)
+    ]
+    prompt_metrics.record(
+        "update_patch",
+        estimate_tokens(prompt),
+        estimate_tokens(json.dumps(request.current_plan, ensure_ascii=False)) + estimate_tokens(prompt) - estimate_tokens(current_plan_str),
+        compact_level
+    )
+
+    report_progress(progress, 10, "正在根据修改要求更新行程")
+    response = invoke_llm(llm, messages)
+
+    ai_content = response.content
+    if isinstance(ai_content, list):
+        text_content = ""
+        for item in ai_content:
+            if isinstance(item, dict) and "text" in item:
+                text_content += item["text"]
+            elif isinstance(item, str):
+                text_content += item
+        ai_content = text_content
+    print(f"AI编辑操作响应: {str(ai_content)[:200]}")
+
+    json_match = re.search(r'\{.*\}', str(ai_content), re.DOTALL)
+    if not json_match:
+        raise PlanPatchError("AI返回的内容不包含有效的JSON格式")
     try:
-        llm = get_tongyi_client()
+        patch = json.loads(json_match.group())
+    except json.JSONDecodeError as je:
+        raise PlanPatchError(f"无法解析返回的编辑操作: {str(je)}")
+    if not isinstance(patch, dict) or patch.get("unsupported"):
+        raise PlanPatchError("修改要求无法用编辑操作表达")
 
-        # 创建精简版行程数据，移除路径规划详情以减少输入大小
-        simplified_plan = simplify_plan_for_llm(request.current_plan)
-        
-        # 将精简后的行程JSON转换为字符串以便传递给LLM
-        current_plan_str = json.dumps(simplified_plan, ensure_ascii=False, indent=2)
+    # 大模型给出的地点名称可能省略了省市前缀，按去掉省市前缀后的核心名称匹配
+    updated_plan_data, touched_days = apply_plan_operations(
+        request.current_plan, patch.get("operations"), place_key=lambda name: place_alias_index.split(name)[1]
+    )
+    print(f"应用 {len(patch['operations'])} 个编辑操作，受影响的天数: {sorted(touched_days, key=str)}")
+    return updated_plan_data, touched_days
+
+def generate_updated_plan(request: ItineraryUpdateRequest, progress=None) -> dict:
+    """
+    根据用户的修改要求调用大模型更新行程，并重新补充坐标、路线和交通信息
+    progress 为可选的进度回调 progress(百分比, 描述)，失败时抛出异常
+    """
+    # 客户端只传行程ID时从服务端读取行程，版本不一致时拒绝修改
+    request.current_plan = resolve_request_plan(request.current_plan, request.plan_id, request.plan_version)
+    if not request.current_plan:
+        raise ValueError("缺少当前行程，请提供 current_plan 或 plan_id")
+    plan_id = request.plan_id or request.current_plan.get("plan_id")
+    # 修改所基于的版本，保存时服务端已有更新的版本则拒绝覆盖
+    base_version = request.current_plan.get(PLAN_VERSION_FIELD)
 
-        prompt = f"""
+    llm = get_tongyi_client()
+
+    # 只保留地点名称、描述和停留时间，并按token预算压缩行程
+    current_plan_str, compact_level = serialize_plan_for_prompt(request.current_plan, UPDATE_PLAN_TOKEN_BUDGET)
+
+    if request.edit_mode != "full":
+        try:
+            updated_plan_data, touched_days = generate_plan_patch(llm, request, current_plan_str, compact_level, progress)
+        except PlanPatchError as e:
+            print(f"增量编辑失败，改为返回完整行程: {e}")
+        else:
+            # 只为受影响的天补充新地点的坐标并重新生成路线
+            report_progress(progress, 40, "正在更新地点坐标和路线")
+            enrich_plan_data(updated_plan_data, updated_plan_data.get("destination"), progress, days=touched_days)
+            return plan_store.save(updated_plan_data, plan_id, base_version)
+
+    prompt = f"""
 你是一个智能行程规划编辑助手。你的任务是根据用户的修改要求，更新一份已有的JSON格式的旅行计划。
 
 **当前行程规划 (JSON格式):**
@@ -1559,187 +2645,78 @@ async def update_trip_plan(request: ItineraryUpdateRequest):
 请严格按照以下JSON格式返回，不要包含任何额外的解释性文字：
 """
 
-        messages = [
-            SystemMessage(content="你是一个JSON编辑专家，专门根据指令修改旅行计划。"),
-            HumanMessage(content=prompt)
-        ]
+    messages = [
+        SystemMessage(content="你是一个JSON编辑专家，专门根据指令修改旅行计划。"),
+        HumanMessage(content=prompt)
+    ]
 
-        try:
-            # 检查请求大小，并打印调试信息
-            request_size = len(current_plan_str)
-            print(f"发送给LLM的请求大小: {request_size} 字符")
-            if request_size > 100000:
-                print("警告: 请求大小接近模型限制")
-
-            # 调用LLM
-            response = llm.invoke(messages)
+    prompt_metrics.record(
+        "update",
+        estimate_tokens(prompt),
+        estimate_tokens(json.dumps(request.current_plan, ensure_ascii=False)) + estimate_tokens(prompt) - estimate_tokens(current_plan_str),
+        compact_level
+    )
+
+    try:
+        # 调用LLM
+        report_progress(progress, 10, "正在根据修改要求更新行程")
+        response = invoke_llm(llm, messages)
+        
+        # 处理AI响应内容
+        ai_content = response.content
+        if isinstance(ai_content, list):
+            text_content = ""
+            for item in ai_content:
+                if isinstance(item, dict) and "text" in item:
+                    text_content += item["text"]
+                elif isinstance(item, str):
+                    text_content += item
+            ai_content = text_content
+
+        # 打印响应长度和前100个字符用于调试
+        content_length = len(str(ai_content))
+        print(f"AI响应长度: {content_length} 字符")
+        print(f"AI响应前100个字符: {str(ai_content)[:100]}")
+
+        # 提取JSON部分
+        json_match = re.search(r'\{.*\}', str(ai_content), re.DOTALL)
+        if not json_match:
+            raise ValueError("AI返回的内容不包含有效的JSON格式，可能是输入内容过长导致模型响应不完整")
             
-            # 处理AI响应内容
-            ai_content = response.content
-            if isinstance(ai_content, list):
-                text_content = ""
-                for item in ai_content:
-                    if isinstance(item, dict) and "text" in item:
-                        text_content += item["text"]
-                    elif isinstance(item, str):
-                        text_content += item
-                ai_content = text_content
-
-            # 打印响应长度和前100个字符用于调试
-            content_length = len(str(ai_content))
-            print(f"AI响应长度: {content_length} 字符")
-            print(f"AI响应前100个字符: {str(ai_content)[:100]}")
-
-            # 提取JSON部分
-            json_match = re.search(r'\{.*\}', str(ai_content), re.DOTALL)
-            if not json_match:
-                raise ValueError("AI返回的内容不包含有效的JSON格式，可能是输入内容过长导致模型响应不完整")
-                
-        except Exception as e:
-            error_msg = f"处理AI响应失败: {str(e)}"
-            print(error_msg)
-            if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                print(f"API错误详情: {e.response.text}")
-            raise ValueError(error_msg)
+    except Exception as e:
+        error_msg = f"处理AI响应失败: {str(e)}"
+        print(error_msg)
+        if hasattr(e, 'response') and hasattr(e.response, 'text'):
+            print(f"API错误详情: {e.response.text}")
+        raise ValueError(error_msg)
+
+    # 提取JSON并解析
+    json_str = json_match.group()
+    try:
+        updated_plan_data = json.loads(json_str)
+    except json.JSONDecodeError as je:
+        print(f"JSON解析失败: {str(je)}")
+        print(f"JSON内容: {json_str[:200]}...")
+        raise ValueError(f"无法解析返回的JSON: {str(je)}")
 
-        # 提取JSON并解析
-        json_str = json_match.group()
-        try:
-            updated_plan_data = json.loads(json_str)
-        except json.JSONDecodeError as je:
-            print(f"JSON解析失败: {str(je)}")
-            print(f"JSON内容: {json_str[:200]}...")
-            raise ValueError(f"无法解析返回的JSON: {str(je)}")
-
-        # 为更新后的行程中的每个地点重新获取坐标并计算交通信息
-        if "itinerary" in updated_plan_data:
-            for day_plan in updated_plan_data["itinerary"]:
-                if "places" in day_plan:
-                    # 第一步：为每个地点获取坐标
-                    valid_places = []
-                    for place in day_plan["places"]:
-                        if "name" in place:
-                            # 尝试从地点名称中提取城市信息
-                            place_name = place["name"]
-                            city_info = None
-                            
-                            # 从目的地中提取城市信息
-                            if updated_plan_data.get("destination"):
-                                destination = updated_plan_data["destination"]
-                                if "市" in destination:
-                                    city_parts = destination.split("市")
-                                    if len(city_parts) > 0:
-                                        city_info = city_parts[0] + "市"
-                                elif "省" in destination and len(destination) > 2:
-                                    city_info = destination
-                            
-                            lng, lat = get_location_coordinates(place_name, city_info)
-                            if lng is not None and lat is not None:
-                                try:
-                                    place["longitude"] = float(lng)
-                                    place["latitude"] = float(lat)
-                                    # 验证坐标范围
-                                    if (-180 <= place["longitude"] <= 180 and -90 <= place["latitude"] <= 90):
-                                        valid_places.append(place)
-                                    else:
-                                        print(f"警告：地点 '{place['name']}' 坐标超出有效范围: ({lng}, {lat})")
-                                        place["longitude"] = None
-                                        place["latitude"] = None
-                                        valid_places.append(place)  # 仍然保留，但坐标为空
-                                except (ValueError, TypeError):
-                                    print(f"警告：地点 '{place['name']}' 坐标转换失败: ({lng}, {lat})")
-                                    place["longitude"] = None
-                                    place["latitude"] = None
-                                    valid_places.append(place)  # 仍然保留，但坐标为空
-                            else:
-                                place["longitude"] = None
-                                place["latitude"] = None
-                                valid_places.append(place)  # 仍然保留，但坐标为空
-                                print(f"警告：无法获取地点 '{place['name']}' 的坐标")
-                    
-                    # 更新places列表
-                    day_plan["places"] = valid_places
-                    
-                    # 第二步：为相邻地点生成路径规划数据
-                    day_plan["routes"] = []
-                    valid_coord_places = [p for p in valid_places if p.get("longitude") and p.get("latitude")]
-                    
-                    if len(valid_coord_places) >= 2:
-                        print(f"第{day_plan['day']}天开始生成 {len(valid_coord_places)-1} 条路径...")
-                        for i in range(len(valid_coord_places) - 1):
-                            start_place = valid_coord_places[i]
-                            end_place = valid_coord_places[i + 1]
-                            
-                            try:
-                                route_data = get_route_planning(
-                                    (start_place["longitude"], start_place["latitude"]),
-                                    (end_place["longitude"], end_place["latitude"]),
-                                    "driving"  # 默认使用驾车模式
-                                )
-                                
-                                if route_data and route_data.get("status") == "1":
-                                    route_info = {
-                                        "start_point": {
-                                            "name": start_place["name"],
-                                            "longitude": start_place["longitude"],
-                                            "latitude": start_place["latitude"]
-                                        },
-                                        "end_point": {
-                                            "name": end_place["name"],
-                                            "longitude": end_place["longitude"],
-                                            "latitude": end_place["latitude"]
-                                        },
-                                        "mode": "driving",
-                                        "route_info": route_data.get("route", {}),
-                                        "raw_data": route_data,
-                                        "sequence": i + 1
-                                    }
-                                    day_plan["routes"].append(route_info)
-                                    print(f"✓ 成功生成路径 {i+1}/{len(valid_coord_places)-1}：{start_place['name']} -> {end_place['name']}")
-                                else:
-                                    print(f"✗ 无法生成路径 {i+1}/{len(valid_coord_places)-1}：{start_place['name']} -> {end_place['name']}")
-                            except Exception as e:
-                                print(f"✗ 生成路径时出错 {i+1}/{len(valid_coord_places)-1}：{start_place['name']} -> {end_place['name']}, 错误: {e}")
-                    
-                    print(f"第{day_plan['day']}天：有效地点 {len(valid_places)} 个，有坐标地点 {len(valid_coord_places)} 个，成功生成路径 {len(day_plan['routes'])} 条")
-
-        # 第三步：计算交通时间和推荐交通方式（复用原有逻辑）
-        if "itinerary" in updated_plan_data:
-            for day_plan in updated_plan_data["itinerary"]:
-                if "places" in day_plan:
-                    valid_places = [p for p in day_plan["places"] if p.get("longitude") and p.get("latitude")]
-                    
-                    if len(valid_places) >= 2:
-                        for i in range(len(valid_places) - 1):
-                            start = valid_places[i]
-                            end = valid_places[i + 1]
-                            
-                            # 计算直线距离（公里）
-                            distance_km = geodesic(
-                                (start["latitude"], start["longitude"]),
-                                (end["latitude"], end["longitude"])
-                            ).kilometers
-                            
-                            # 获取交通方式信息
-                            transportation_info = recommend_transportation(
-                                start["longitude"], start["latitude"],
-                                end["longitude"], end["latitude"],
-                                distance_km
-                            )
-                            
-                            # 更新到起点地点
-                            start["transportation"] = transportation_info["default_mode"]
-                            start["available_transportations"] = transportation_info["available_modes"]
-
-                            # 计算交通时间和路线
-                            transit_info = get_transit_time(
-                                start["longitude"], start["latitude"],
-                                end["longitude"], end["latitude"],
-                                mode=start["transportation"]
-                            )
-
-                            start["transition_time"] = transit_info["time"]
-                            start["route_steps"] = transit_info["steps"]
+    # 提示词中被截断的描述按原行程恢复
+    if compact_level > 0:
+        restore_place_descriptions(updated_plan_data, request.current_plan)
+
+    # 为更新后的行程中的每个地点重新获取坐标并计算交通信息
+    report_progress(progress, 40, "正在更新地点坐标和路线")
+    enrich_plan_data(updated_plan_data, updated_plan_data.get("destination"), progress)
+    return plan_store.save(updated_plan_data, plan_id, base_version)
+
+# 新增：行程更新API
+@app.post("/api/trip/update", response_model=ItineraryUpdateResponse, response_class=FastJSONResponse)
+def update_trip_plan(request: ItineraryUpdateRequest, background_tasks: BackgroundTasks):
+    """根据用户的修改要求更新已有的行程规划"""
+    try:
+        updated_plan_data = generate_updated_plan(request)
+
+        # 返回后在后台预计算其他交通方式
+        background_tasks.add_task(precompute_plan_transportations, updated_plan_data)
 
         return ItineraryUpdateResponse(
             success=True,
@@ -1754,7 +2731,8 @@ async def update_trip_plan(request: ItineraryUpdateRequest):
     except ValueError as ve:
         return ItineraryUpdateResponse(
             success=False,
-            error_message=str(ve)
+            error_message=str(ve),
+            error_code=getattr(ve, "error_code", None)
         )
     except Exception as e:
         return ItineraryUpdateResponse(
@@ -1762,9 +2740,281 @@ async def update_trip_plan(request: ItineraryUpdateRequest):
             error_message=f"更新行程时发生错误: {str(e)}"
         )
 
+# 异步任务队列配置：工作线程数、最大排队任务数、结果保留时间（秒）和本地存储路径
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "50"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+# 任务心跳刷新间隔（秒）；启动时心跳超过 JOB_STALE_AFTER 秒未刷新的其他worker的任务视为已中断
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+
+job_queue = JobQueue(
+    JobStore(JOB_DB_PATH, heartbeat_interval=JOB_HEARTBEAT_INTERVAL), max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, result_ttl=JOB_RESULT_TTL,
+    kinds=("plan", "update")
+)
+
+def submit_job(kind: str, func, request) -> JobSubmitResponse:
+    """提交行程任务，完成后在同一工作线程中预计算其他交通方式"""
+    try:
+        job_id = job_queue.submit(kind, func, request, on_success=precompute_plan_transportations)
+        return JobSubmitResponse(success=True, job_id=job_id, status="queued")
+    except QueueFullError as e:
+        return JobSubmitResponse(success=False, error_message=str(e))
+
+# 异步行程规划API：立即返回任务ID
+@app.post("/api/jobs/plan", response_model=JobSubmitResponse)
+async def submit_plan_job(request: FinePlanRequest):
+    """提交行程规划任务，结果通过 /api/jobs/{job_id} 获取"""
+    return submit_job("plan", generate_trip_plan, request)
+
+# 异步行程更新API：立即返回任务ID
+@app.post("/api/jobs/update", response_model=JobSubmitResponse)
+async def submit_update_job(request: ItineraryUpdateRequest):
+    """提交行程更新任务，结果通过 /api/jobs/{job_id} 获取"""
+    return submit_job("update", generate_updated_plan, request)
+
+# 查询任务状态API
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse, response_class=FastJSONResponse)
+async def get_job_status(job_id: str):
+    """轮询任务的状态、进度和结果"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return JobStatusResponse(success=False, error_message="任务不存在或结果已过期")
+    return JobStatusResponse(success=True, job=job)
+
+# 订阅任务进度API
+@app.get("/api/jobs/{job_id}/events")
+async def subscribe_job_events(job_id: str):
+    """以Server-Sent Events流的形式推送任务进度，任务结束后发送结果和结束标记"""
+
+    async def generate_events():
+        last_updated = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield f"data: {json.dumps({'type': 'error', 'content': '任务不存在或结果已过期'}, ensure_ascii=False)}\n\n"
+                break
+            if job["updated_at"] != last_updated:
+                last_updated = job["updated_at"]
+                if job["status"] in TERMINAL_STATES:
+                    yield f"data: {json.dumps({'type': 'result', 'job': job}, ensure_ascii=False)}\n\n"
+                    break
+                progress = {key: job[key] for key in ("status", "progress", "message")}
+                yield f"data: {json.dumps({'type': 'progress', **progress}, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0.5)
+        yield f"data: {json.dumps({'type': 'end'})}\n\n"
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Content-Type": "text/event-stream",
+        }
+    )
+
+# 热门目的地预热：服务启动后在后台预先填充坐标、路线、城市、公交站点和天气缓存
+# PREWARM_DESTINATIONS 为逗号分隔的目的地列表，PREWARM_PLANS=true 时同时生成并缓存完整行程
+PREWARM_DESTINATIONS = [d.strip() for d in os.getenv("PREWARM_DESTINATIONS", "").split(",") if d.strip()]
+def parse_prewarm_days(value: str, default: List[int]) -> List[int]:
+    """解析逗号分隔的预热天数，忽略无效的值并打印警告，没有有效值时使用默认值"""
+    days = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            day = int(item)
+        except ValueError:
+            day = 0
+        if day <= 0:
+            print(f"警告：PREWARM_DAYS 中的 '{item}' 不是有效的天数，已忽略")
+            continue
+        days.append(day)
+    return days or list(default)
+
+PREWARM_DAYS = parse_prewarm_days(os.getenv("PREWARM_DAYS", "3"), [3])
+PREWARM_PLANS = os.getenv("PREWARM_PLANS", "false").lower() in ("1", "true", "yes")
+# 每个目的地预热的热门景点数量
+PREWARM_POIS_PER_CITY = int(os.getenv("PREWARM_POIS_PER_CITY", "10"))
+
+# 预热等维护任务使用独立的单线程队列，不占用行程任务的工作线程
+maintenance_queue = JobQueue(job_queue.store, max_workers=1, max_pending=5, result_ttl=JOB_RESULT_TTL, kinds=("prewarm",))
+
+def search_popular_pois(destination: str, limit: int) -> List[dict]:
+    """搜索目的地的热门景点，返回名称、坐标和所在省市"""
+    params = {
+        "keywords": "景点",
+        "types": "110000",
+        "city": destination,
+        "citylimit": "true",
+        "offset": limit,
+        "page": 1
+    }
+    data = amap_get("https://restapi.amap.com/v3/place/text", params)
+    if data.get("status") != "1":
+        return []
+    pois = []
+    for poi in data.get("pois") or []:
+        location_str = poi.get("location")
+        if not isinstance(location_str, str) or "," not in location_str:
+            continue
+        longitude_str, latitude_str = location_str.split(",")
+        pois.append({
+            "id": poi.get("id") if isinstance(poi.get("id"), str) else "",
+            "name": poi.get("name", ""),
+            "longitude": float(longitude_str),
+            "latitude": float(latitude_str),
+            "cityname": poi.get("cityname") if isinstance(poi.get("cityname"), str) else "",
+            "pname": poi.get("pname") if isinstance(poi.get("pname"), str) else ""
+        })
+    return pois[:limit]
+
+def prewarm_destination(destination: str, days: List[int], include_plans: bool) -> dict:
+    """预热单个目的地的各类缓存，返回预热的景点、路段和行程数量"""
+    counts = {"places": 0, "segments": 0, "plans": 0}
+    city_info = extract_city_hint(destination)
+
+    # 目的地本身的坐标、所在城市和天气
+    lng, lat = get_location_coordinates(destination, city_info)
+    if lng is not None and lat is not None:
+        extract_city_from_coords(lng, lat)
+    fetch_weather_casts(destination, priority=PRIORITY_BACKGROUND)
+
+    # 热门景点的坐标、所在城市和附近公交站点
+    pois = search_popular_pois(destination, PREWARM_POIS_PER_CITY)
+    for poi in pois:
+        # 大模型输出的 "省市+景点名称" 等写法规范化后都解析为该POI，只需缓存一次
+        place_alias_index.learn_poi(poi["name"], city_info, poi)
+        geocode_cache.set(geocode_cache_key(poi["name"], city_info), (poi["longitude"], poi["latitude"]))
+        extract_city_from_coords(poi["longitude"], poi["latitude"])
+        has_nearby_transit_station(poi["longitude"], poi["latitude"])
+        counts["places"] += 1
+
+    # 按游览顺序预热相邻景点间的路线和推荐交通方式的交通时间
+    if len(pois) >= 2:
+        points = [(poi["longitude"], poi["latitude"]) for poi in pois]
+        order = solve_open_tsp(build_distance_matrix(points), fix_start=False)
+        for start_index, end_index in zip(order, order[1:]):
+            start, end = pois[start_index], pois[end_index]
+            get_route_planning((start["longitude"], start["latitude"]), (end["longitude"], end["latitude"]), "driving")
+            transportation = recommend_transportation(
+                start["longitude"], start["latitude"], end["longitude"], end["latitude"],
+                haversine_km(start["longitude"], start["latitude"], end["longitude"], end["latitude"])
+            )
+            get_transit_time_cached(
+                start["longitude"], start["latitude"], end["longitude"], end["latitude"],
+                mode=transportation["default_mode"]
+            )
+            counts["segments"] += 1
+
+    # 可选：生成并缓存完整行程，行程中的坐标和路线同时写入上面的缓存
+    if include_plans and PLAN_CACHE_ENABLED:
+        llm = get_tongyi_client()
+        for duration in days:
+            # 只检查版本数量，不能调用 next_text，否则每次预热都会改变下一个用户拿到的版本
+            if plan_cache.variant_count(destination, duration) >= plan_cache.max_variants:
+                continue
+            response = invoke_llm(llm, build_outline_plan_messages(destination, duration))
+            outline = response.content
+            if isinstance(outline, list):
+                outline = "".join(item["text"] if isinstance(item, dict) else str(item) for item in outline)
+            plan_data = generate_trip_plan(FinePlanRequest(plan=str(outline), destination=destination, duration=duration))
+            precompute_segments(plan_data)
+            counts["plans"] += 1
+    return counts
+
+def prewarm_destinations(destinations: List[str], days: List[int], include_plans: bool = False, progress=None) -> dict:
+    """
+    依次预热多个目的地，所有高德地图请求使用后台优先级，经限流器排队，不会挤占用户请求的配额
+    单个目的地失败不影响其他目的地，返回预热汇总
+    """
+    start_time = time.perf_counter()
+    summary = {"destinations": len(destinations), "places": 0, "segments": 0, "plans": 0, "failed": []}
+    with amap_priority(PRIORITY_BACKGROUND):
+        for index, destination in enumerate(destinations):
+            report_progress(progress, 100 * index // max(len(destinations), 1), f"正在预热 {destination}（{index + 1}/{len(destinations)}）")
+            print(f"预热目的地 {destination}（{index + 1}/{len(destinations)}）")
+            try:
+                counts = prewarm_destination(destination, days, include_plans)
+            except Exception as e:
+                print(f"预热 {destination} 失败: {e}")
+                summary["failed"].append({"destination": destination, "error": str(e)})
+                continue
+            for key, value in counts.items():
+                summary[key] += value
+    summary["elapsed_seconds"] = round(time.perf_counter() - start_time, 2)
+    print(f"预热完成: {summary}")
+    return summary
+
+# 热门目的地预热API：立即返回任务ID，进度通过 /api/jobs/{job_id} 获取
+@app.post("/api/admin/prewarm", response_model=JobSubmitResponse)
+async def submit_prewarm_job(request: PrewarmRequest):
+    """提交热门目的地预热任务"""
+    destinations = [d.strip() for d in request.destinations if d and d.strip()]
+    if not destinations:
+        return JobSubmitResponse(success=False, error_message="目的地列表不能为空")
+    try:
+        job_id = maintenance_queue.submit(
+            "prewarm", prewarm_destinations, destinations, request.days, request.include_plans
+        )
+        return JobSubmitResponse(success=True, job_id=job_id, status="queued")
+    except QueueFullError as e:
+        return JobSubmitResponse(success=False, error_message=str(e))
+
+# 服务启动后是否在后台预加载 langchain、geopy 等导入较慢的依赖
+PRELOAD_HEAVY_IMPORTS = os.getenv("PRELOAD_HEAVY_IMPORTS", "true").lower() == "true"
+
+def run_startup_tasks():
+    """
+    服务启动时由 lifespan 调用：
+    1. 把已退出或失去心跳的worker遗留的未完成任务标记为失败，仍在运行的其他worker的任务不受影响
+    2. 在后台线程中加载较慢的依赖，避免第一个用户请求承担导入耗时
+    3. 配置了 PREWARM_DESTINATIONS 时在后台预热热门目的地
+    """
+    job_queue.recover_orphaned(JOB_STALE_AFTER)
+    if PRELOAD_HEAVY_IMPORTS:
+        start_background_preload()
+    if PREWARM_DESTINATIONS:
+        job_id = maintenance_queue.submit("prewarm", prewarm_destinations, PREWARM_DESTINATIONS, PREWARM_DAYS, PREWARM_PLANS)
+        print(f"已提交启动预热任务 {job_id}: {', '.join(PREWARM_DESTINATIONS)}")
+
+# 读取服务端保存的行程
+@app.get("/api/plans/{plan_id}", response_model=ItineraryPlanResponse, response_class=FastJSONResponse)
+def get_stored_plan(plan_id: str):
+    """按行程ID获取服务端保存的最新行程"""
+    try:
+        return ItineraryPlanResponse(success=True, plan_data=plan_store.get(plan_id))
+    except PlanNotFoundError as e:
+        return ItineraryPlanResponse(success=False, error_message=str(e), error_code=e.error_code)
+
+def update_stored_transportation(plan_id: str, day, place_index: int, mode: str, transit_info: dict) -> Optional[int]:
+    """更新服务端保存的行程中某一段的交通方式，返回新的版本号，行程或地点不存在时返回None"""
+    try:
+        plan = plan_store.get(plan_id)
+    except PlanNotFoundError:
+        return None
+    for day_plan in plan.get("itinerary") or []:
+        if day_plan.get("day") != day:
+            continue
+        places = day_plan.get("places") or []
+        if 0 <= place_index < len(places):
+            places[place_index]["transportation"] = mode
+            places[place_index]["transition_time"] = transit_info["time"]
+            places[place_index]["route_steps"] = transit_info["steps"]
+            places[place_index].pop("transition_estimated", None)
+            try:
+                return plan_store.save(plan, plan_id, plan.get(PLAN_VERSION_FIELD))[PLAN_VERSION_FIELD]
+            except PlanVersionConflictError:
+                # 读取后行程已被其他请求修改，放弃本次同步，客户端下次刷新时以服务端行程为准
+                return None
+    return None
+
 # 新增交通方式切换API
 @app.post("/api/trip/transportation")
-async def get_transportation_info(request: dict):
+def get_transportation_info(request: dict):
     """根据起终点和交通方式获取交通信息"""
     try:
         start = request.get("start")
@@ -1774,71 +3024,444 @@ async def get_transportation_info(request: dict):
         if not start or not end:
             return {"error": "缺少起终点信息"}
         
-        # 获取交通信息
-        transit_info = get_transit_time(
+        # 获取交通信息（优先使用后台预计算的缓存）
+        cached = transport_cache.contains(
+            transport_cache_key(start["longitude"], start["latitude"], end["longitude"], end["latitude"], mode)
+        )
+        transit_info = get_transit_time_cached(
             start["longitude"], start["latitude"],
             end["longitude"], end["latitude"],
             mode=mode
         )
+
+        # 提供行程ID时同步更新服务端保存的行程，返回新的版本号
+        plan_version = None
+        if request.get("plan_id") and request.get("day") is not None and request.get("place_index") is not None:
+            plan_version = update_stored_transportation(
+                request["plan_id"], request["day"], int(request["place_index"]), mode, transit_info
+            )
         
         return {
             "time": transit_info["time"],
-            "steps": transit_info["steps"]
+            "steps": transit_info["steps"],
+            "cached": cached,
+            "plan_version": plan_version
         }
         
     except Exception as e:
         return {"error": f"获取交通信息失败: {str(e)}"}
 
+# 辅助函数：从已有路线数据中读取驾车时间（秒）
+def get_route_duration_seconds(route: dict):
+    """读取行程 routes 中某段路线的实际耗时，不存在时返回None"""
+    try:
+        if route.get("duration") is not None:
+            return int(route["duration"])
+        paths = (route.get("route_info") or {}).get("paths") or []
+        if paths and paths[0].get("duration") is not None:
+            return int(paths[0]["duration"])
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return None
+
+# 交通信息相关字段，保存在每段路线的起点地点上
+TRANSPORT_FIELDS = ("transportation", "available_transportations", "transition_time", "route_steps")
+
+def collect_routes_by_name(day_plans: list) -> dict:
+    """按 (起点名称, 终点名称) 收集行程中已有的路线数据"""
+    existing_routes = {}
+    for day_plan in day_plans:
+        for route in day_plan.get("routes") or []:
+            key = ((route.get("start_point") or {}).get("name"), (route.get("end_point") or {}).get("name"))
+            existing_routes[key] = route
+    return existing_routes
+
+def estimate_segment_transportation(start: dict, end: dict):
+    """不调用高德地图API，按直线距离在本地推荐交通方式并估算交通时间"""
+    distance_km = haversine_km(
+        float(start["longitude"]), float(start["latitude"]),
+        float(end["longitude"]), float(end["latitude"])
+    )
+    available_modes = ["driving"]
+    if "transit" in (start.get("available_transportations") or []) and \
+            "transit" in (end.get("available_transportations") or []):
+        available_modes.append("transit")
+    if distance_km < 5:
+        available_modes.append("walking")
+    if distance_km < 10:
+        available_modes.append("bicycling")
+    if distance_km < 1:
+        mode = "walking"
+    elif distance_km < 5:
+        mode = "bicycling"
+    else:
+        mode = "driving"
+    start["transportation"] = mode
+    start["available_transportations"] = available_modes
+    start["transition_time"] = "约" + format_duration_text(estimate_travel_seconds(distance_km, mode))
+    start["route_steps"] = get_transportation_text(mode)
+    start["transition_estimated"] = True  # 标记为本地估算，切换交通方式时可获取准确时间
+
+def refresh_day_segments(day_plan: dict, previous_next: dict, existing_routes: dict):
+    """
+    地点顺序变化后更新当天的交通信息和路线
+    相邻关系未变的路段直接复用，新路段按直线距离本地估算，不调用高德地图API
+    """
+    coord_places = [
+        p for p in day_plan.get("places") or []
+        if isinstance(p, dict) and p.get("longitude") is not None and p.get("latitude") is not None
+    ]
+
+    for i in range(len(coord_places) - 1):
+        start, end = coord_places[i], coord_places[i + 1]
+        if previous_next.get(id(start)) is end:
+            continue
+        estimate_segment_transportation(start, end)
+
+    # 每天最后一个地点不再有后续路段
+    if coord_places:
+        for field in TRANSPORT_FIELDS + ("transition_estimated",):
+            coord_places[-1].pop(field, None)
+
+    # 复用方向一致的已有路线，其余路段由前端按需重新请求
+    new_routes = []
+    for i in range(len(coord_places) - 1):
+        route = existing_routes.get((coord_places[i].get("name"), coord_places[i + 1].get("name")))
+        if route:
+            route["sequence"] = i + 1
+            new_routes.append(route)
+    day_plan["routes"] = new_routes
+
+def reorder_day_places(day_plan: dict, metric: str = "distance", keep_start: bool = True,
+                       use_amap_matrix: bool = False) -> dict:
+    """
+    使用最近邻 + 2-opt 在本地重新排序某一天的地点，减少绕路
+    只使用已有坐标和路线数据，不调用大模型和高德地图API
+    """
+    places = day_plan.get("places") or []
+    coord_slots = [
+        i for i, p in enumerate(places)
+        if isinstance(p, dict) and p.get("longitude") is not None and p.get("latitude") is not None
+    ]
+    result = {
+        "day": day_plan.get("day"),
+        "metric": metric,
+        "changed": False,
+        "original_cost": 0,
+        "optimized_cost": 0
+    }
+    if len(coord_slots) < 3:
+        # 少于3个地点时顺序无需优化
+        return result
+
+    coord_places = [places[i] for i in coord_slots]
+    points = [(float(p["longitude"]), float(p["latitude"])) for p in coord_places]
+    distance_matrix = build_distance_matrix(points)
+
+    if metric == "duration" and use_amap_matrix:
+        # 通过距离测量API批量获取真实交通时间，获取失败的地点对按直线距离估算
+        amap_matrix = get_travel_time_matrix(points, "driving")
+        cost_matrix = [
+            [
+                float(amap_matrix[i][j]) if amap_matrix[i][j] is not None
+                else float(estimate_travel_seconds(distance_matrix[i][j]))
+                for j in range(len(points))
+            ]
+            for i in range(len(points))
+        ]
+    elif metric == "duration":
+        # 已有实际路线的地点对使用真实耗时，其余按直线距离估算
+        known_durations = {}
+        for route in day_plan.get("routes") or []:
+            seconds = get_route_duration_seconds(route)
+            if seconds is not None:
+                start_name = (route.get("start_point") or {}).get("name")
+                end_name = (route.get("end_point") or {}).get("name")
+                known_durations[(start_name, end_name)] = seconds
+                known_durations.setdefault((end_name, start_name), seconds)
+        size = len(coord_places)
+        cost_matrix = [[0.0] * size for _ in range(size)]
+        for i in range(size):
+            for j in range(size):
+                if i != j:
+                    key = (coord_places[i].get("name"), coord_places[j].get("name"))
+                    cost_matrix[i][j] = known_durations.get(key, estimate_travel_seconds(distance_matrix[i][j]))
+    else:
+        cost_matrix = distance_matrix
+
+    identity = list(range(len(coord_places)))
+    order = solve_open_tsp(cost_matrix, fix_start=keep_start)
+    original_cost = path_cost(identity, cost_matrix)
+    optimized_cost = path_cost(order, cost_matrix)
+    result["original_cost"] = round(original_cost, 2)
+    if optimized_cost >= original_cost - 1e-9:
+        # 启发式结果不优于原顺序时保持不变
+        result["optimized_cost"] = round(original_cost, 2)
+        return result
+
+    result["optimized_cost"] = round(optimized_cost, 2)
+    result["changed"] = True
+
+    # 记录原顺序中每个地点的下一站，用于判断交通信息是否可以复用
+    previous_next = {id(coord_places[i]): coord_places[i + 1] for i in range(len(coord_places) - 1)}
+    existing_routes = collect_routes_by_name([day_plan])
+    reordered = [coord_places[k] for k in order]
+
+    new_places = list(places)
+    for slot, place in zip(coord_slots, reordered):
+        new_places[slot] = place
+    day_plan["places"] = new_places
+    refresh_day_segments(day_plan, previous_next, existing_routes)
+
+    result["order"] = [p.get("name") for p in reordered]
+    return result
+
+# 新增：本地重新排序行程地点API
+@app.post("/api/trip/reorder", response_model=ItineraryReorderResponse, response_class=FastJSONResponse)
+def reorder_trip_plan(request: ItineraryReorderRequest):
+    """在本地使用TSP启发式算法重新排序每天的地点，避免走回头路"""
+    try:
+        plan = resolve_request_plan(request.current_plan, request.plan_id, request.plan_version)
+        if not isinstance(plan, dict) or not isinstance(plan.get("itinerary"), list):
+            return ItineraryReorderResponse(
+                success=False,
+                error_message="当前行程缺少每日安排数据"
+            )
+        # 修改所基于的版本，保存时服务端已有更新的版本则拒绝覆盖
+        base_version = plan.get(PLAN_VERSION_FIELD)
+
+        metric = request.metric if request.metric in ("distance", "duration") else "distance"
+        keep_start = True if request.keep_start is None else request.keep_start
+
+        start_time = time.perf_counter()
+        optimization = []
+        for day_plan in plan["itinerary"]:
+            if request.day is not None and day_plan.get("day") != request.day:
+                continue
+            optimization.append(reorder_day_places(day_plan, metric, keep_start, bool(request.use_amap_matrix)))
+
+        if request.day is not None and not optimization:
+            return ItineraryReorderResponse(
+                success=False,
+                error_message=f"行程中不存在第{request.day}天"
+            )
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"本地重新排序完成: {len(optimization)} 天，耗时 {elapsed_ms:.1f} 毫秒")
+
+        return ItineraryReorderResponse(
+            success=True,
+            updated_plan=plan_store.save(plan, request.plan_id or plan.get("plan_id"), base_version),
+            optimization=optimization
+        )
+
+    except Exception as e:
+        return ItineraryReorderResponse(
+            success=False,
+            error_message=f"重新排序行程时发生错误: {str(e)}",
+            error_code=getattr(e, "error_code", None)
+        )
+
+# 地点缺少建议停留时间时使用的默认值（小时）
+DEFAULT_PLACE_DURATION_HOURS = 2.0
+
+def get_place_duration_hours(place: dict) -> float:
+    """读取地点的建议停留时间（小时），无效时返回默认值"""
+    try:
+        duration = float(place.get("duration") or 0)
+    except (ValueError, TypeError):
+        duration = 0
+    return duration if duration > 0 else DEFAULT_PLACE_DURATION_HOURS
+
+def rebalance_plan_days(plan: dict, days: int, max_hours_per_day: Optional[float] = None) -> List[dict]:
+    """
+    使用带容量约束的k-means将行程地点重新分配到地理位置集中的若干天
+    只使用 current_plan 中已有的坐标，不调用大模型和高德地图API
+    """
+    old_days = [d for d in plan.get("itinerary") or [] if isinstance(d, dict)]
+    existing_routes = collect_routes_by_name(old_days)
+
+    coord_places = []  # (地点, 原来所在天的序号)
+    uncoord_places = []
+    previous_next = {}
+    for day_index, day_plan in enumerate(old_days):
+        day_coord_places = []
+        for place in day_plan.get("places") or []:
+            if not isinstance(place, dict):
+                continue
+            if place.get("longitude") is not None and place.get("latitude") is not None:
+                day_coord_places.append(place)
+                coord_places.append((place, day_index))
+            else:
+                uncoord_places.append((place, day_index))
+        for i in range(len(day_coord_places) - 1):
+            previous_next[id(day_coord_places[i])] = day_coord_places[i + 1]
+
+    points = [(float(p["longitude"]), float(p["latitude"])) for p, _ in coord_places]
+    weights = [get_place_duration_hours(p) for p, _ in coord_places]
+    labels = capacity_constrained_kmeans(points, weights, days, max_hours_per_day)
+
+    clusters = [[] for _ in range(days)]
+    for index, label in enumerate(labels):
+        clusters[label].append(index)
+
+    # 按簇内地点原所在天的平均序号排序，使新行程的天数顺序尽量贴近原行程
+    def cluster_sort_key(members):
+        if not members:
+            return float("inf")
+        return sum(coord_places[i][1] for i in members) / len(members)
+    clusters.sort(key=cluster_sort_key)
+
+    new_itinerary = []
+    stats = []
+    for new_index, members in enumerate(clusters):
+        # 簇内地点使用开放路径TSP排序
+        if len(members) >= 3:
+            matrix = build_distance_matrix([points[i] for i in members])
+            members = [members[k] for k in solve_open_tsp(matrix, fix_start=False)]
+
+        # 主题沿用贡献地点最多的原始天
+        theme = ""
+        if members:
+            origin_counts = {}
+            for i in members:
+                origin_counts[coord_places[i][1]] = origin_counts.get(coord_places[i][1], 0) + 1
+            dominant_day = max(origin_counts, key=lambda d: (origin_counts[d], -d))
+            theme = old_days[dominant_day].get("theme", "")
+        elif new_index < len(old_days):
+            theme = old_days[new_index].get("theme", "")
+
+        day_places = [coord_places[i][0] for i in members]
+        # 没有坐标的地点保留在原来的天数中
+        day_places.extend(p for p, origin in uncoord_places if min(origin, days - 1) == new_index)
+
+        new_day = {"day": new_index + 1, "theme": theme, "places": day_places}
+        refresh_day_segments(new_day, previous_next, existing_routes)
+        new_itinerary.append(new_day)
+
+        spread_km = 0.0
+        if members:
+            center_lng = sum(points[i][0] for i in members) / len(members)
+            center_lat = sum(points[i][1] for i in members) / len(members)
+            spread_km = max(haversine_km(points[i][0], points[i][1], center_lng, center_lat) for i in members)
+        stats.append({
+            "day": new_index + 1,
+            "place_count": len(day_places),
+            "total_hours": round(sum(get_place_duration_hours(p) for p in day_places), 1),
+            "spread_km": round(spread_km, 2)
+        })
+
+    plan["itinerary"] = new_itinerary
+    plan["total_days"] = days
+    return stats
+
+# 新增：按地理位置重新分配每天地点API
+@app.post("/api/trip/rebalance", response_model=ItineraryReorderResponse, response_class=FastJSONResponse)
+def rebalance_trip_plan(request: ItineraryRebalanceRequest):
+    """将行程地点按地理位置聚类重新分配到每一天，避免同一天安排相距很远的地点"""
+    try:
+        plan = resolve_request_plan(request.current_plan, request.plan_id, request.plan_version)
+        if not isinstance(plan, dict) or not isinstance(plan.get("itinerary"), list) or not plan["itinerary"]:
+            return ItineraryReorderResponse(
+                success=False,
+                error_message="当前行程缺少每日安排数据"
+            )
+        # 修改所基于的版本，保存时服务端已有更新的版本则拒绝覆盖
+        base_version = plan.get(PLAN_VERSION_FIELD)
+
+        days = request.days or plan.get("total_days") or len(plan["itinerary"])
+        try:
+            days = int(days)
+        except (ValueError, TypeError):
+            days = len(plan["itinerary"])
+        if days < 1:
+            return ItineraryReorderResponse(
+                success=False,
+                error_message="天数必须大于0"
+            )
+        if request.max_hours_per_day is not None and request.max_hours_per_day <= 0:
+            return ItineraryReorderResponse(
+                success=False,
+                error_message="每天停留时长上限必须大于0"
+            )
+
+        start_time = time.perf_counter()
+        stats = rebalance_plan_days(plan, days, request.max_hours_per_day)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"本地重新分配行程完成: {days} 天，耗时 {elapsed_ms:.1f} 毫秒")
+
+        return ItineraryReorderResponse(
+            success=True,
+            updated_plan=plan_store.save(plan, request.plan_id or plan.get("plan_id"), base_version),
+            optimization=stats
+        )
+
+    except Exception as e:
+        return ItineraryReorderResponse(
+            success=False,
+            error_message=f"重新分配行程时发生错误: {str(e)}",
+            error_code=getattr(e, "error_code", None)
+        )
+
 # 新增：为行程地点生成路径规划API
 # 注释：此API端点未被前端使用，前端使用 /api/trip/itinerary-routes，已删除
 # @app.post("/api/trip/routes", response_model=ItineraryRouteResponse)
 
-# 获取天气预报
-@app.get("/api/weather/{location}")
-async def get_weather(location: str):
-    """获取指定地点的天气预报"""
-    try:
-        api_key = get_amap_api_key()
-        
-        # 先通过地理编码获取城市编码
+# 获取天气预报数据（带缓存）
+def fetch_weather_casts(location: str, priority: int = PRIORITY_INTERACTIVE):
+    """获取天气预报原始数据并缓存，返回 (每日预报列表, 错误信息)"""
+    cached = weather_cache.get(location)
+    if cached is not None:
+        return cached, None
+
+    # 先通过地理编码获取城市编码，城市编码长期不变，单独缓存
+    adcode_key = f"adcode|{location}"
+    adcode = city_cache.get(adcode_key)
+    if adcode is None:
         geocode_url = "https://restapi.amap.com/v3/geocode/geo"
         params = {
-            "key": api_key,
             "address": location
         }
         
-        response = requests.get(geocode_url, params=params)
-        geocode_data = response.json()
+        geocode_data = amap_get(geocode_url, params, priority=priority)
         
         if geocode_data["status"] != "1" or not geocode_data["geocodes"]:
-            return {
-                "success": False,
-                "error": f"无法找到{location}的地理位置信息"
-            }
+            return None, f"无法找到{location}的地理位置信息"
         
         # 获取城市编码
         adcode = geocode_data["geocodes"][0]["adcode"]
-        
-        # 获取天气预报
-        weather_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-        params = {
-            "key": api_key,
-            "city": adcode,
-            "extensions": "all"  # 获取预报天气
-        }
-        
-        response = requests.get(weather_url, params=params)
-        data = response.json()
-        
-        if data["status"] != "1" or "forecasts" not in data or not data["forecasts"]:
+        city_cache.set(adcode_key, adcode)
+    
+    # 获取天气预报
+    weather_url = "https://restapi.amap.com/v3/weather/weatherInfo"
+    params = {
+        "city": adcode,
+        "extensions": "all"  # 获取预报天气
+    }
+    
+    data = amap_get(weather_url, params, priority=priority)
+    
+    if data["status"] != "1" or "forecasts" not in data or not data["forecasts"]:
+        return None, f"获取{location}的天气信息失败"
+
+    casts = data["forecasts"][0]["casts"]
+    weather_cache.set(location, casts)
+    return casts, None
+
+# 获取天气预报
+@app.get("/api/weather/{location}")
+def get_weather(location: str):
+    """获取指定地点的天气预报"""
+    try:
+        weather_data, error = fetch_weather_casts(location)
+        if error:
             return {
                 "success": False,
-                "error": f"获取{location}的天气信息失败"
+                "error": error
             }
         
-        # 处理天气数据
+        # 处理天气数据，日期显示按当天重新计算
         forecasts = []
-        weather_data = data["forecasts"][0]["casts"]
         today = datetime.now().date()
         
         for day in weather_data:
@@ -0,0 +1,96 @@
+"""
+从流式生成的行程文本中提取地点名称
+
+流式行程规划的提示词要求地点按 "省市+景点名称" 的格式输出（如 "四川省成都市武侯祠"），
+这里在文本逐段到达时增量识别这类名称，以便在用户阅读行程的同时提前查询坐标和路线。
+只有后面已经出现分隔符的名称才会输出，避免把被分段截断的名称当成完整名称。
+"""
+import re
+from typing import List, Optional, Tuple
+
+# 省级行政区简称，地点名称必须以其中之一或目的地城市开头，避免把正文中的 "城市的…" 误认为地点
+PROVINCES = (
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江", "安徽",
+    "福建", "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+    "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆", "香港", "澳门"
+)
+
+_CJK = r"\u4e00-\u9fa5"
+# 景点名称部分：汉字、字母和间隔号，遇到标点、空白、数字等即结束
+_LANDMARK = rf"[{_CJK}A-Za-z·]{{2,20}}"
+# 景点名称后面常见的说明文字，出现时截断
+_TRAILING_WORDS = re.compile(r"(建议|停留|位于|游览|参观|推荐|是).*$")
+# 天数标记，例如 "第2天"、"第二天"
+_DAY_MARKER = re.compile(r"第([0-9一二三四五六七八九十]+)天")
+# 名称之外的分隔字符
+_DELIMITER = re.compile(rf"[^{_CJK}A-Za-z0-9·]")
+_CHINESE_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+
+def _parse_day(text: str) -> Optional[int]:
+    if text.isdigit():
+        return int(text)
+    if text == "十":
+        return 10
+    if text.startswith("十"):
+        return 10 + _CHINESE_DIGITS.get(text[1:], 0)
+    if text.endswith("十"):
+        return _CHINESE_DIGITS.get(text[0], 0) * 10
+    if "十" in text:
+        tens, ones = text.split("十", 1)
+        return _CHINESE_DIGITS.get(tens, 0) * 10 + _CHINESE_DIGITS.get(ones, 0)
+    return _CHINESE_DIGITS.get(text)
+
+
+class StreamPlaceExtractor:
+    """增量提取 "省市+景点名称" 格式的地点名称，每个名称只输出一次"""
+
+    # 保留在缓冲区中等待后续文本的最大长度
+    MAX_BUFFER = 200
+
+    def __init__(self, destination: Optional[str] = None):
+        prefixes = list(PROVINCES)
+        city = re.sub(r"(省|市)$", "", (destination or "").strip())
+        if city and city not in prefixes:
+            prefixes.append(re.escape(city))
+        # 以省份或目的地城市开头，以 "市" 结束城市部分，后面紧跟景点名称
+        self._pattern = re.compile(rf"(?:{'|'.join(prefixes)})[{_CJK}]{{0,10}}?市({_LANDMARK})")
+        self._buffer = ""
+        self._seen = set()
+        self.day = None
+
+    def _extract(self, text: str) -> List[Tuple[Optional[int], str]]:
+        found = []
+        markers = [(m.start(), _parse_day(m.group(1))) for m in _DAY_MARKER.finditer(text)]
+        for match in self._pattern.finditer(text):
+            while markers and markers[0][0] < match.start():
+                self.day = markers.pop(0)[1] or self.day
+            landmark = _TRAILING_WORDS.sub("", match.group(1))
+            if len(landmark) < 2:
+                continue
+            name = match.group(0)[:match.end(0) - match.start(0) - len(match.group(1))] + landmark
+            if name not in self._seen:
+                self._seen.add(name)
+                found.append((self.day, name))
+        for _, day in markers:
+            self.day = day or self.day
+        return found
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[int], str]]:
+        """加入新到达的文本，返回新识别出的 [(天数, 地点名称)]，天数未知时为None"""
+        self._buffer += chunk or ""
+        # 只处理最后一个分隔符之前的文本，之后的部分可能是被截断的名称
+        cut = -1
+        for match in _DELIMITER.finditer(self._buffer):
+            cut = match.start()
+        if cut < 0:
+            if len(self._buffer) > self.MAX_BUFFER:
+                self._buffer = self._buffer[-self.MAX_BUFFER:]
+            return []
+        ready, self._buffer = self._buffer[:cut + 1], self._buffer[cut + 1:]
+        return self._extract(ready)
+
+    def flush(self) -> List[Tuple[Optional[int], str]]:
+        """文本结束时处理缓冲区中剩余的内容"""
+        ready, self._buffer = self._buffer, ""
+        return self._extract(ready)
@@ -0,0 +1,245 @@
+"""
+地点名称规范化和别名索引
+
+大模型输出的同一个景点常有多种写法，例如 "四川省成都市武侯祠"、"成都武侯祠"、"武侯祠"，
+原本每种写法都是独立的坐标缓存键，坐标还可能因POI搜索和地理编码的差异略有不同，导致路线缓存也无法命中。
+这里用省市名称前缀树（按最长前缀匹配）去掉名称开头的省市，得到 "城市|核心名称" 形式的规范化键；
+POI搜索匹配到景点后记录高德地图的POI ID，把查询名称和高德返回的名称都登记为该POI的别名，
+之后所有写法都解析为同一个规范ID（"amap:<POI ID>"），共享同一份坐标缓存。
+"""
+import re
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+from place_extractor import PROVINCES
+
+# 省级行政区的完整名称，其余省份为 "简称+省"
+_PROVINCE_FULL_NAMES = {
+    "北京": "北京市", "天津": "天津市", "上海": "上海市", "重庆": "重庆市",
+    "内蒙古": "内蒙古自治区", "广西": "广西壮族自治区", "西藏": "西藏自治区", "宁夏": "宁夏回族自治区",
+    "新疆": "新疆维吾尔自治区", "香港": "香港特别行政区", "澳门": "澳门特别行政区"
+}
+# 直辖市和特别行政区同时作为城市
+_MUNICIPALITIES = ("北京", "天津", "上海", "重庆", "香港", "澳门")
+# 常见旅游城市（地级市或县级市），自治州、地区等其他城市从高德地图POI结果的 cityname 中学习
+CITIES = (
+    "石家庄", "秦皇岛", "承德", "张家口", "太原", "大同", "呼和浩特", "呼伦贝尔", "沈阳", "大连", "长春",
+    "吉林", "哈尔滨", "南京", "苏州", "无锡", "扬州", "镇江", "常州", "杭州", "宁波", "绍兴", "嘉兴", "湖州", "温州",
+    "舟山", "金华", "合肥", "黄山", "福州", "厦门", "泉州", "武夷山", "南昌", "景德镇", "九江", "上饶", "济南", "青岛",
+    "烟台", "威海", "泰安", "曲阜", "郑州", "洛阳", "开封", "武汉", "宜昌", "长沙", "张家界", "广州",
+    "深圳", "珠海", "佛山", "汕头", "潮州", "南宁", "桂林", "北海", "海口", "三亚", "成都", "乐山", "峨眉山", "都江堰",
+    "贵阳", "遵义", "安顺", "昆明", "大理", "丽江", "香格里拉", "拉萨", "林芝",
+    "日喀则", "西安", "延安", "宝鸡", "兰州", "敦煌", "嘉峪关", "张掖", "西宁", "银川", "中卫", "乌鲁木齐", "喀什",
+    "吐鲁番"
+)
+_REGION_SUFFIX = re.compile(r"(省|市|地区|自治州|盟|自治区|特别行政区)$")
+# 省份之后紧跟的城市，例如 "四川省成都市" 中的 "成都市"、"新疆喀什地区" 中的 "喀什地区"
+_CITY_AFTER_PROVINCE = re.compile(r"[\u4e00-\u9fa5]{2,8}?(市|地区|自治州|盟)")
+_SPACES = re.compile(r"[\s·・]+")
+# 省市简称后面紧跟这些字时是路名的一部分，例如 "北京路步行街"、"湖南路"，不能当作省市前缀去掉
+_STREET_PREFIXES = ("路", "街", "大街", "大道", "巷")
+# 景点名称后面不影响所指地点的通用后缀
+_GENERIC_SUFFIX = re.compile(r"(风景名胜区|旅游景区|风景区|旅游区|景区)$")
+# 去掉省市前缀后只剩这些通用名称时保留前缀，避免 "四川大学" 和 "成都大学" 被视为同一地点
+_GENERIC_CORES = {
+    "大学", "学院", "博物馆", "博物院", "美术馆", "图书馆", "科技馆", "体育馆", "体育场", "大剧院", "剧院",
+    "动物园", "植物园", "海洋馆", "公园", "广场", "火车站", "站", "东站", "西站", "南站", "北站", "机场", "港",
+    "医院", "中学", "古城", "老街"
+}
+
+LEVEL_PROVINCE = "province"
+LEVEL_CITY = "city"
+
+
+class RegionTrie:
+    """按字符构建的省市名称前缀树，用于最长前缀匹配"""
+
+    _END = ""
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, name: str, value: tuple):
+        node = self._root
+        for char in name:
+            node = node.setdefault(char, {})
+        if self._END not in node:
+            self.size += 1
+        node[self._END] = value
+
+    def longest_prefix(self, text: str) -> Tuple[int, Optional[tuple]]:
+        """返回 text 开头最长匹配的名称长度和对应的值，没有匹配时返回 (0, None)"""
+        node = self._root
+        length, value = 0, None
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node:
+                length, value = i + 1, node[self._END]
+        return length, value
+
+
+def short_region_name(name: str) -> str:
+    """去掉行政区划后缀，例如 "成都市" -> "成都"，"四川省" -> "四川" """
+    return _REGION_SUFFIX.sub("", name or "") or name or ""
+
+
+class PlaceAliasIndex:
+    """
+    地点名称 -> 规范ID 的索引
+    规范化键为 "城市简称|核心名称"，已知对应高德POI时规范ID为 "amap:<POI ID>"。
+    别名保存在 alias_cache 中（可以是多个worker共享的SQLite缓存），省市前缀树保存在进程内
+    """
+
+    def __init__(self, alias_cache):
+        self.alias_cache = alias_cache
+        self.regions = RegionTrie()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        for province in PROVINCES:
+            full_name = _PROVINCE_FULL_NAMES.get(province, f"{province}省")
+            level = LEVEL_CITY if province in _MUNICIPALITIES else LEVEL_PROVINCE
+            self.add_region(full_name, level, province)
+        for city in CITIES:
+            self.add_region(f"{city}市", LEVEL_CITY)
+
+    def add_region(self, name: str, level: str, short: Optional[str] = None):
+        """登记行政区，同时登记简称（默认为去掉后缀的名称），值为 (级别, 完整名称)"""
+        name = _SPACES.sub("", name or "")
+        if len(name) < 2:
+            return
+        short = short or short_region_name(name)
+        with self._lock:
+            self.regions.add(name, (level, name))
+            if len(short) >= 2 and short != name:
+                self.regions.add(short, (level, name))
+
+    def _match_region(self, text: str, after_province: bool) -> Tuple[int, Optional[tuple]]:
+        length, value = self.regions.longest_prefix(text)
+        if after_province:
+            match = _CITY_AFTER_PROVINCE.match(text)
+            if match and match.end() > length:
+                return match.end(), (LEVEL_CITY, match.group(0))
+        return length, value
+
+    def _strip_region(self, text: str, after_province: bool) -> Tuple[int, Optional[tuple]]:
+        """匹配可以去掉的省市前缀，返回 (前缀长度, (级别, 完整名称))，不能去掉时返回 (0, None)"""
+        length, region = self._match_region(text, after_province)
+        if not region:
+            return 0, None
+        rest = text[length:]
+        if len(rest) < 2 or rest in _GENERIC_CORES:
+            return 0, None
+        if text[:length] != region[1] and rest.startswith(_STREET_PREFIXES):
+            return 0, None
+        return length, region
+
+    def split(self, name: str, city: Optional[str] = None) -> Tuple[str, str]:
+        """
+        去掉名称开头的省市，返回 (城市简称, 核心名称)
+        按顺序最多去掉一个省份和一个城市，例如 "上海市南京路步行街" 只去掉 "上海市"；
+        名称中没有城市时使用 city 参数的简称；去掉前缀后只剩不足两个字、通用名称或路名时保留前缀
+        """
+        text = _SPACES.sub("", name or "")
+        core = _GENERIC_SUFFIX.sub("", text)
+        if len(core) >= 2:
+            text = core
+        scope = None
+        after_province = False
+        while True:
+            length, region = self._strip_region(text, after_province)
+            if not region:
+                break
+            level, full_name = region
+            if level == LEVEL_PROVINCE and after_province:
+                break
+            text = text[length:]
+            if level == LEVEL_CITY:
+                scope = short_region_name(full_name)
+                break
+            after_province = True
+
+        if scope is None:
+            scope = short_region_name(_SPACES.sub("", city or ""))
+        return scope, text
+
+    def local_key(self, name: str, city: Optional[str] = None) -> str:
+        scope, core = self.split(name, city)
+        return f"{scope}|{core}"
+
+    def same_place(self, name: str, city: Optional[str], poi: dict) -> bool:
+        """查询名称与高德POI名称相同，或去掉省市前缀后的核心名称完全一致时返回True，用于判断是否可以登记别名"""
+        poi_name = poi.get("name") if isinstance(poi, dict) else None
+        if not isinstance(poi_name, str) or not poi_name or not name:
+            return False
+        if _SPACES.sub("", poi_name) == _SPACES.sub("", name):
+            return True
+        core = self.split(name, city)[1]
+        poi_core = self.split(poi_name, poi.get("cityname") or city)[1]
+        return bool(core) and core == poi_core
+
+    def canonical_id(self, name: str, city: Optional[str] = None) -> str:
+        """返回地点的规范ID：已登记别名时为高德POI的规范ID，否则为规范化键"""
+        key = self.local_key(name, city)
+        canonical = self.alias_cache.get(key)
+        with self._lock:
+            self.counts["lookups"] += 1
+            if canonical is not None:
+                self.counts["alias_hits"] += 1
+        return canonical if canonical is not None else key
+
+    def learn_poi(self, name: str, city: Optional[str], poi: dict) -> Optional[str]:
+        """
+        登记高德POI搜索结果：学习POI所在的省市名称，并把查询名称和POI名称登记为该POI的别名
+        返回规范ID，POI没有ID时返回None
+        """
+        if not isinstance(poi, dict):
+            return None
+        pname, cityname = poi.get("pname"), poi.get("cityname")
+        if isinstance(pname, str) and pname:
+            self.add_region(pname, LEVEL_CITY if short_region_name(pname) in _MUNICIPALITIES else LEVEL_PROVINCE)
+        if isinstance(cityname, str) and cityname:
+            self.add_region(cityname, LEVEL_CITY)
+        poi_id = poi.get("id")
+        if not isinstance(poi_id, str) or not poi_id:
+            return None
+        canonical = f"amap:{poi_id}"
+        scope_city = cityname if isinstance(cityname, str) and cityname else city
+        keys = {self.local_key(name, city)}
+        if isinstance(poi.get("name"), str) and poi["name"]:
+            keys.add(self.local_key(poi["name"], scope_city))
+        for key in keys:
+            self.alias_cache.set(key, canonical)
+        with self._lock:
+            self.counts["aliases_learned"] += len(keys)
+        return canonical
+
+    def city_hint(self, destination: Optional[str]) -> Optional[str]:
+        """从目的地中识别最具体的省市，返回完整名称（例如 "四川成都" -> "成都市"），无法识别时返回None"""
+        text = _SPACES.sub("", destination or "")
+        best = None
+        after_province = False
+        while text:
+            length, region = self._match_region(text, after_province)
+            if not region or (after_province and region[0] == LEVEL_PROVINCE):
+                break
+            best = region[1]
+            if region[0] == LEVEL_CITY:
+                break
+            after_province = True
+            text = text[length:]
+        return best
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counts["lookups"]
+            return {
+                "regions": self.regions.size,
+                "lookups": lookups,
+                "alias_hits": self.counts["alias_hits"],
+                "alias_hit_rate": round(self.counts["alias_hits"] / lookups, 3) if lookups else 0.0,
+                "aliases_learned": self.counts["aliases_learned"]
+            }
@@ -0,0 +1,80 @@
+"""
+热门行程缓存
+
+按规范化后的目的地和天数缓存完整的行程（流式生成的行程文本和补充了坐标、路线的结构化行程），
+相同的“北京3天”请求直接返回缓存结果，不再调用大模型和高德地图API。
+每个目的地可以保存多个版本，缓存满后按顺序轮换返回，避免所有用户拿到完全相同的行程。
+"""
+import copy
+import hashlib
+import re
+import threading
+from typing import Optional
+
+from cache import TTLCache
+
+# 目的地中不影响行程内容的后缀和空白
+_DESTINATION_SUFFIX = re.compile(r"(市|地区|特别行政区)$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_destination(destination: str) -> str:
+    """规范化目的地名称，例如 " 北京市 " 与 "北京" 视为同一目的地"""
+    normalized = _WHITESPACE.sub("", destination or "").lower()
+    return _DESTINATION_SUFFIX.sub("", normalized) or normalized
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """目的地 + 天数 -> 多个行程版本 [{"digest", "text", "plan"}]"""
+
+    def __init__(self, ttl: float = 86400, max_variants: int = 1, maxsize: int = 500):
+        self.max_variants = max(1, max_variants)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="plans")
+        self._lock = threading.Lock()
+        self._rotation = {}
+
+    @staticmethod
+    def key(destination: str, duration: int) -> str:
+        return f"{normalize_destination(destination)}:{int(duration)}"
+
+    def variant_count(self, destination: str, duration: int) -> int:
+        """已缓存的行程版本数量，不影响 next_text 的轮换顺序"""
+        return len(self._cache.get(self.key(destination, duration)) or [])
+
+    def next_text(self, destination: str, duration: int) -> Optional[str]:
+        """
+        返回下一个可直接使用的行程文本
+        版本数量还没有达到上限时返回None，由调用方重新生成以补充新的版本
+        """
+        key = self.key(destination, duration)
+        variants = self._cache.get(key)
+        if not variants or len(variants) < self.max_variants:
+            return None
+        with self._lock:
+            index = self._rotation.get(key, 0) % len(variants)
+            self._rotation[key] = index + 1
+        return variants[index]["text"]
+
+    def get_plan(self, destination: str, duration: int, text: str) -> Optional[dict]:
+        """按行程文本查找已补充完整的结构化行程，返回副本"""
+        digest = text_digest(text)
+        for variant in self._cache.get(self.key(destination, duration)) or []:
+            if variant["digest"] == digest:
+                return copy.deepcopy(variant["plan"])
+        return None
+
+    def put(self, destination: str, duration: int, text: str, plan: dict):
+        """保存一个行程版本，版本数量超过上限时替换最早的版本"""
+        key = self.key(destination, duration)
+        digest = text_digest(text)
+        with self._lock:
+            variants = [v for v in (self._cache.get(key) or []) if v["digest"] != digest]
+            variants.append({"digest": digest, "text": text, "plan": copy.deepcopy(plan)})
+            self._cache.set(key, variants[-self.max_variants:])
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -0,0 +1,172 @@
+"""
+行程内部数据模型
+
+接口收到的行程数据是普通的 dict / list，各个接口都要反复用 .get() 检查字段和坐标。
+这里定义轻量的 Place、Segment、DayPlan（使用 __slots__ 的 dataclass），在接口入口处一次性
+校验并转换，内部逻辑直接使用属性访问，返回前再通过 to_dict() 转换回原有的JSON格式。
+"""
+import math
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+
+
+class PlanModelError(ValueError):
+    """行程数据缺少必要字段或字段格式错误"""
+
+
+def parse_coordinate(value, low: float, high: float) -> Optional[float]:
+    """将坐标转换为 float，为空、无法转换或超出范围时返回None"""
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or not low <= number <= high:
+        return None
+    return number
+
+
+def with_slots(cls):
+    """
+    为 dataclass 生成使用 __slots__ 的新类，效果等同于 Python 3.10 的 dataclass(slots=True)，兼容 Python 3.8
+    字段的默认值已经写入 __init__，需要从类属性中去掉，否则与 __slots__ 冲突
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {
+        key: value for key, value in cls.__dict__.items()
+        if key not in names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@with_slots
+@dataclass
+class Place:
+    """行程中的一个地点，source 保留原始数据以便原样返回其他字段"""
+    name: str
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
+    description: str = ""
+    duration: Optional[float] = None
+    source: Optional[dict] = field(default=None, repr=False)
+
+    @classmethod
+    def from_dict(cls, data, label: str = "") -> "Place":
+        if not isinstance(data, dict):
+            raise PlanModelError(f"{label}地点格式错误")
+        name = data.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise PlanModelError(f"{label}地点缺少名称")
+        try:
+            duration = float(data["duration"]) if data.get("duration") is not None else None
+        except (TypeError, ValueError):
+            duration = None
+        return cls(
+            name=name,
+            longitude=parse_coordinate(data.get("longitude"), -180.0, 180.0),
+            latitude=parse_coordinate(data.get("latitude"), -90.0, 90.0),
+            description=str(data.get("description") or ""),
+            duration=duration,
+            source=data
+        )
+
+    @property
+    def has_coords(self) -> bool:
+        return self.longitude is not None and self.latitude is not None
+
+    @property
+    def coords(self) -> tuple:
+        return (self.longitude, self.latitude)
+
+    def to_point(self) -> dict:
+        """路线起点、终点使用的精简格式"""
+        return {"name": self.name, "longitude": self.longitude, "latitude": self.latitude}
+
+    def to_dict(self) -> dict:
+        data = dict(self.source) if self.source else {}
+        data["name"] = self.name
+        data["longitude"] = self.longitude
+        data["latitude"] = self.latitude
+        data["description"] = self.description
+        if self.duration is not None:
+            data["duration"] = self.duration
+        return data
+
+
+def parse_route_places(items, label: str = "") -> List[Place]:
+    """转换路径规划接口的地点列表，所有地点都必须包含有效坐标"""
+    places = []
+    for i, item in enumerate(items or []):
+        try:
+            place = Place.from_dict(item)
+        except PlanModelError:
+            raise PlanModelError(f"{label}地点 {i+1} 缺少必要的坐标信息")
+        if not place.has_coords:
+            raise PlanModelError(f"{label}地点 {i+1} 缺少必要的坐标信息")
+        places.append(place)
+    return places
+
+
+@with_slots
+@dataclass
+class Segment:
+    """相邻两个地点之间的一段路线，值为None的可选字段不会输出"""
+    start: Place
+    end: Place
+    mode: str = "driving"
+    segment_index: Optional[int] = None
+    sequence: Optional[int] = None
+    distance: Optional[int] = None
+    duration: Optional[int] = None
+    route_info: Optional[dict] = None
+    success: Optional[bool] = None
+    fallback: Optional[str] = None
+    geometry_pending: Optional[bool] = None
+    geometry: Optional[dict] = None  # 简化并编码后的路线折线，见 geometry.build_route_geometry
+
+    def to_dict(self) -> dict:
+        data = {}
+        if self.segment_index is not None:
+            data["segment_index"] = self.segment_index
+        data["start_point"] = self.start.to_point()
+        data["end_point"] = self.end.to_point()
+        data["mode"] = self.mode
+        for name in ("sequence", "distance", "duration"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        data["route_info"] = self.route_info
+        for name in ("geometry", "success", "fallback", "geometry_pending"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+
+@with_slots
+@dataclass
+class DayPlan:
+    """一天的行程"""
+    day: int
+    places: List[Place] = field(default_factory=list)
+    theme: str = ""
+
+    @classmethod
+    def from_dict(cls, data, index: int = 0, require_coords: bool = False) -> "DayPlan":
+        if not isinstance(data, dict):
+            raise PlanModelError(f"第{index + 1}天的行程格式错误")
+        try:
+            day = int(data.get("day", index + 1))
+        except (TypeError, ValueError):
+            day = index + 1
+        items = data.get("places") or []
+        if require_coords:
+            places = parse_route_places(items, f"第{day}天")
+        else:
+            places = [Place.from_dict(item, f"第{day}天") for item in items]
+        return cls(day=day, places=places, theme=str(data.get("theme") or ""))
+
+    def coord_places(self) -> List[Place]:
+        return [place for place in self.places if place.has_coords]
@@ -0,0 +1,139 @@
+"""
+行程增量编辑
+
+大模型只返回少量编辑操作（新增、删除、替换、移动地点），由服务端校验后应用到当前行程，
+避免为一处修改重新输出整份行程。所有操作校验通过后才会生效，任一操作无效时整体失败。
+"""
+import copy
+import re
+from typing import Callable, List, Optional
+
+# 支持的操作类型
+OP_ADD = "add"
+OP_REMOVE = "remove"
+OP_REPLACE = "replace"
+OP_MOVE = "move"
+SUPPORTED_OPS = (OP_ADD, OP_REMOVE, OP_REPLACE, OP_MOVE)
+
+# 单次修改允许的最大操作数，超出时通常说明应该整体重写行程
+MAX_PLAN_OPERATIONS = 20
+
+DEFAULT_NEW_PLACE_DURATION = 2.0
+
+
+class PlanPatchError(ValueError):
+    """编辑操作格式错误或无法应用到当前行程"""
+
+
+def _parse_day(value) -> Optional[int]:
+    """解析天数，兼容 1、"1"、"第1天"、"Day 1" 等写法，无法解析时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        match = re.search(r"\d+", value)
+        if match:
+            return int(match.group())
+    return None
+
+
+def _find_day(plan: dict, day) -> dict:
+    day_number = _parse_day(day)
+    if day_number is None:
+        raise PlanPatchError(f"无效的天数: {day}")
+    for day_plan in plan.get("itinerary", []):
+        if isinstance(day_plan, dict) and _parse_day(day_plan.get("day")) == day_number:
+            day_plan.setdefault("places", [])
+            return day_plan
+    raise PlanPatchError(f"行程中没有第{day_number}天")
+
+
+def _find_place_index(day_plan: dict, name, place_key: Optional[Callable[[str], str]] = None) -> int:
+    """
+    按名称查找地点，名称不完全一致时接受 place_key 规范化后（如去掉省市前缀）核心名称相同的唯一地点
+    不使用子串匹配，避免 "公园" 这类简短名称误改 "人民公园"
+    """
+    if not name or not isinstance(name, str):
+        raise PlanPatchError("操作缺少地点名称")
+    places = [place if isinstance(place, dict) else {} for place in day_plan.get("places", [])]
+    for i, place in enumerate(places):
+        if place.get("name") == name:
+            return i
+    key = place_key(name) if place_key else None
+    if key:
+        matches = [
+            i for i, place in enumerate(places)
+            if isinstance(place.get("name"), str) and place["name"] and place_key(place["name"]) == key
+        ]
+        if len(matches) == 1:
+            return matches[0]
+    raise PlanPatchError(f"第{day_plan.get('day')}天中找不到地点: {name}")
+
+
+def _normalize_new_place(place) -> dict:
+    """新增或替换的地点只保留名称、描述和停留时间，坐标和交通信息由服务端重新获取"""
+    if not isinstance(place, dict) or not str(place.get("name", "")).strip():
+        raise PlanPatchError("新地点缺少名称")
+    try:
+        duration = float(place.get("duration", DEFAULT_NEW_PLACE_DURATION))
+    except (TypeError, ValueError):
+        duration = DEFAULT_NEW_PLACE_DURATION
+    return {
+        "name": str(place["name"]).strip(),
+        "description": str(place.get("description", "") or ""),
+        "duration": duration if duration > 0 else DEFAULT_NEW_PLACE_DURATION
+    }
+
+
+def _insert_index(day_plan: dict, position: Optional[int]) -> int:
+    """position 为从1开始的目标位置，为空时追加到当天末尾"""
+    size = len(day_plan["places"])
+    if position is None:
+        return size
+    try:
+        index = int(position) - 1
+    except (TypeError, ValueError):
+        raise PlanPatchError(f"无效的位置: {position}")
+    return min(max(index, 0), size)
+
+
+def apply_plan_operations(plan: dict, operations: List[dict],
+                          place_key: Optional[Callable[[str], str]] = None) -> tuple:
+    """
+    将编辑操作应用到行程的副本上，place_key 用于地点名称不完全一致时的规范化匹配
+    返回 (更新后的行程, 受影响的天数集合)，天数保留行程中 day 字段的原始值，原行程不会被修改
+    """
+    if not isinstance(operations, list) or not operations:
+        raise PlanPatchError("没有可应用的编辑操作")
+    if len(operations) > MAX_PLAN_OPERATIONS:
+        raise PlanPatchError(f"编辑操作过多（{len(operations)} 个）")
+
+    updated = copy.deepcopy(plan)
+    touched_days = set()
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PlanPatchError(f"无效的编辑操作: {operation}")
+        op = operation.get("op")
+        if op not in SUPPORTED_OPS:
+            raise PlanPatchError(f"不支持的操作类型: {op}")
+
+        day_plan = _find_day(updated, operation.get("day"))
+        if op == OP_ADD:
+            index = _insert_index(day_plan, operation.get("position"))
+            day_plan["places"].insert(index, _normalize_new_place(operation.get("place")))
+        elif op == OP_REMOVE:
+            day_plan["places"].pop(_find_place_index(day_plan, operation.get("name"), place_key))
+        elif op == OP_REPLACE:
+            index = _find_place_index(day_plan, operation.get("name"), place_key)
+            day_plan["places"][index] = _normalize_new_place(operation.get("place"))
+        elif op == OP_MOVE:
+            place = day_plan["places"].pop(_find_place_index(day_plan, operation.get("name"), place_key))
+            target_day = _find_day(updated, operation.get("to_day", day_plan.get("day")))
+            target_day["places"].insert(_insert_index(target_day, operation.get("position")), place)
+            touched_days.add(target_day.get("day"))
+        touched_days.add(day_plan.get("day"))
+
+    return updated, touched_days
@@ -0,0 +1,152 @@
+"""
+服务端行程存储
+
+生成或修改后的完整行程（包含坐标和路线数据）保存在服务端，客户端只需通过行程ID和版本号引用，
+不必在每次修改、意图识别和聊天时上传整份行程。
+默认保存在进程内存中，也可以通过 SQLite 保存以便服务重启后继续使用；
+其他存储只需实现 get/put/delete/size 四个方法即可接入。
+"""
+import copy
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from cache import TTLCache
+
+# 行程在服务端保存的字段
+PLAN_ID_FIELD = "plan_id"
+PLAN_VERSION_FIELD = "plan_version"
+
+# 返回给客户端的错误代码，客户端据此决定重新发送完整行程还是获取最新行程，不依赖错误信息的文字
+PLAN_NOT_FOUND = "plan_not_found"
+PLAN_VERSION_CONFLICT = "plan_version_conflict"
+
+
+class PlanNotFoundError(ValueError):
+    """行程ID不存在或已过期"""
+    error_code = PLAN_NOT_FOUND
+
+
+class PlanVersionConflictError(ValueError):
+    """客户端引用的行程版本与服务端保存的版本不一致"""
+    error_code = PLAN_VERSION_CONFLICT
+
+
+class MemoryPlanBackend:
+    """进程内存储，服务重启后行程会丢失"""
+
+    def __init__(self, ttl: float, maxsize: int = 2000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="plan_store")
+
+    def get(self, plan_id: str) -> Optional[dict]:
+        return self._cache.get(plan_id)
+
+    def put(self, plan_id: str, plan: dict):
+        self._cache.set(plan_id, plan)
+
+    def delete(self, plan_id: str):
+        self._cache.delete(plan_id)
+
+    def size(self) -> int:
+        return self._cache.stats()["size"]
+
+
+class SqlitePlanBackend:
+    """基于SQLite的存储，行程以JSON保存"""
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM plans WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, plan_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM plans WHERE id = ? AND expires_at >= ?", (plan_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, plan_id: str, plan: dict):
+        data = json.dumps(plan, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans (id, data, expires_at) VALUES (?, ?, ?)",
+                (plan_id, data, time.time() + self.ttl)
+            )
+            self._conn.commit()
+
+    def delete(self, plan_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM plans WHERE expires_at >= ?", (time.time(),)).fetchone()[0]
+
+
+class PlanStore:
+    """按ID和版本号保存行程，每次保存同一ID的行程时版本号加1"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+
+    def save(self, plan: dict, plan_id: Optional[str] = None, expected_version: Optional[int] = None) -> dict:
+        """
+        保存行程并在行程中写入 plan_id 和 plan_version，返回同一个行程对象
+        expected_version 为修改所基于的版本：服务端已有更新的版本时抛出 PlanVersionConflictError，
+        避免客户端基于旧版本的修改覆盖其他请求已保存的修改；行程已过期时按新行程保存
+        """
+        with self._lock:
+            plan_id = plan_id or uuid.uuid4().hex
+            previous = self.backend.get(plan_id)
+            if previous is not None and expected_version is not None \
+                    and previous.get(PLAN_VERSION_FIELD) != expected_version:
+                raise PlanVersionConflictError(
+                    f"行程版本已变化（当前版本 {previous.get(PLAN_VERSION_FIELD)}，请求版本 {expected_version}），请刷新后重试"
+                )
+            version = previous.get(PLAN_VERSION_FIELD, 0) + 1 if previous else 1
+            plan[PLAN_ID_FIELD] = plan_id
+            plan[PLAN_VERSION_FIELD] = version
+            # 保存副本，避免返回给调用方的行程被修改后影响已保存的数据
+            self.backend.put(plan_id, copy.deepcopy(plan))
+        return plan
+
+    def get(self, plan_id: str, version: Optional[int] = None) -> dict:
+        """
+        读取行程副本；指定 version 时要求与服务端保存的版本一致
+        行程不存在时抛出 PlanNotFoundError，版本不一致时抛出 PlanVersionConflictError
+        """
+        plan = self.backend.get(plan_id)
+        if plan is None:
+            raise PlanNotFoundError("行程不存在或已过期，请重新发送完整行程")
+        if version is not None and plan.get(PLAN_VERSION_FIELD) != version:
+            raise PlanVersionConflictError(
+                f"行程版本已变化（当前版本 {plan.get(PLAN_VERSION_FIELD)}，请求版本 {version}），请刷新后重试"
+            )
+        return copy.deepcopy(plan)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "plans": self.backend.size()}
+
+
+def create_plan_store(backend: str = "memory", path: Optional[str] = None, ttl: float = 604800) -> PlanStore:
+    """根据配置创建行程存储，backend 为 memory 或 sqlite"""
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("使用 sqlite 行程存储时需要指定数据库路径")
+        return PlanStore(SqlitePlanBackend(path, ttl))
+    if backend != "memory":
+        raise ValueError(f"不支持的行程存储类型: {backend}")
+    return PlanStore(MemoryPlanBackend(ttl))
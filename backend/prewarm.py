@@ -0,0 +1,60 @@
+"""
+热门目的地预热命令
+
+向正在运行的后端服务提交预热任务，并在终端显示进度，例如：
+
+    python prewarm.py 北京 上海 成都 --days 3 5 --plans
+
+预热在服务进程内执行，所有高德地图请求经服务的限流器以后台优先级排队，不会挤占用户请求的配额。
+服务启动时自动预热可通过环境变量 PREWARM_DESTINATIONS 配置。
+"""
+import argparse
+import sys
+import time
+
+import requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预热热门目的地的坐标、路线、城市、天气和行程缓存")
+    parser.add_argument("destinations", nargs="+", help="目的地列表，例如 北京 成都")
+    parser.add_argument("--days", nargs="+", type=int, default=[3], help="预热行程缓存时使用的天数")
+    parser.add_argument("--plans", action="store_true", help="同时调用大模型生成并缓存完整行程")
+    parser.add_argument("--server", default="http://localhost:8000", help="后端服务地址")
+    parser.add_argument("--interval", type=float, default=1.0, help="查询进度的间隔（秒）")
+    args = parser.parse_args()
+
+    response = requests.post(f"{args.server}/api/admin/prewarm", json={
+        "destinations": args.destinations,
+        "days": args.days,
+        "include_plans": args.plans
+    }, timeout=10)
+    response.raise_for_status()
+    submitted = response.json()
+    if not submitted.get("success"):
+        print(f"提交预热任务失败: {submitted.get('error_message')}")
+        return 1
+
+    job_id = submitted["job_id"]
+    print(f"预热任务已提交: {job_id}")
+    last_message = None
+    while True:
+        job = requests.get(f"{args.server}/api/jobs/{job_id}", timeout=10).json().get("job")
+        if job is None:
+            print("预热任务不存在或结果已过期")
+            return 1
+        message = f"[{job['progress']:3d}%] {job['message']}"
+        if message != last_message:
+            print(message)
+            last_message = message
+        if job["status"] == "succeeded":
+            print(f"预热完成: {job['result']}")
+            return 0
+        if job["status"] == "failed":
+            print(f"预热失败: {job['error']}")
+            return 1
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+大模型提示词上下文压缩
+
+估算提示词的token数，将行程以紧凑格式序列化，并按token预算逐级截断或去掉地点描述等次要内容，
+同时记录各类提示词的大小，便于观察调用成本。
+"""
+import json
+import math
+import re
+import threading
+from functools import lru_cache
+from typing import Optional
+
+# 中日韩字符大约每个字符对应一个token，其余字符（英文、数字、标点）大约4个字符对应一个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 行程压缩级别：依次为描述的最大长度（None 表示不截断，0 表示去掉描述）
+PLAN_DESCRIPTION_LIMITS = (None, 60, 20, 0)
+
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数，不依赖具体模型的分词器"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def compact_json(data) -> str:
+    """不带缩进和多余空格的JSON序列化"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def truncate_text(text: str, limit: Optional[int]) -> str:
+    if limit is None or len(text) <= limit:
+        return text
+    if limit <= 0:
+        return ""
+    return text[:limit] + TRUNCATION_MARK
+
+
+def compact_plan(plan: dict, description_limit: Optional[int] = None) -> dict:
+    """只保留大模型编辑行程需要的字段：天数、主题、地点名称、描述和停留时间"""
+    compacted = {
+        "destination": plan.get("destination", ""),
+        "total_days": plan.get("total_days", 0),
+        "itinerary": []
+    }
+    for day in plan.get("itinerary", []) or []:
+        compacted_day = {"day": day.get("day", 0), "theme": day.get("theme", ""), "places": []}
+        for place in day.get("places", []) or []:
+            compacted_place = {"name": place.get("name", "")}
+            description = truncate_text(str(place.get("description", "") or ""), description_limit)
+            if description:
+                compacted_place["description"] = description
+            compacted_place["duration"] = place.get("duration", 0)
+            compacted_day["places"].append(compacted_place)
+        compacted["itinerary"].append(compacted_day)
+    return compacted
+
+
+def serialize_plan_for_prompt(plan: dict, max_tokens: int) -> tuple:
+    """
+    按token预算序列化行程，逐级截断描述直到不超过预算
+    返回 (序列化后的字符串, 使用的压缩级别)；最高级别仍超出预算时返回最高级别的结果
+    """
+    if not plan or not isinstance(plan, dict):
+        return compact_json(plan), 0
+    for level, limit in enumerate(PLAN_DESCRIPTION_LIMITS):
+        text = compact_json(compact_plan(plan, limit))
+        if estimate_tokens(text) <= max_tokens:
+            return text, level
+    return text, len(PLAN_DESCRIPTION_LIMITS) - 1
+
+
+def restore_place_descriptions(updated_plan: dict, original_plan: dict):
+    """
+    提示词中的描述可能被截断或去掉，大模型原样返回的地点按名称从原行程中恢复完整描述
+    """
+    originals = {}
+    for day in (original_plan or {}).get("itinerary", []) or []:
+        for place in day.get("places", []) or []:
+            if place.get("name") and place.get("description"):
+                originals[place["name"]] = str(place["description"])
+
+    for day in (updated_plan or {}).get("itinerary", []) or []:
+        for place in day.get("places", []) or []:
+            original = originals.get(place.get("name"))
+            if original is None:
+                continue
+            description = str(place.get("description", "") or "")
+            if not description or original.startswith(description.rstrip(TRUNCATION_MARK)):
+                place["description"] = original
+
+
+def _format_plan_lines(plan: dict, with_details: bool) -> list:
+    lines = [f"当前行程规划：{plan.get('destination', '未知目的地')}{plan.get('total_days', 'N')}日游"]
+    itinerary = plan.get("itinerary") or []
+    if itinerary:
+        lines.append("详细安排：")
+    for day_plan in itinerary:
+        if with_details:
+            day_places = [
+                f"{place.get('name', '')}({place['duration']}h)" if place.get("duration") else place.get("name", "")
+                for place in day_plan.get("places", [])
+            ]
+        else:
+            day_places = [place.get("name", "") for place in day_plan.get("places", [])]
+        lines.append(f"第{day_plan.get('day', '?')}天（{day_plan.get('theme', '主题未定')}）：{' -> '.join(day_places)}")
+    return lines
+
+
+@lru_cache(maxsize=128)
+def build_chat_context(raw_context: str, max_tokens: int) -> str:
+    """
+    将前端传来的原始上下文JSON转换为简短的文字描述，相同的上下文只解析一次
+    无法识别的上下文按原文截断到预算以内
+    """
+    try:
+        context_data = json.loads(raw_context)
+    except (json.JSONDecodeError, TypeError):
+        context_data = None
+
+    if not isinstance(context_data, dict):
+        return _truncate_to_tokens(raw_context, max_tokens)
+    return _format_chat_context(context_data, context_data.get("currentPlan"), raw_context, max_tokens)
+
+
+def build_chat_context_with_plan(raw_context: Optional[str], plan: Optional[dict], max_tokens: int) -> str:
+    """与 build_chat_context 相同，但行程使用服务端保存的数据而不是上下文中的 currentPlan"""
+    try:
+        context_data = json.loads(raw_context) if raw_context else {}
+    except json.JSONDecodeError:
+        context_data = {}
+    if not isinstance(context_data, dict):
+        context_data = {}
+    return _format_chat_context(context_data, plan, raw_context or "", max_tokens)
+
+
+def _format_chat_context(context_data: dict, plan: Optional[dict], raw_context: str, max_tokens: int) -> str:
+    route = context_data.get("currentRoute")
+    selected_day = context_data.get("selectedDay")
+
+    tail = []
+    if isinstance(route, dict) and route:
+        start_name = (route.get("start_point") or {}).get("name", "起点")
+        end_name = (route.get("end_point") or {}).get("name", "终点")
+        mode = route.get("mode", "driving")
+        mode_text = {"driving": "驾车", "walking": "步行", "transit": "公交"}.get(mode, mode)
+        tail.append(f"当前路径规划：{start_name} → {end_name}（{mode_text}）")
+    if selected_day:
+        tail.append(f"当前查看：第{selected_day}天的行程")
+
+    if not isinstance(plan, dict) or not plan:
+        if not tail:
+            return _truncate_to_tokens(raw_context, max_tokens)
+        return _truncate_to_tokens("当前状态：\n" + "\n".join(tail), max_tokens)
+
+    # 优先带上停留时间，超出预算时只保留地点名称，仍超出时截断
+    for with_details in (True, False):
+        text = "当前状态：\n" + "\n".join(_format_plan_lines(plan, with_details) + tail)
+        if estimate_tokens(text) <= max_tokens:
+            return text
+    return _truncate_to_tokens(text, max_tokens)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算的token数截断文本"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + TRUNCATION_MARK
+
+
+class PromptMetrics:
+    """按提示词类型统计调用次数、估算token数和压缩节省的token数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, kind: str, prompt_tokens: int, original_tokens: Optional[int] = None, level: int = 0):
+        original_tokens = prompt_tokens if original_tokens is None else original_tokens
+        with self._lock:
+            stats = self._stats.setdefault(kind, {
+                "calls": 0, "total_tokens": 0, "max_tokens": 0, "saved_tokens": 0, "compacted_calls": 0
+            })
+            stats["calls"] += 1
+            stats["total_tokens"] += prompt_tokens
+            stats["max_tokens"] = max(stats["max_tokens"], prompt_tokens)
+            stats["saved_tokens"] += max(original_tokens - prompt_tokens, 0)
+            if original_tokens > prompt_tokens:
+                stats["compacted_calls"] += 1
+        level_text = f"，压缩级别 {level}" if level else ""
+        print(f"提示词[{kind}] 约 {prompt_tokens} tokens（压缩前约 {original_tokens}{level_text}）")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                kind: dict(stats, avg_tokens=round(stats["total_tokens"] / stats["calls"], 1))
+                for kind, stats in self._stats.items()
+            }
@@ -0,0 +1,136 @@
+"""
+高德地图API限流器
+
+按API Key维护令牌桶，所有请求在发出前先获取令牌，保证每个Key的QPS不超过配额。
+等待中的请求按优先级排队：交互请求（路径、天气等用户正在等待的请求）优先于行程生成，
+行程生成优先于后台预取。配置多个Key时自动选择当前可用令牌最多的Key分摊负载。
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import List, Optional
+
+# 优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background"
+}
+
+
+class RateLimitTimeout(Exception):
+    """在超时时间内没有获取到令牌"""
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多保存 capacity 个"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        return now >= self.blocked_until and self.tokens >= 1
+
+    def wait_time(self, now: float) -> float:
+        """距离下一个令牌可用还需等待的秒数"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateGovernor:
+    """多Key令牌桶限流器，等待中的请求按优先级和先后顺序获取令牌"""
+
+    def __init__(self, keys: List[str], qps_per_key: float, burst: Optional[float] = None):
+        self.keys = list(keys)
+        self.buckets = {key: TokenBucket(qps_per_key, burst) for key in self.keys}
+        self._cond = threading.Condition()
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self.acquired = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> str:
+        """阻塞直到获取到令牌，返回本次请求应使用的Key"""
+        if not self.keys:
+            raise ValueError("AMAP_API_KEY not found in environment variables")
+
+        entry = (priority, next(self._sequence))
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    for bucket in self.buckets.values():
+                        bucket.refill(now)
+                    if self._waiters[0] == entry:
+                        key = self._pick_key(now)
+                        if key is not None:
+                            self.buckets[key].tokens -= 1
+                            heapq.heappop(self._waiters)
+                            self.acquired[PRIORITY_NAMES.get(priority, "normal")] += 1
+                            self.wait_seconds += now - start
+                            self._cond.notify_all()
+                            return key
+                        wait = min(bucket.wait_time(now) for bucket in self.buckets.values())
+                    else:
+                        # 不是队首时等待被唤醒，同时设置上限避免错过令牌补充
+                        wait = 0.05
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise RateLimitTimeout("等待高德地图API配额超时")
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(max(wait, 0.001))
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def _pick_key(self, now: float) -> Optional[str]:
+        """选择当前可用令牌最多的Key"""
+        candidates = [key for key, bucket in self.buckets.items() if bucket.available(now)]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda key: self.buckets[key].tokens)
+
+    def penalize(self, key: str, seconds: float = 1.0):
+        """上游返回超出QPS限制时，暂停该Key一段时间并清空令牌"""
+        with self._cond:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.tokens = 0
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+                self.throttled += 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "keys": len(self.keys),
+                "waiting": len(self._waiters),
+                "acquired": dict(self.acquired),
+                "throttled_by_upstream": self.throttled,
+                "total_wait_seconds": round(self.wait_seconds, 3)
+            }
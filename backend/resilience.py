@@ -0,0 +1,140 @@
+"""
+上游服务容错工具
+
+CircuitBreaker：上游服务连续失败达到阈值后熔断一段时间，期间请求直接失败而不再等待超时，
+恢复时间过后放行少量试探请求，成功则恢复正常。
+deadline_budget：为一段处理流程设置整体截止时间，流程中的上游请求据此缩短超时或直接放弃。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class DeadlineExceeded(Exception):
+    """处理流程的时间预算已用完"""
+
+
+class CircuitBreaker:
+    """按上游服务划分的熔断器"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.half_open_since = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """判断当前是否允许发出请求"""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                # 恢复时间已过，进入半开状态放行试探请求
+                self.state = STATE_HALF_OPEN
+                self.half_open_calls = 0
+            if self.state == STATE_HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    if time.monotonic() - self.half_open_since < self.recovery_timeout:
+                        self.rejected += 1
+                        return False
+                    # 试探请求超过恢复时间仍没有结果，视为已丢失，重新放行试探请求
+                    self.half_open_calls = 0
+                if self.half_open_calls == 0:
+                    self.half_open_since = time.monotonic()
+                self.half_open_calls += 1
+            return True
+
+    def release(self):
+        """
+        放行的请求没有得出上游是否可用的结论（例如本地限流超时、时间预算用完）时调用，
+        归还半开状态下占用的试探名额，避免熔断器一直停留在半开状态
+        """
+        with self._lock:
+            if self.state == STATE_HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                print(f"熔断器 {self.name} 已恢复")
+            self.state = STATE_CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    print(f"熔断器 {self.name} 已打开：连续失败 {self.failures} 次，{self.recovery_timeout} 秒后重试")
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "half_open_calls": self.half_open_calls,
+                "rejected": self.rejected
+            }
+
+
+# 当前处理流程的截止时间（time.monotonic() 时间），为空表示不限时
+_deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_budget(seconds: Optional[float]):
+    """在代码块内设置时间预算，嵌套时取更早的截止时间；seconds 为空或不大于0时不限时"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline_var.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline_var.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline_var.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """剩余的时间预算（秒），未设置预算时返回None"""
+    deadline = _deadline_var.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def budget_exhausted() -> bool:
+    remaining = remaining_budget()
+    return remaining is not None and remaining <= 0
+
+
+def check_deadline():
+    """时间预算已用完时抛出 DeadlineExceeded"""
+    if budget_exhausted():
+        raise DeadlineExceeded("处理时间预算已用完")
@@ -0,0 +1,110 @@
+"""
+大体积响应的快速序列化与压缩
+
+行程、路线等接口返回的嵌套数据较大，使用 orjson（已安装时）序列化，
+并在响应超过一定大小时根据请求的 Accept-Encoding 使用 brotli 或 gzip 压缩。
+orjson 和 brotli 均为可选依赖，未安装时分别退回到标准库 json 和 gzip。
+"""
+import gzip
+import json
+import threading
+from contextvars import ContextVar
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+# 当前请求的 Accept-Encoding，由中间件设置
+accept_encoding_var: ContextVar[str] = ContextVar("accept_encoding", default="")
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """判断 Accept-Encoding 中是否接受指定编码（q=0 表示明确拒绝）"""
+    for item in accept_encoding.lower().split(","):
+        name, *params = item.strip().split(";")
+        if name.strip() != encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 1.0
+        return quality > 0
+    return False
+
+
+class ResponseStats:
+    """统计序列化后的原始字节数和实际发送的字节数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    def record(self, raw_size: int, sent_size: int):
+        with self._lock:
+            self.responses += 1
+            self.raw_bytes += raw_size
+            self.sent_bytes += sent_size
+            if sent_size < raw_size:
+                self.compressed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "compressed": self.compressed,
+                "raw_bytes": self.raw_bytes,
+                "sent_bytes": self.sent_bytes,
+                "ratio": round(self.sent_bytes / self.raw_bytes, 3) if self.raw_bytes else 1.0
+            }
+
+
+response_stats = ResponseStats()
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 序列化，超过 min_size 字节时按客户端支持的编码压缩的JSON响应"""
+
+    min_size = 1024
+    gzip_level = 5
+    brotli_quality = 4
+
+    def __init__(self, content: Any, *args, **kwargs):
+        super().__init__(content, *args, **kwargs)
+        raw_size = len(self.body)
+        if raw_size >= self.min_size:
+            self.headers["vary"] = "Accept-Encoding"
+            self.compress(accept_encoding_var.get())
+        response_stats.record(raw_size, len(self.body))
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def compress(self, accept_encoding: str):
+        """按 brotli、gzip 的优先顺序压缩响应体，并更新相关响应头"""
+        if brotli is not None and accepts_encoding(accept_encoding, "br"):
+            body, encoding = brotli.compress(self.body, quality=self.brotli_quality), "br"
+        elif accepts_encoding(accept_encoding, "gzip"):
+            body, encoding = gzip.compress(self.body, compresslevel=self.gzip_level), "gzip"
+        else:
+            return
+        self.body = body
+        self.headers["content-length"] = str(len(body))
+        self.headers["content-encoding"] = encoding
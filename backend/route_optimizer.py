@@ -0,0 +1,234 @@
+"""
+行程本地优化算法
+
+只依赖行程中已有的坐标信息，不调用大模型和高德地图API，
+用于在毫秒级别内完成单日地点排序等操作。
+"""
+import math
+from typing import List, Optional
+
+# 地球平均半径（公里）
+EARTH_RADIUS_KM = 6371.0088
+
+# 各交通方式在城市内的平均速度（公里/小时）和道路绕行系数，用于无实际路线时估算交通时间
+MODE_SPEED_KMH = {
+    "driving": 30.0,
+    "transit": 20.0,
+    "bicycling": 15.0,
+    "walking": 5.0
+}
+ROAD_DETOUR_FACTOR = 1.3
+
+
+def haversine_km(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    """计算两点间的球面直线距离（公里）"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    dlng = lng2 - lng1
+    dlat = lat2 - lat1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def estimate_travel_seconds(distance_km: float, mode: str = "driving") -> int:
+    """根据直线距离粗略估算交通时间（秒）"""
+    speed = MODE_SPEED_KMH.get(mode, MODE_SPEED_KMH["driving"])
+    return int(distance_km * ROAD_DETOUR_FACTOR / speed * 3600)
+
+
+def build_distance_matrix(points: List[tuple]) -> List[List[float]]:
+    """根据 (经度, 纬度) 列表构建距离矩阵（公里）"""
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            distance = haversine_km(points[i][0], points[i][1], points[j][0], points[j][1])
+            matrix[i][j] = distance
+            matrix[j][i] = distance
+    return matrix
+
+
+def path_cost(order: List[int], matrix: List[List[float]]) -> float:
+    """计算按给定顺序游览（不返回起点）的总代价"""
+    return sum(matrix[order[i]][order[i + 1]] for i in range(len(order) - 1))
+
+
+def nearest_neighbor_order(matrix: List[List[float]], start: int = 0) -> List[int]:
+    """最近邻启发式：从起点出发，每次前往最近的未访问地点"""
+    size = len(matrix)
+    order = [start]
+    visited = {start}
+    while len(order) < size:
+        current = order[-1]
+        next_index = min(
+            (j for j in range(size) if j not in visited),
+            key=lambda j: matrix[current][j]
+        )
+        order.append(next_index)
+        visited.add(next_index)
+    return order
+
+
+def two_opt(order: List[int], matrix: List[List[float]], fix_start: bool = True, max_passes: int = 50) -> List[int]:
+    """
+    2-opt 局部优化：反转子路径直到无法继续缩短开放路径的总代价
+    矩阵可以不对称（例如高德地图按方向返回的交通时间）：反转子路径时内部每条边的方向也会改变，
+    因此按反转前后的完整代价差判断，只接受严格减小的反转，并最多遍历 max_passes 轮
+    """
+    best = list(order)
+    size = len(best)
+    first = 1 if fix_start else 0
+
+    def edge_prefix_sums():
+        # forward[k] 为 best[0..k] 按顺序游览的代价，backward[k] 为其中每条边都反向时的代价
+        forward = [0.0] * size
+        backward = [0.0] * size
+        for k in range(1, size):
+            forward[k] = forward[k - 1] + matrix[best[k - 1]][best[k]]
+            backward[k] = backward[k - 1] + matrix[best[k]][best[k - 1]]
+        return forward, backward
+
+    for _ in range(max_passes):
+        improved = False
+        forward, backward = edge_prefix_sums()
+        for i in range(first, size - 1):
+            for j in range(i + 1, size):
+                # 反转 best[i..j]：两端的边 (i-1, i)、(j, j+1) 改变，内部的边全部反向
+                before = matrix[best[i - 1]][best[i]] if i > 0 else 0.0
+                after = matrix[best[j]][best[j + 1]] if j < size - 1 else 0.0
+                new_before = matrix[best[i - 1]][best[j]] if i > 0 else 0.0
+                new_after = matrix[best[i]][best[j + 1]] if j < size - 1 else 0.0
+                old_cost = before + after + forward[j] - forward[i]
+                new_cost = new_before + new_after + backward[j] - backward[i]
+                if new_cost < old_cost - 1e-9:
+                    best[i:j + 1] = reversed(best[i:j + 1])
+                    forward, backward = edge_prefix_sums()
+                    improved = True
+        if not improved:
+            break
+    return best
+
+
+def solve_open_tsp(matrix: List[List[float]], fix_start: bool = True) -> List[int]:
+    """
+    求解开放路径的旅行商问题（不需要回到起点）
+    fix_start 为 True 时固定第一个地点，否则尝试所有起点并取最优结果
+    """
+    size = len(matrix)
+    if size <= 2:
+        return list(range(size))
+
+    starts = [0] if fix_start else range(size)
+    best_order: Optional[List[int]] = None
+    best_cost = float("inf")
+    for start in starts:
+        order = two_opt(nearest_neighbor_order(matrix, start), matrix, fix_start)
+        cost = path_cost(order, matrix)
+        if cost < best_cost - 1e-9:
+            best_order = order
+            best_cost = cost
+    return best_order if best_order is not None else list(range(size))
+
+
+def format_duration_text(seconds: int) -> str:
+    """将秒数转换为“X小时Y分钟”的友好格式"""
+    minutes = int(seconds) // 60
+    if minutes < 60:
+        return f"{minutes}分钟"
+    hours = minutes // 60
+    remaining_minutes = minutes % 60
+    if remaining_minutes > 0:
+        return f"{hours}小时{remaining_minutes}分钟"
+    return f"{hours}小时"
+
+
+def _farthest_point_centers(points: List[tuple], k: int) -> List[tuple]:
+    """确定性的最远点初始化：从最靠近整体中心的点出发，依次选取距离已选中心最远的点"""
+    center_lng = sum(p[0] for p in points) / len(points)
+    center_lat = sum(p[1] for p in points) / len(points)
+    first = min(range(len(points)), key=lambda i: haversine_km(points[i][0], points[i][1], center_lng, center_lat))
+    centers = [points[first]]
+    while len(centers) < k:
+        farthest = max(
+            range(len(points)),
+            key=lambda i: min(haversine_km(points[i][0], points[i][1], c[0], c[1]) for c in centers)
+        )
+        centers.append(points[farthest])
+    return centers
+
+
+def _weighted_center(points: List[tuple], weights: List[float], members: List[int], fallback: tuple) -> tuple:
+    """计算簇的加权中心，空簇保持原中心"""
+    total = sum(weights[i] for i in members)
+    if not members or total <= 0:
+        return fallback
+    lng = sum(points[i][0] * weights[i] for i in members) / total
+    lat = sum(points[i][1] * weights[i] for i in members) / total
+    return (lng, lat)
+
+
+def capacity_constrained_kmeans(points: List[tuple], weights: List[float], k: int,
+                                capacity: Optional[float] = None, max_iterations: int = 50) -> List[int]:
+    """
+    带容量约束的 k-means 聚类
+    weights 为每个点的权重（如建议停留时长），每个簇的总权重不超过 capacity
+    返回每个点所属簇的编号
+    """
+    size = len(points)
+    if size == 0:
+        return []
+    k = max(1, min(k, size))
+    weights = [max(float(w), 0.0) for w in weights]
+    if capacity is None:
+        # 默认容量为平均值上浮20%，且至少能容纳最重的单个点
+        capacity = max(sum(weights) / k * 1.2, max(weights))
+
+    centers = _farthest_point_centers(points, k)
+    labels = [-1] * size
+    for _ in range(max_iterations):
+        distances = [
+            [haversine_km(points[i][0], points[i][1], c[0], c[1]) for c in centers]
+            for i in range(size)
+        ]
+        # 优先分配“后悔值”大的点（最近簇与次近簇差距越大，越应先满足其最近簇）
+        def regret(i):
+            ranked = sorted(distances[i])
+            return ranked[1] - ranked[0] if len(ranked) > 1 else 0.0
+        assign_order = sorted(range(size), key=lambda i: (-regret(i), -weights[i]))
+
+        loads = [0.0] * k
+        counts = [0] * k
+        new_labels = [-1] * size
+        for i in assign_order:
+            candidates = sorted(range(k), key=lambda c: distances[i][c])
+            chosen = None
+            for c in candidates:
+                if loads[c] + weights[i] <= capacity + 1e-9:
+                    chosen = c
+                    break
+            if chosen is None:
+                # 所有簇都已满时放入负载最小的簇
+                chosen = min(range(k), key=lambda c: loads[c])
+            new_labels[i] = chosen
+            loads[chosen] += weights[i]
+            counts[chosen] += 1
+
+        # 保证每个簇至少有一个点，从点数最多的簇中移出离新簇最近的点
+        for c in range(k):
+            if counts[c] == 0:
+                donor = max(range(k), key=lambda d: counts[d])
+                member = min(
+                    (i for i in range(size) if new_labels[i] == donor),
+                    key=lambda i: distances[i][c]
+                )
+                new_labels[member] = c
+                counts[donor] -= 1
+                counts[c] += 1
+
+        if new_labels == labels:
+            break
+        labels = new_labels
+        centers = [
+            _weighted_center(points, weights, [i for i in range(size) if labels[i] == c], centers[c])
+            for c in range(k)
+        ]
+    return labels
@@ -0,0 +1,157 @@
+"""
+服务启动耗时基准测试
+
+在独立进程中测量 main 模块的导入耗时，并启动一个 uvicorn 服务测量：
+从启动到 /health 可用的时间、第一个请求的延迟，以及后台预加载依赖完成的时间。例如：
+
+    python startup_benchmark.py --runs 5 --output startup_benchmark.jsonl
+
+指定 --output 时每次结果追加为一行JSON，便于跟踪启动耗时的变化。
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 第一个业务请求使用本地重新排序接口，不依赖大模型和高德地图API
+SAMPLE_REORDER_REQUEST = {
+    "current_plan": {
+        "itinerary": [{
+            "day": 1,
+            "places": [
+                {"name": "天安门广场", "longitude": 116.397755, "latitude": 39.903179},
+                {"name": "颐和园", "longitude": 116.275179, "latitude": 39.999617},
+                {"name": "故宫博物院", "longitude": 116.397026, "latitude": 39.918058},
+                {"name": "圆明园", "longitude": 116.310905, "latitude": 40.008476}
+            ]
+        }]
+    }
+}
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def measure_import(env: dict) -> float:
+    """在新进程中导入 main 模块，返回导入耗时（毫秒）"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    return float(output[-1]) * 1000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def timed_request(method: str, url: str, **kwargs) -> tuple:
+    start = time.perf_counter()
+    response = requests.request(method, url, timeout=30, **kwargs)
+    return response, (time.perf_counter() - start) * 1000
+
+
+def measure_server(env: dict, timeout: float) -> dict:
+    """启动 uvicorn 服务，测量 /health 可用时间、首个请求延迟和依赖预加载完成时间（毫秒）"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        result = {}
+        while True:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError("服务在超时时间内没有响应 /health")
+            if process.poll() is not None:
+                raise RuntimeError(f"服务进程已退出，返回码 {process.returncode}")
+            try:
+                response, latency = timed_request("GET", f"{base_url}/health")
+                if response.status_code == 200:
+                    result["ready_ms"] = (time.perf_counter() - start) * 1000
+                    result["first_health_ms"] = latency
+                    break
+            except requests.ConnectionError:
+                time.sleep(0.01)
+
+        _, result["first_request_ms"] = timed_request(
+            "POST", f"{base_url}/api/trip/reorder", json=SAMPLE_REORDER_REQUEST
+        )
+
+        # 等待后台预加载完成
+        result["preload_done_ms"] = None
+        while time.perf_counter() - start < timeout:
+            imports = requests.get(f"{base_url}/api/stats", timeout=30).json().get("imports", {})
+            if not imports.get("pending"):
+                result["preload_done_ms"] = (time.perf_counter() - start) * 1000
+                result["import_ms"] = imports.get("loaded_ms", {})
+                break
+            time.sleep(0.05)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def summarize(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {}
+    return {
+        "median": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量后端模块导入耗时和服务启动后首个请求的延迟")
+    parser.add_argument("--runs", type=int, default=3, help="重复测量的次数")
+    parser.add_argument("--no-preload", action="store_true", help="关闭启动后的后台依赖预加载")
+    parser.add_argument("--timeout", type=float, default=60, help="等待服务启动的超时时间（秒）")
+    parser.add_argument("--output", help="将结果追加写入的JSON Lines文件")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PRELOAD_HEAVY_IMPORTS"] = "false" if args.no_preload else "true"
+    env["PREWARM_DESTINATIONS"] = ""  # 基准测试时不提交预热任务
+
+    imports, servers = [], []
+    for run in range(args.runs):
+        imports.append(measure_import(env))
+        servers.append(measure_server(env, args.timeout))
+        print(f"第{run + 1}次: 导入 {imports[-1]:.0f}ms，/health 可用 {servers[-1]['ready_ms']:.0f}ms，"
+              f"首个请求 {servers[-1]['first_request_ms']:.0f}ms")
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "runs": args.runs,
+        "preload": not args.no_preload,
+        "import_ms": summarize(imports),
+        "ready_ms": summarize([s["ready_ms"] for s in servers]),
+        "first_health_ms": summarize([s["first_health_ms"] for s in servers]),
+        "first_request_ms": summarize([s["first_request_ms"] for s in servers]),
+        "preload_done_ms": summarize([s["preload_done_ms"] for s in servers]),
+        "dependency_import_ms": servers[-1].get("import_ms", {})
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
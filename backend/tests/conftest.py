@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 后端模块按同级目录导入（例如 from cache import TTLCache），测试时把 backend 目录加入搜索路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from job_queue import JOB_FAILED, JOB_QUEUED, JobQueue, JobStore
+
+
+def make_store(tmp_path, owner):
+    return JobStore(str(tmp_path / "jobs.db"), owner=owner, heartbeat_interval=3600)
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_creating_queue_does_not_fail_other_workers_jobs(tmp_path):
+    other = make_store(tmp_path, f"{socket.gethostname()}:{os.getpid()}:other")
+    job_id = other.create("plan")
+
+    JobQueue(make_store(tmp_path, "worker-b"))
+    assert other.get(job_id)["status"] == JOB_QUEUED
+
+
+def test_recover_fails_only_dead_or_stale_owners(tmp_path):
+    alive = make_store(tmp_path, f"{socket.gethostname()}:{os.getpid()}:alive")
+    dead = make_store(tmp_path, f"{socket.gethostname()}:{exited_pid()}:dead")
+    remote = make_store(tmp_path, "other-host:1:remote")
+    alive_job, dead_job = alive.create("plan"), dead.create("plan")
+    fresh_job, stale_job = remote.create("plan"), remote.create("plan")
+    remote.update(stale_job, heartbeat_at=time.time() - 120)
+
+    me = make_store(tmp_path, "me")
+    own_job = me.create("plan")
+    assert JobQueue(me).recover_orphaned(stale_after=60) == 2
+
+    assert me.get(dead_job)["status"] == JOB_FAILED
+    assert me.get(stale_job)["status"] == JOB_FAILED
+    for job_id in (alive_job, fresh_job, own_job):
+        assert me.get(job_id)["status"] == JOB_QUEUED
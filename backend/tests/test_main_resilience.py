@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+import requests
+
+# 导入 main 前关闭启动时的后台加载和预热，任务数据库写到临时目录
+os.environ.setdefault("AMAP_API_KEY", "test-key")
+os.environ.setdefault("PRELOAD_HEAVY_IMPORTS", "false")
+os.environ.setdefault("PREWARM_DESTINATIONS", "")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+import main  # noqa: E402
+from resilience import STATE_CLOSED, CircuitBreaker, DeadlineExceeded, deadline_budget  # noqa: E402
+
+URL = "https://restapi.amap.com/v3/direction/driving"
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker("amap:direction", failure_threshold=1, recovery_timeout=30)
+    with mock.patch.object(main, "get_amap_breaker", return_value=breaker):
+        yield breaker
+
+
+def test_budget_shortened_timeout_does_not_count_as_failure(breaker):
+    with mock.patch.object(main.requests, "get", side_effect=requests.Timeout()):
+        with deadline_budget(1.0), pytest.raises(DeadlineExceeded):
+            main.amap_get(URL, {})
+    assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_full_timeout_counts_as_failure(breaker):
+    with mock.patch.object(main.requests, "get", side_effect=requests.Timeout()):
+        with pytest.raises(requests.Timeout):
+            main.amap_get(URL, {})
+    assert breaker.state != STATE_CLOSED
+
+
+def test_small_remaining_budget_skips_request(breaker):
+    with mock.patch.object(main.requests, "get") as get:
+        with deadline_budget(main.AMAP_MIN_REQUEST_TIMEOUT / 2), pytest.raises(DeadlineExceeded):
+            main.amap_get(URL, {})
+    get.assert_not_called()
+
+
+class FakeStreamingLLM:
+    def __init__(self, chunks=None, error=None):
+        self.chunks = chunks or []
+        self.error = error
+
+    def stream(self, messages):
+        if self.error:
+            raise self.error
+        return iter(self.chunks)
+
+
+def test_stream_llm_records_breaker_state():
+    breaker = CircuitBreaker("llm", failure_threshold=1, recovery_timeout=30)
+    with mock.patch.object(main, "llm_breaker", breaker):
+        assert list(main.stream_llm(FakeStreamingLLM(["a", "b"]), [])) == ["a", "b"]
+        assert breaker.state == STATE_CLOSED
+
+        with pytest.raises(ConnectionError):
+            list(main.stream_llm(FakeStreamingLLM(error=ConnectionError()), []))
+        with pytest.raises(main.CircuitOpenError):
+            list(main.stream_llm(FakeStreamingLLM(["a"]), []))
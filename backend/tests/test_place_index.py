@@ -0,0 +1,63 @@
+import pytest
+
+from place_index import PlaceAliasIndex
+
+
+class DictCache(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+@pytest.fixture
+def index():
+    return PlaceAliasIndex(DictCache())
+
+
+@pytest.mark.parametrize("name, city, expected", [
+    ("上海市南京路步行街", None, ("上海", "南京路步行街")),
+    ("南京市湖南路步行街", None, ("南京", "湖南路步行街")),
+    ("广州市北京路步行街", None, ("广州", "北京路步行街")),
+    ("北京路步行街", "广州市", ("广州", "北京路步行街")),
+    ("湖南路", "南京", ("南京", "湖南路")),
+    ("上海南京路步行街", None, ("上海", "南京路步行街")),
+    ("四川省成都市武侯祠", None, ("成都", "武侯祠")),
+    ("四川成都武侯祠", None, ("成都", "武侯祠")),
+    ("成都武侯祠", None, ("成都", "武侯祠")),
+    ("武侯祠", "成都市", ("成都", "武侯祠")),
+    ("新疆喀什地区喀什古城", None, ("喀什", "喀什古城")),
+    ("四川大学", "成都", ("成都", "四川大学")),
+    ("成都大学", None, ("", "成都大学")),
+    ("九寨沟风景名胜区", "阿坝藏族羌族自治州", ("阿坝藏族羌族", "九寨沟")),
+])
+def test_split(index, name, city, expected):
+    assert index.split(name, city) == expected
+
+
+@pytest.mark.parametrize("destination, expected", [
+    ("四川成都", "成都市"),
+    ("成都", "成都市"),
+    ("上海", "上海市"),
+    ("四川", "四川省"),
+    ("火星", None),
+])
+def test_city_hint(index, destination, expected):
+    assert index.city_hint(destination) == expected
+
+
+@pytest.mark.parametrize("name, poi_name, expected", [
+    ("武侯祠", "武侯祠", True),
+    ("四川省成都市武侯祠", "武侯祠", True),
+    ("成都武侯祠", "武侯祠", True),
+    ("武侯祠", "武侯祠大街(地铁站)", False),
+    ("武侯祠", "成都武侯祠博物馆", False),
+    ("", "武侯祠", False),
+])
+def test_same_place(index, name, poi_name, expected):
+    assert index.same_place(name, "成都市", {"id": "B001", "name": poi_name, "cityname": "成都市"}) is expected
+
+
+def test_learned_aliases_share_canonical_id(index):
+    index.learn_poi("四川省成都市武侯祠", "成都", {"id": "B001", "name": "武侯祠", "cityname": "成都市"})
+    assert index.canonical_id("成都武侯祠") == "amap:B001"
+    assert index.canonical_id("武侯祠", "成都市") == "amap:B001"
+    assert index.canonical_id("南京市湖南路步行街") == "南京|湖南路步行街"
@@ -0,0 +1,12 @@
+from plan_cache import PlanCache
+
+
+def test_variant_count_does_not_advance_rotation():
+    cache = PlanCache(max_variants=2)
+    assert cache.variant_count("北京", 3) == 0
+    cache.put("北京", 3, "行程A", {"plan": "A"})
+    cache.put("北京市", 3, "行程B", {"plan": "B"})
+
+    for _ in range(3):
+        assert cache.variant_count(" 北京 ", 3) == 2
+    assert [cache.next_text("北京", 3) for _ in range(3)] == ["行程A", "行程B", "行程A"]
@@ -0,0 +1,65 @@
+import pytest
+
+from place_index import PlaceAliasIndex
+from plan_patch import PlanPatchError, apply_plan_operations
+
+
+def make_plan(day_values):
+    return {
+        "itinerary": [
+            {"day": day, "places": [{"name": f"景点{i}"}]}
+            for i, day in enumerate(day_values, 1)
+        ]
+    }
+
+
+@pytest.mark.parametrize("day_values, day", [
+    ([1, 2], 2),
+    (["1", "2"], "2"),
+    (["第1天", "第2天"], 2),
+    ([1, 2], "第2天"),
+    ([1, 2], "Day 2"),
+])
+def test_find_day_accepts_day_labels(day_values, day):
+    updated, touched = apply_plan_operations(make_plan(day_values), [{"op": "remove", "day": day, "name": "景点2"}])
+    assert updated["itinerary"][1]["places"] == []
+    assert touched == {day_values[1]}
+
+
+@pytest.mark.parametrize("day_values, day", [
+    (["第一天", None], 1),
+    ([1, 2], "最后一天"),
+    ([1, 2], 3),
+])
+def test_unknown_day_raises_patch_error(day_values, day):
+    with pytest.raises(PlanPatchError):
+        apply_plan_operations(make_plan(day_values), [{"op": "remove", "day": day, "name": "景点1"}])
+
+
+class DictCache(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+def core_name(name):
+    return PlaceAliasIndex(DictCache()).split(name)[1]
+
+
+@pytest.mark.parametrize("places, name, expected", [
+    ([{"name": "成都武侯祠"}, {"name": "宽窄巷子"}], "四川省成都市武侯祠", ["宽窄巷子"]),
+    (["坏数据", {"name": "宽窄巷子"}], "宽窄巷子", ["坏数据"]),
+])
+def test_remove_matches_normalized_core_name(places, name, expected):
+    plan = {"itinerary": [{"day": 1, "places": places}]}
+    updated, _ = apply_plan_operations(plan, [{"op": "remove", "day": 1, "name": name}], place_key=core_name)
+    assert [p["name"] if isinstance(p, dict) else p for p in updated["itinerary"][0]["places"]] == expected
+
+
+@pytest.mark.parametrize("places, name", [
+    ([{"name": "人民公园"}], "公园"),
+    ([{"name": "人民公园"}, "坏数据"], "文殊院"),
+])
+def test_short_or_unknown_name_raises_patch_error(places, name):
+    plan = {"itinerary": [{"day": 1, "places": places}]}
+    with pytest.raises(PlanPatchError):
+        apply_plan_operations(plan, [{"op": "remove", "day": 1, "name": name}], place_key=core_name)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+
+# 导入 main 前关闭启动时的后台加载和预热，任务数据库写到临时目录
+os.environ.setdefault("AMAP_API_KEY", "test-key")
+os.environ.setdefault("PRELOAD_HEAVY_IMPORTS", "false")
+os.environ.setdefault("PREWARM_DESTINATIONS", "")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from plan_store import PLAN_NOT_FOUND, PLAN_VERSION_CONFLICT  # noqa: E402
+
+PLAN = {
+    "destination": "成都",
+    "itinerary": [{"day": 1, "places": [
+        {"name": "武侯祠", "longitude": 104.048, "latitude": 30.646},
+        {"name": "宽窄巷子", "longitude": 104.055, "latitude": 30.669},
+        {"name": "锦里", "longitude": 104.050, "latitude": 30.645}
+    ]}]
+}
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def stored_plan(client):
+    return client.post("/api/trip/reorder", json={"current_plan": dict(PLAN)}).json()["updated_plan"]
+
+
+def test_stale_version_returns_conflict_code(client, stored_plan):
+    response = client.post("/api/trip/update", json={
+        "plan_id": stored_plan["plan_id"], "plan_version": stored_plan["plan_version"] - 1, "modification_request": "删除锦里"
+    }).json()
+    assert not response["success"]
+    assert response["error_code"] == PLAN_VERSION_CONFLICT
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/api/trip/reorder", {"plan_id": "missing", "plan_version": 1}),
+    ("/api/trip/parse-query", {"plan_id": "missing", "query": "你好"}),
+])
+def test_missing_plan_returns_not_found_code(client, path, payload):
+    response = client.post(path, json=payload).json()
+    assert not response["success"]
+    assert response["error_code"] == PLAN_NOT_FOUND
+
+
+def test_stored_plan_lookup_and_chat_use_not_found_code(client):
+    assert client.get("/api/plans/missing").json()["error_code"] == PLAN_NOT_FOUND
+    response = client.post("/api/chat/stream", json={"message": "你好", "plan_id": "missing"})
+    assert response.status_code == 409
+    assert response.json()["error_code"] == PLAN_NOT_FOUND
@@ -0,0 +1,25 @@
+import pytest
+
+from plan_store import PlanVersionConflictError, create_plan_store
+
+
+def test_save_rejects_edit_based_on_stale_version():
+    store = create_plan_store()
+    plan = store.save({"destination": "成都", "itinerary": []})
+    plan_id = plan["plan_id"]
+
+    # 另一个请求基于版本1保存了新的修改
+    newer = store.get(plan_id, 1)
+    newer["destination"] = "重庆"
+    assert store.save(newer, plan_id, expected_version=1)["plan_version"] == 2
+
+    stale = {"destination": "西安", "itinerary": [], "plan_version": 1}
+    with pytest.raises(PlanVersionConflictError):
+        store.save(stale, plan_id, expected_version=1)
+    assert store.get(plan_id)["destination"] == "重庆"
+
+
+def test_save_recreates_expired_plan_with_expected_version():
+    store = create_plan_store()
+    plan = store.save({"destination": "成都"}, "expired-plan", expected_version=3)
+    assert plan["plan_version"] == 1
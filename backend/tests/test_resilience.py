@@ -0,0 +1,31 @@
+import time
+
+from resilience import STATE_CLOSED, STATE_HALF_OPEN, CircuitBreaker
+
+
+def open_breaker(recovery_timeout=0.05):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=recovery_timeout)
+    breaker.record_failure()
+    time.sleep(recovery_timeout * 1.5)
+    return breaker
+
+
+def test_released_probe_allows_next_probe():
+    breaker = open_breaker()
+    assert breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_lost_probe_expires_after_recovery_timeout():
+    breaker = open_breaker()
+    assert breaker.allow()
+    # 试探请求既没有成功也没有失败的结果
+    assert not breaker.allow()
+    time.sleep(0.08)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow()
@@ -0,0 +1,66 @@
+import random
+import threading
+
+from route_optimizer import nearest_neighbor_order, path_cost, solve_open_tsp, two_opt
+
+
+def random_matrix(rng, size, asymmetry=None):
+    """asymmetry 为None时两个方向完全独立，否则在对称矩阵的基础上按方向随机浮动 ±asymmetry"""
+    base = [[rng.uniform(1, 100) for _ in range(size)] for _ in range(size)]
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            if i == j:
+                continue
+            if asymmetry is None:
+                matrix[i][j] = base[i][j]
+            else:
+                matrix[i][j] = base[min(i, j)][max(i, j)] * (1 + rng.uniform(-asymmetry, asymmetry))
+    return matrix
+
+
+def test_two_opt_never_worse_than_input_on_asymmetric_matrix():
+    rng = random.Random(7)
+    for _ in range(300):
+        matrix = random_matrix(rng, rng.randint(3, 10))
+        initial = nearest_neighbor_order(matrix, 0)
+        order = two_opt(initial, matrix)
+        assert sorted(order) == list(range(len(matrix)))
+        assert order[0] == 0
+        assert path_cost(order, matrix) <= path_cost(initial, matrix) + 1e-9
+
+
+def test_two_opt_symmetric_matrix_removes_crossing():
+    # 四个点在一条直线上，按 0,2,1,3 游览会来回折返
+    points = [0, 1, 2, 3]
+    matrix = [[abs(a - b) for b in points] for a in points]
+    assert two_opt([0, 2, 1, 3], matrix) == [0, 1, 2, 3]
+
+
+def test_solve_open_tsp_terminates_on_directional_durations():
+    # 高德地图距离测量API按方向返回交通时间（整数秒），两个方向可能相差很多
+    rng = random.Random(2024)
+    matrices = []
+    for asymmetry in (0.3, 0.6, None):
+        for _ in range(200):
+            matrix = random_matrix(rng, rng.randint(3, 12), asymmetry)
+            matrices.append([[int(value) for value in row] for row in matrix])
+
+    results = []
+
+    def solve_all():
+        for matrix in matrices:
+            for fix_start in (True, False):
+                order = solve_open_tsp(matrix, fix_start=fix_start)
+                results.append((matrix, order))
+
+    worker = threading.Thread(target=solve_all, daemon=True)
+    worker.start()
+    worker.join(timeout=60)
+    assert not worker.is_alive(), "solve_open_tsp 没有在限定时间内结束"
+    assert len(results) == len(matrices) * 2
+    for matrix, order in results:
+        assert sorted(order) == list(range(len(matrix)))
+        greedy = nearest_neighbor_order(matrix, 0)
+        if order[0] == 0:
+            assert path_cost(order, matrix) <= path_cost(greedy, matrix)
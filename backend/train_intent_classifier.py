@@ -0,0 +1,82 @@
+"""
+离线训练本地意图分类器
+
+服务运行时把大模型识别出的意图记录到 INTENT_LOG_PATH（默认 backend/intent_log.jsonl），
+用这些记录训练字符 n-gram 朴素贝叶斯模型，写入 INTENT_MODEL_PATH 后服务会自动重新加载，例如：
+
+    python train_intent_classifier.py intent_log.jsonl --output intent_model.json
+
+训练时按查询内容的哈希值留出一部分样本验证，报告准确率，以及在给定阈值下能直接返回结果的比例和准确率，
+便于选择 INTENT_CLASSIFIER_THRESHOLD。
+"""
+import argparse
+import hashlib
+import os
+import sys
+
+from intent_classifier import IntentClassifier, load_samples
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def is_holdout(query: str, fraction: float) -> bool:
+    """按查询内容的哈希值划分验证集，多次训练时划分结果保持一致"""
+    bucket = int(hashlib.md5(query.encode("utf-8")).hexdigest()[:8], 16) % 1000
+    return bucket < fraction * 1000
+
+
+def evaluate(model: IntentClassifier, samples: list, thresholds: list):
+    correct = sum(1 for query, has_plan, intent in samples if model.predict(query, has_plan)[0] == intent)
+    print(f"验证集 {len(samples)} 条，整体准确率 {correct / len(samples):.1%}")
+    for threshold in thresholds:
+        answered = answered_correct = 0
+        for query, has_plan, intent in samples:
+            predicted, confidence = model.predict(query, has_plan)
+            if confidence >= threshold:
+                answered += 1
+                answered_correct += predicted == intent
+        coverage = answered / len(samples)
+        accuracy = answered_correct / answered if answered else 0.0
+        print(f"  阈值 {threshold:.2f}: 直接返回 {coverage:.1%}，其中准确率 {accuracy:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用记录的查询和大模型意图训练本地意图分类器")
+    parser.add_argument("inputs", nargs="*", default=[os.path.join(BACKEND_DIR, "intent_log.jsonl")],
+                        help="训练样本文件（JSON Lines，每行包含 query、has_plan、intent、confidence）")
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "intent_model.json"), help="模型输出路径")
+    parser.add_argument("--min-confidence", type=float, default=0.6, help="忽略大模型置信度低于该值的样本")
+    parser.add_argument("--alpha", type=float, default=0.5, help="加法平滑系数")
+    parser.add_argument("--min-count", type=int, default=1, help="特征进入词表的最少出现次数")
+    parser.add_argument("--max-ngram", type=int, default=3, help="字符 n-gram 的最大长度")
+    parser.add_argument("--holdout", type=float, default=0.2, help="留作验证集的样本比例，为0时不验证")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.8, 0.9, 0.95, 0.99],
+                        help="报告直接返回比例和准确率时使用的置信度阈值")
+    args = parser.parse_args()
+
+    samples = load_samples(args.inputs, args.min_confidence)
+    if not samples:
+        print("没有可用的训练样本")
+        return 1
+    print(f"读取训练样本 {len(samples)} 条")
+
+    train_kwargs = {"ngram_range": (1, args.max_ngram), "alpha": args.alpha, "min_count": args.min_count}
+    if args.holdout > 0:
+        train_set = [s for s in samples if not is_holdout(s[0], args.holdout)]
+        holdout_set = [s for s in samples if is_holdout(s[0], args.holdout)]
+        if train_set and holdout_set:
+            evaluate(IntentClassifier.train(train_set, **train_kwargs), holdout_set, args.thresholds)
+
+    # 最终模型使用全部样本训练
+    try:
+        model = IntentClassifier.train(samples, **train_kwargs)
+    except ValueError as e:
+        print(f"训练失败: {e}")
+        return 1
+    model.save(args.output)
+    print(f"模型已保存到 {args.output}: {model.metadata}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())